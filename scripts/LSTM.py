@@ -5,9 +5,12 @@ import matplotlib
 matplotlib.use("TkAgg")
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.animation as animation
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
 from scipy.ndimage import median_filter
 
+from frame_viewer import FramePanel, BlitFrameViewer
+
 # -------------------------
 # Fake Data Generators
 # -------------------------
@@ -70,30 +73,24 @@ ax1 = fig1.add_subplot(131)
 ax2 = fig1.add_subplot(132)
 ax3 = fig1.add_subplot(133)
 
-im1 = ax1.imshow(ndvi_data[0], cmap="RdYlGn", vmin=-1, vmax=1)
+panels1 = [
+    FramePanel(ax1, ndvi_data, cmap="RdYlGn", vmin=-1, vmax=1),
+    FramePanel(ax2, pest_risk_probs, cmap="viridis", vmin=0, vmax=1),
+    FramePanel(ax3, pest_risk_binary, cmap="Reds", vmin=0, vmax=1, reduce="max"),
+]
 ax1.set_title("NDVI Input")
-
-im2 = ax2.imshow(pest_risk_probs[0], cmap="viridis", vmin=0, vmax=1)
 ax2.set_title("LSTM Risk Probability")
-
-im3 = ax3.imshow(pest_risk_binary[0], cmap="Reds", vmin=0, vmax=1)
 ax3.set_title("Binary Pest Risk")
 
-fig1.suptitle("NDVI → LSTM Prediction → Binary Pest Risk", fontsize=12)
+suptitle1 = fig1.suptitle("NDVI → LSTM Prediction → Binary Pest Risk", fontsize=12)
 
 canvas1 = FigureCanvasTkAgg(fig1, master=frame1)
-canvas1.draw()
 canvas1.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
-def update_lstm(frame):
-    im1.set_data(ndvi_data[frame])
-    im2.set_data(pest_risk_probs[frame])
-    im3.set_data(pest_risk_binary[frame])
-    fig1.suptitle(f"Time Step {frame+1}/{time_steps}", fontsize=12)
-    canvas1.draw()
-    return im1, im2, im3
-
-ani1 = animation.FuncAnimation(fig1, update_lstm, frames=time_steps, interval=1000, blit=False, repeat=True)
+# Only the three images and the suptitle are redrawn each frame
+viewer1 = BlitFrameViewer(canvas1, panels1, n_frames=time_steps, interval=1000, title=suptitle1,
+                          title_fn=lambda frame: f"Time Step {frame+1}/{time_steps}")
+viewer1.start()
 
 # -------------------------
 # TAB 2: Anomaly Animation
@@ -103,27 +100,19 @@ notebook.add(frame2, text="NDVI/EVI/NDWI → Anomaly → Mask")
 
 fig2 = Figure(figsize=(6, 5))
 ax4 = fig2.add_subplot(111)
-im4 = ax4.imshow(anomaly_steps[0][0], cmap="viridis")
+step_data = [data for data, _ in anomaly_steps]
+step_cmaps = ["gray" if np.max(data) <= 1 else "viridis" for data in step_data]
+panel4 = FramePanel(ax4, step_data, cmap=step_cmaps)
 title = ax4.set_title(anomaly_steps[0][1])
-fig2.colorbar(im4, ax=ax4, fraction=0.046, pad=0.04)
+fig2.colorbar(ScalarMappable(norm=Normalize(0, 1), cmap="viridis"), ax=ax4, fraction=0.046, pad=0.04,
+              label="Relative value")
 
 canvas2 = FigureCanvasTkAgg(fig2, master=frame2)
-canvas2.draw()
 canvas2.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
-def update_anomaly(i):
-    data, label = anomaly_steps[i]
-    im4.set_array(data)
-    if np.max(data) <= 1:
-        im4.set_cmap("gray")
-    else:
-        im4.set_cmap("viridis")
-    title.set_text(label)
-    canvas2.draw()
-    return [im4, title]
-
-ani2 = animation.FuncAnimation(fig2, update_anomaly, frames=len(anomaly_steps),
-                               interval=1500, blit=False, repeat=True)
+viewer2 = BlitFrameViewer(canvas2, [panel4], n_frames=len(anomaly_steps), interval=1500, title=title,
+                          title_fn=lambda i: anomaly_steps[i][1])
+viewer2.start()
 
 # -------------------------
 # Run Tkinter Loop
@@ -16,6 +16,7 @@ def calculate_pest_risk_percentage(risk_map_path):
 
 
 # Usage example
-risk_image_path = "/Volumes/SSD/Proj_Terra/PEST/PestPredictedMap.tiff"
-percent_risk = calculate_pest_risk_percentage(risk_image_path)
-print(f"Pest Risk Percentage: {percent_risk:.2f}%")
\ No newline at end of file
+if __name__ == "__main__":
+    risk_image_path = "/Volumes/SSD/Proj_Terra/PEST/PestPredictedMap.tiff"
+    percent_risk = calculate_pest_risk_percentage(risk_image_path)
+    print(f"Pest Risk Percentage: {percent_risk:.2f}%")
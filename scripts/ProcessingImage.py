@@ -3,6 +3,9 @@ import numpy as np
 import rasterio
 from tqdm import tqdm
 
+from raster_preview import add_overviews
+from tracing import traced, span, annotate
+
 def cloud_mask(image_data, blue_band=0, swir_band=7, blue_thresh=0.2, swir_thresh=0.3):
     """
     Simple cloud mask based on reflectance thresholds for Blue and SWIR1 bands.
@@ -49,14 +52,9 @@ def save_geotiff(data, out_path, profile, transform, crs):
     )
     with rasterio.open(out_path, 'w', **profile) as dst:
         dst.write(data.astype(rasterio.float32), 1)
+        add_overviews(dst, 'average')
 
-def process_file(file_path, output_base_folder):
-    with rasterio.open(file_path) as src:
-        image = src.read()  # Read all bands
-        profile = src.profile
-        transform = src.transform
-        crs = src.crs
-
+def mask_and_calculate_indices(image):
     cloud_mask_arr = cloud_mask(image)
 
     # Mask cloud pixels (set to nan) in all bands
@@ -66,15 +64,28 @@ def process_file(file_path, output_base_folder):
         band[cloud_mask_arr] = np.nan
         masked_img[b] = band
 
-    ndvi, evi, ndwi = calculate_indices(masked_img)
+    return calculate_indices(masked_img)
 
+@traced('indices')
+def process_file(file_path, output_base_folder):
     base_name = os.path.splitext(os.path.basename(file_path))[0]
+    with span('indices.read', cat='io'), rasterio.open(file_path) as src:
+        image = src.read()  # Read all bands
+        profile = src.profile
+        transform = src.transform
+        crs = src.crs
+    annotate(date=base_name, pixels=image.shape[1] * image.shape[2])
+
+    with span('indices.compute'):
+        ndvi, evi, ndwi = mask_and_calculate_indices(image)
+
     output_folder = os.path.join(output_base_folder, base_name)
     os.makedirs(output_folder, exist_ok=True)
 
-    save_geotiff(ndvi, os.path.join(output_folder, f"{base_name}_NDVI.tif"), profile, transform, crs)
-    save_geotiff(evi, os.path.join(output_folder, f"{base_name}_EVI.tif"), profile, transform, crs)
-    save_geotiff(ndwi, os.path.join(output_folder, f"{base_name}_NDWI.tif"), profile, transform, crs)
+    with span('indices.write', cat='io'):
+        save_geotiff(ndvi, os.path.join(output_folder, f"{base_name}_NDVI.tif"), profile, transform, crs)
+        save_geotiff(evi, os.path.join(output_folder, f"{base_name}_EVI.tif"), profile, transform, crs)
+        save_geotiff(ndwi, os.path.join(output_folder, f"{base_name}_NDWI.tif"), profile, transform, crs)
 
     print(f"Processed and saved indices for {base_name}")
 
@@ -0,0 +1,309 @@
+import os
+import re
+import sys
+import json
+import glob
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from pipeline_runner import SCRIPT_DIR, stage_paths, load_cache, save_cache, run_date_chain, run_timeseries
+
+
+# ------------------- AOI DEFINITIONS -------------------
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') or 'aoi'
+
+
+def parse_requests_builder(entry):
+    """AOI from a Sentinel Hub Requests Builder collection export (like data/Tanjavur.json)."""
+    request = json.loads(entry['requests'][0]['request'])
+    data = request['input']['data'][0]
+    time_range = data.get('dataFilter', {}).get('timeRange', {})
+    return {
+        'name': slugify(entry['collectionName']),
+        'bbox': request['input']['bounds']['bbox'],
+        'crs': request['input']['bounds'].get('properties', {}).get('crs', 'EPSG:4326').replace(
+            'http://www.opengis.net/def/crs/OGC/1.3/CRS84', 'EPSG:4326'),
+        'size': [round(request['output']['width']), round(request['output']['height'])],
+        'time_range': [time_range.get('from', '2023-01-01')[:10], time_range.get('to', '2025-09-05')[:10]],
+        'max_cloud_coverage': data.get('dataFilter', {}).get('maxCloudCoverage'),
+    }
+
+
+def load_aoi_file(path):
+    """
+    AOIs in one JSON file: a Requests Builder export (list of collections),
+    or plain {"name", "bbox", "size", "time_range", ...} objects (one or a list).
+    """
+    with open(path) as f:
+        content = json.load(f)
+    entries = content if isinstance(content, list) else [content]
+    aois = []
+    for entry in entries:
+        if 'requests' in entry:
+            aoi = parse_requests_builder(entry)
+        else:
+            aoi = {'crs': 'EPSG:4326', 'max_cloud_coverage': None, **entry, 'name': slugify(entry['name'])}
+        aoi['source'] = path
+        aois.append(aoi)
+    return aois
+
+
+def load_aois(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(f for f in glob.glob(os.path.join(path, '*.json'))
+                            if not os.path.basename(f).startswith('._'))
+        else:
+            files.append(path)
+    aois = [aoi for f in files for aoi in load_aoi_file(f)]
+    names = [aoi['name'] for aoi in aois]
+    duplicates = {n for n in names if names.count(n) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate AOI names: {sorted(duplicates)}")
+    return aois
+
+
+# ------------------- SCHEDULING -------------------
+class TokenBucket:
+    """Global request rate limit shared by all download threads."""
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_s = (1 - self.tokens) / self.rate
+            time.sleep(wait_s)
+
+
+class FairQueue:
+    """
+    Per-AOI FIFO queues served round-robin, so a region with hundreds of
+    dates cannot starve one with a handful. `max_per_aoi` optionally caps
+    how many of one AOI's tasks run at once.
+    """
+    def __init__(self, max_per_aoi=None):
+        self.queues = {}
+        self.order = []
+        self.cursor = 0
+        self.running = {}
+        self.max_per_aoi = max_per_aoi
+
+    def push(self, aoi, task):
+        if aoi not in self.queues:
+            self.queues[aoi] = deque()
+            self.order.append(aoi)
+            self.running[aoi] = 0
+        self.queues[aoi].append(task)
+
+    def pop(self):
+        """Next (aoi, task) in round-robin order, or None if nothing is eligible."""
+        for i in range(len(self.order)):
+            aoi = self.order[(self.cursor + i) % len(self.order)]
+            if self.queues[aoi] and (self.max_per_aoi is None or self.running[aoi] < self.max_per_aoi):
+                self.cursor = (self.cursor + i + 1) % len(self.order)
+                self.running[aoi] += 1
+                return aoi, self.queues[aoi].popleft()
+        return None
+
+    def done(self, aoi):
+        self.running[aoi] -= 1
+
+    def pending(self, aoi=None):
+        if aoi is not None:
+            return len(self.queues.get(aoi, ())) + self.running.get(aoi, 0)
+        return sum(len(q) for q in self.queues.values()) + sum(self.running.values())
+
+
+# ------------------- TASKS -------------------
+def _search(aoi, bucket, config_holder):
+    from downloading_dataset import search_acquisitions, make_config
+    bucket.acquire()
+    if 'config' not in config_holder:
+        config_holder['config'] = make_config()
+    return search_acquisitions(aoi['bbox'], tuple(aoi['time_range']), config_holder['config'],
+                               aoi.get('max_cloud_coverage'))
+
+
+def _download(aoi, date_str, filename, bucket, config_holder):
+    from downloading_dataset import download_date, make_config
+    if 'config' not in config_holder:
+        config_holder['config'] = make_config()
+    # Large AOIs are split into several requests, each of which takes a token
+    return download_date(date_str, filename, aoi['bbox'], tuple(aoi['size']), config_holder['config'], max_attempts=3,
+                         throttle=bucket.acquire)
+
+
+def run_aoi_timeseries(work_dir, params, nodes, file_cache):
+    """Worker entry point: per-pixel CSV and vectors for one AOI."""
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    return run_timeseries(stage_paths(work_dir), params, nodes, file_cache), file_cache
+
+
+def raw_files(raw_dir):
+    if not os.path.isdir(raw_dir):
+        return []
+    return sorted(os.path.join(raw_dir, f) for f in os.listdir(raw_dir)
+                  if (f.endswith('.tif') or f.endswith('.tiff')) and not f.startswith('._'))
+
+
+# ------------------- BATCH -------------------
+def run_batch(aois, work_root, workers=4, max_per_aoi=None, download=False, requests_per_minute=30,
+              download_threads=4, fused=False):
+    """
+    Run the per-date chain and the time series stage for every AOI over one
+    bounded process pool. Each AOI gets its own namespace under work_root
+    (raw/, stage folders and its own pipeline cache). Downloads share one
+    thread pool and one global rate limit.
+    """
+    state = {}
+    for aoi in aois:
+        ns = os.path.join(work_root, aoi['name'])
+        os.makedirs(os.path.join(ns, 'raw'), exist_ok=True)
+        state[aoi['name']] = {
+            'aoi': aoi, 'work_dir': ns, 'raw_dir': os.path.join(ns, 'raw'), 'cache': load_cache(ns),
+            'params': {'bbox': aoi['bbox'], 'size': aoi['size'], 'crs': aoi['crs'], 'fused': fused},
+            'searching': download, 'timeseries_done': False,
+            'stats': {'downloaded': 0, 'processed': 0, 'failed': 0, 'start': time.time(), 'end': None},
+        }
+
+    compute = FairQueue(max_per_aoi)
+    downloads = FairQueue()
+    bucket = TokenBucket(requests_per_minute, burst=download_threads)
+    config_holder = {}
+    in_flight = {}
+
+    def queue_dates(name, paths):
+        for path in paths:
+            compute.push(name, ('date', path))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=download_threads) as io_pool:
+        for name, st in state.items():
+            if download:
+                in_flight[io_pool.submit(_search, st['aoi'], bucket, config_holder)] = (name, 'search', None, None)
+            queue_dates(name, raw_files(st['raw_dir']))
+
+        while True:
+            # Once an AOI has nothing left before it, queue its time series stage
+            for name, st in state.items():
+                if (not st['searching'] and not st['timeseries_done'] and compute.pending(name) == 0
+                        and downloads.pending(name) == 0):
+                    st['timeseries_done'] = True
+                    compute.push(name, ('timeseries', None))
+
+            # Fill free slots fairly across AOIs
+            while sum(1 for v in in_flight.values() if v[1] in ('date', 'timeseries')) < workers:
+                item = compute.pop()
+                if item is None:
+                    break
+                name, (kind, arg) = item
+                st = state[name]
+                if kind == 'date':
+                    fut = pool.submit(run_date_chain, arg, st['work_dir'], st['params'],
+                                      st['cache']['nodes'], st['cache']['files'])
+                else:
+                    fut = pool.submit(run_aoi_timeseries, st['work_dir'], st['params'],
+                                      st['cache']['nodes'], st['cache']['files'])
+                in_flight[fut] = (name, kind, arg, compute)
+            while sum(1 for v in in_flight.values() if v[1] == 'download') < download_threads:
+                item = downloads.pop()
+                if item is None:
+                    break
+                name, (date_str, filename) = item
+                fut = io_pool.submit(_download, state[name]['aoi'], date_str, filename, bucket, config_holder)
+                in_flight[fut] = (name, 'download', filename, downloads)
+
+            if not in_flight:
+                break
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name, kind, arg, queue = in_flight.pop(fut)
+                st = state[name]
+                if queue is not None:
+                    queue.done(name)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    print(f"[ERROR] {name} {kind} {os.path.basename(arg) if arg else ''}: {e}")
+                    st['stats']['failed'] += 1
+                    if kind == 'search':
+                        st['searching'] = False
+                    continue
+                if kind == 'search':
+                    st['searching'] = False
+                    new = 0
+                    for date_str in result:
+                        filename = os.path.join(st['raw_dir'], f"{name}_{date_str}.tiff")
+                        if not os.path.exists(filename):
+                            downloads.push(name, (date_str, filename))
+                            new += 1
+                    print(f"[INFO] {name}: {len(result)} acquisitions, {new} to download")
+                elif kind == 'download':
+                    st['stats']['downloaded'] += 1
+                    queue_dates(name, [result])
+                elif kind == 'date':
+                    updates, file_cache = result
+                    st['cache']['nodes'].update(updates)
+                    st['cache']['files'].update(file_cache)
+                    save_cache(st['work_dir'], st['cache'])
+                    st['stats']['processed'] += 1
+                elif kind == 'timeseries':
+                    h, file_cache = result
+                    if h:
+                        st['cache']['nodes']['timeseries:all'] = h
+                    st['cache']['files'].update(file_cache)
+                    save_cache(st['work_dir'], st['cache'])
+                    st['stats']['end'] = time.time()
+                    print(f"[INFO] {name}: done ({st['stats']['processed']} dates)")
+
+    print_summary(state)
+    return state
+
+
+def print_summary(state):
+    print(f"{'aoi':<24} {'downloaded':>10} {'processed':>9} {'failed':>6} {'wall s':>8}")
+    for name, st in state.items():
+        s = st['stats']
+        wall = (s['end'] or time.time()) - s['start']
+        print(f"{name:<24} {s['downloaded']:>10} {s['processed']:>9} {s['failed']:>6} {wall:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pest risk pipeline for many AOIs over one shared worker pool")
+    parser.add_argument('--aois', nargs='+', default=['../data'], help='AOI JSON files or folders of them')
+    parser.add_argument('--work_root', type=str, default='aoi_outputs', help='One sub-folder per AOI')
+    parser.add_argument('--workers', type=int, default=4, help='Shared processing workers')
+    parser.add_argument('--max_per_aoi', type=int, default=None, help='Cap on concurrent tasks of one AOI')
+    parser.add_argument('--download', action='store_true', help='Search and download new acquisitions first')
+    parser.add_argument('--requests_per_minute', type=float, default=30, help='Global Sentinel Hub request budget')
+    parser.add_argument('--download_threads', type=int, default=4)
+    parser.add_argument('--fused', action='store_true', help='Run each date in memory with scene_pipeline')
+    parser.add_argument('--only', nargs='+', default=None, help='Subset of AOI names')
+    args = parser.parse_args()
+
+    aois = load_aois(args.aois)
+    if args.only:
+        aois = [a for a in aois if a['name'] in args.only]
+    print(f"[INFO] {len(aois)} AOIs: {', '.join(a['name'] for a in aois)}")
+    run_batch(aois, args.work_root, args.workers, args.max_per_aoi, args.download, args.requests_per_minute,
+              args.download_threads, args.fused)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+# Band order written by downloading_dataset.py's evalscript
+RAW_BAND_NAMES = ["B02", "B03", "B04", "B05", "B06", "B07", "B08", "B11", "B12"]
+
+GDAL_TYPE_NAMES = {
+    'uint8': 'Byte', 'uint16': 'UInt16', 'int16': 'Int16', 'uint32': 'UInt32',
+    'int32': 'Int32', 'float32': 'Float32', 'float64': 'Float64',
+}
+
+
+def stack_sources(raw_path, index_paths):
+    """
+    List (path, band, description) for raw bands followed by single-band index files.
+    index_paths: dict like {'NDVI': path, 'NDWI': path}, in the desired order.
+    """
+    with rasterio.open(raw_path) as src:
+        count = src.count
+    names = RAW_BAND_NAMES if count == len(RAW_BAND_NAMES) else [f"band_{i + 1}" for i in range(count)]
+    sources = [(raw_path, i + 1, names[i]) for i in range(count)]
+    sources += [(path, 1, name) for name, path in index_paths.items()]
+    return sources
+
+
+def build_stack_vrt(sources, out_path):
+    """
+    Write a GDAL VRT that presents every (path, band) source as one band of a
+    single dataset. No pixel data is copied; readers open the sources lazily.
+    All sources must share the grid of the first one.
+    """
+    with rasterio.open(sources[0][0]) as ref:
+        width, height = ref.width, ref.height
+        crs = ref.crs
+        t = ref.transform
+
+    root = ET.Element('VRTDataset', rasterXSize=str(width), rasterYSize=str(height))
+    if crs is not None:
+        ET.SubElement(root, 'SRS').text = crs.to_wkt()
+    ET.SubElement(root, 'GeoTransform').text = ', '.join(repr(v) for v in (t.c, t.a, t.b, t.f, t.d, t.e))
+
+    for band_idx, (path, src_band, description) in enumerate(sources, start=1):
+        with rasterio.open(path) as src:
+            if (src.width, src.height) != (width, height):
+                raise ValueError(f"{path} is {src.width}x{src.height}, expected {width}x{height}")
+            dtype = src.dtypes[src_band - 1]
+            nodata = src.nodata
+            block_h, block_w = src.block_shapes[src_band - 1]
+        band = ET.SubElement(root, 'VRTRasterBand', dataType=GDAL_TYPE_NAMES[dtype], band=str(band_idx))
+        ET.SubElement(band, 'Description').text = description
+        if nodata is not None:
+            ET.SubElement(band, 'NoDataValue').text = 'nan' if np.isnan(nodata) else repr(nodata)
+        source = ET.SubElement(band, 'SimpleSource')
+        ET.SubElement(source, 'SourceFilename', relativeToVRT='0').text = os.path.abspath(path)
+        ET.SubElement(source, 'SourceBand').text = str(src_band)
+        ET.SubElement(source, 'SourceProperties', RasterXSize=str(width), RasterYSize=str(height),
+                      DataType=GDAL_TYPE_NAMES[dtype], BlockXSize=str(block_w), BlockYSize=str(block_h))
+        rect = {'xOff': '0', 'yOff': '0', 'xSize': str(width), 'ySize': str(height)}
+        ET.SubElement(source, 'SrcRect', **rect)
+        ET.SubElement(source, 'DstRect', **rect)
+
+    ET.ElementTree(root).write(out_path)
+    return out_path
+
+
+class LazyBandStack:
+    """
+    In-process equivalent of the stacked VRT: a multi-band view over
+    (path, band) sources that reads each band from its own file on demand.
+
+    Usage:
+        with LazyBandStack(sources) as stack:
+            block = stack.read([1, 10], window=Window(0, 0, 256, 256))
+    """
+    def __init__(self, sources):
+        self.sources = sources
+        self.descriptions = [s[2] for s in sources]
+        self._handles = {}
+        ref = self._open(sources[0][0])
+        self.width, self.height = ref.width, ref.height
+        self.transform = ref.transform
+        self.crs = ref.crs
+        self.count = len(sources)
+
+    def _open(self, path):
+        if path not in self._handles:
+            self._handles[path] = rasterio.open(path)
+        return self._handles[path]
+
+    @property
+    def profile(self):
+        return {'driver': 'GTiff', 'width': self.width, 'height': self.height, 'count': self.count,
+                'dtype': 'float32', 'crs': self.crs, 'transform': self.transform}
+
+    def read(self, indexes=None, window=None, out_dtype=np.float32):
+        """Read 1-based band indexes (all by default) for a window, like DatasetReader.read."""
+        single = isinstance(indexes, int)
+        if indexes is None:
+            indexes = range(1, self.count + 1)
+        elif single:
+            indexes = [indexes]
+        bands = []
+        for i in indexes:
+            path, src_band, _ = self.sources[i - 1]
+            bands.append(self._open(path).read(src_band, window=window).astype(out_dtype, copy=False))
+        return bands[0] if single else np.stack(bands)
+
+    def block_windows(self, block_size=512):
+        for row in range(0, self.height, block_size):
+            for col in range(0, self.width, block_size):
+                yield Window(col, row, min(block_size, self.width - col), min(block_size, self.height - row))
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,375 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import importlib
+import platform
+import tempfile
+import multiprocessing as mp
+from datetime import date, timedelta
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+from scipy.ndimage import gaussian_filter
+
+# Sentinel-2 L2A bands in the order downloading_dataset.py requests them (already x2.5 scaled there)
+BANDS = ['B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B11', 'B12']
+# Typical reflectances (vegetation, cloud) per band
+VEGETATION = np.array([0.04, 0.08, 0.05, 0.12, 0.28, 0.33, 0.38, 0.20, 0.10], dtype=np.float32)
+STRESSED = np.array([0.06, 0.09, 0.10, 0.14, 0.18, 0.20, 0.22, 0.26, 0.16], dtype=np.float32)
+CLOUD = np.array([0.60, 0.58, 0.57, 0.58, 0.60, 0.60, 0.62, 0.45, 0.35], dtype=np.float32)
+DEFAULT_BBOX = [79, 10.57, 79.047, 10.617]
+
+
+# ------------------- SYNTHETIC SCENES -------------------
+def smooth_field(rng, shape, sigma):
+    """Zero-mean, unit-variance spatially correlated noise."""
+    field = gaussian_filter(rng.standard_normal(shape).astype(np.float32), sigma)
+    return (field - field.mean()) / (field.std() + 1e-6)
+
+
+def synthetic_scene(height, width, seed, cloud_fraction=0.1, hotspot_density=2e-5, t=0.0):
+    """
+    Deterministic Sentinel-2-like 9-band reflectance stack (float32, bands first).
+    Fields vary smoothly in vigour, stress hotspots grow with t in [0, 1],
+    and clouds are smooth blobs covering roughly cloud_fraction of the scene.
+    """
+    rng = np.random.default_rng(seed)
+    # Hotspot centres are fixed per generator seed so they persist across dates
+    hot_rng = np.random.default_rng(seed // 1000)
+    vigour = 0.85 + 0.15 * np.clip(smooth_field(rng, (height, width), max(height, width) / 40), -2, 2) / 2
+    image = VEGETATION[:, None, None] * vigour[None]
+
+    n_hot = max(1, int(hotspot_density * height * width))
+    rows, cols = hot_rng.integers(0, height, n_hot), hot_rng.integers(0, width, n_hot)
+    radius = hot_rng.uniform(3, 12, n_hot) * (0.5 + t)
+    stress = np.zeros((height, width), dtype=np.float32)
+    yy, xx = np.ogrid[:height, :width]
+    for r, c, rad in zip(rows, cols, radius):
+        r0, r1, c0, c1 = max(r - 3 * int(rad), 0), r + 3 * int(rad) + 1, max(c - 3 * int(rad), 0), c + 3 * int(rad) + 1
+        d2 = (yy[r0:r1] - r) ** 2 + (xx[:, c0:c1] - c) ** 2
+        stress[r0:r1, c0:c1] = np.maximum(stress[r0:r1, c0:c1], np.exp(-d2 / (2 * rad ** 2)))
+    image = image * (1 - stress[None]) + STRESSED[:, None, None] * stress[None]
+
+    if cloud_fraction > 0:
+        clouds = smooth_field(rng, (height, width), max(height, width) / 25)
+        cut = np.quantile(clouds, 1 - cloud_fraction)
+        opacity = np.clip((clouds - cut) * 4, 0, 1)
+        image = image * (1 - opacity[None]) + CLOUD[:, None, None] * opacity[None]
+
+    image += rng.normal(0, 0.005, image.shape).astype(np.float32)
+    return np.clip(image, 0.001, 1).astype(np.float32)
+
+
+def generate_dataset(out_dir, n_dates=6, size=512, cloud_fraction=0.1, hotspot_density=2e-5, seed=0,
+                     bbox=DEFAULT_BBOX, start=date(2024, 1, 5), step_days=5):
+    """Write tanjavur_<date>.tiff scenes like downloading_dataset.py does. Returns the file paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    transform = from_bounds(*bbox, size, size)
+    paths = []
+    for i in range(n_dates):
+        day = start + timedelta(days=i * step_days)
+        path = os.path.join(out_dir, f"tanjavur_{day.isoformat()}.tiff")
+        image = synthetic_scene(size, size, seed * 1000 + i, cloud_fraction, hotspot_density, i / max(n_dates - 1, 1))
+        with rasterio.open(path, 'w', driver='GTiff', height=size, width=size, count=len(BANDS),
+                           dtype='float32', crs='EPSG:4326', transform=transform) as dst:
+            dst.write(image)
+        paths.append(path)
+    return paths
+
+
+# ------------------- MEASUREMENT -------------------
+def read_io_counters():
+    """Bytes read/written through syscalls so far (Linux /proc; None elsewhere)."""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError):
+        return None
+
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def peak_rss():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _child(stage, work_dir, conn):
+    try:
+        # Imports happen before the counters start: geopandas or TensorFlow would otherwise dominate
+        for name in stage.get('modules', ()):
+            importlib.import_module(name)
+        state = stage['setup'](work_dir) if stage.get('setup') else None
+        rss0, io0 = current_rss(), read_io_counters()
+        start = time.perf_counter()
+        stage['run'](work_dir, state)
+        wall = time.perf_counter() - start
+        io1 = read_io_counters()
+        result = {'wall_s': wall, 'peak_rss_mb': peak_rss() / 2 ** 20,
+                  'rss_delta_mb': (peak_rss() - rss0) / 2 ** 20 if rss0 is not None else None,
+                  'bytes_read': io1[0] - io0[0] if io0 else None,
+                  'bytes_written': io1[1] - io0[1] if io0 else None}
+        conn.send(result)
+    except ModuleNotFoundError as e:
+        # Only a missing optional dependency skips a stage; anything else is a failure
+        missing = (e.name or '').split('.')[0]
+        if missing in stage.get('optional', ()):
+            conn.send({'skipped': f"{missing} is not installed"})
+        else:
+            conn.send({'error': f"{type(e).__name__}: {e}"})
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def measure(stage, work_dir):
+    """
+    Run one stage in a forked child so peak RSS and I/O counters belong to
+    that stage alone. Module imports and setup (loading inputs) are not timed.
+    """
+    ctx = mp.get_context('fork')
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(stage, work_dir, child))
+    proc.start()
+    child.close()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+# ------------------- STAGES -------------------
+def _raw_files(work_dir):
+    return sorted(glob.glob(os.path.join(work_dir, 'raw', '*.tiff')))
+
+
+def run_cloud_mask(work_dir, _):
+    from cloud_masking import mask_file
+    out = os.path.join(work_dir, 'cloud_masked')
+    os.makedirs(out, exist_ok=True)
+    for path in _raw_files(work_dir):
+        mask_file(path, os.path.join(out, os.path.basename(path)))
+
+
+def run_indices(work_dir, _):
+    from ProcessingImage import process_file
+    for path in _raw_files(work_dir):
+        process_file(path, os.path.join(work_dir, 'indices'))
+
+
+def setup_normalized(work_dir):
+    """8-bit index GeoTIFFs per date, the input mask_Anomaly sees after normalize.py."""
+    from normalize import normalize_index_array
+    for folder in sorted(glob.glob(os.path.join(work_dir, 'indices', 'tanjavur_*'))):
+        out_folder = os.path.join(work_dir, 'normalized', os.path.basename(folder))
+        os.makedirs(out_folder, exist_ok=True)
+        for path in glob.glob(os.path.join(folder, '*.tif')):
+            out_path = os.path.join(out_folder, os.path.basename(path))
+            if os.path.exists(out_path):
+                continue
+            with rasterio.open(path) as src:
+                data = normalize_index_array(src.read(1))
+                profile = src.profile
+            profile.update(dtype='uint8', nodata=None)
+            with rasterio.open(out_path, 'w', **profile) as dst:
+                dst.write(data, 1)
+
+
+def run_anomaly(work_dir, _):
+    from mask_Anomaly import process_and_save_for_date
+    for folder in sorted(glob.glob(os.path.join(work_dir, 'normalized', 'tanjavur_*'))):
+        process_and_save_for_date(folder, os.path.join(work_dir, 'masks'))
+
+
+def run_load_masks(work_dir, _):
+    from generate_Timeseries import load_masks
+    load_masks(os.path.join(work_dir, 'masks', 'PestRefinedData'))
+
+
+def setup_masks(work_dir):
+    from generate_Timeseries import load_masks
+    masks_stack, dates, _ = load_masks(os.path.join(work_dir, 'masks', 'PestRefinedData'))
+    return masks_stack, dates
+
+
+def run_extract_pixel_timeseries(work_dir, state):
+    from generate_Timeseries import extract_pixel_timeseries
+    masks_stack, dates = state
+    extract_pixel_timeseries(masks_stack, dates, os.path.join(work_dir, 'pixel_timeseries.csv'))
+
+
+def setup_pixels(work_dir):
+    import pandas as pd
+    return pd.read_csv(os.path.join(work_dir, 'pixel_timeseries.csv')).drop(columns=['pixel_id']).values
+
+
+def _create_sequences():
+    try:
+        from pest_Risk_LSTM import create_sequences
+    except ModuleNotFoundError as e:
+        if (e.name or '').split('.')[0] != 'tensorflow':
+            raise
+        # Same windowing without the TensorFlow import
+        from evalute_model import create_sequences
+    return create_sequences
+
+
+def setup_sequences(work_dir):
+    return setup_pixels(work_dir), _create_sequences()
+
+
+def run_create_sequences(work_dir, state):
+    data, create_sequences = state
+    seq_length = min(3, data.shape[1] - 1)
+    create_sequences(data, seq_length, 1)
+
+
+def setup_inference(work_dir):
+    from pest_Risk_LSTM import build_lstm_model
+    data = setup_pixels(work_dir)
+    seq_length = min(3, data.shape[1])
+    return build_lstm_model(seq_length), data[:, -seq_length:].reshape(-1, seq_length, 1).astype(np.float32)
+
+
+def run_inference(work_dir, state):
+    model, X = state
+    model.predict(X, batch_size=4096, verbose=0)
+
+
+# 'modules' are imported before measuring; a stage whose 'optional' dependency is missing is skipped
+STAGES = [
+    {'name': 'cloud_mask', 'modules': ['cloud_masking'], 'run': run_cloud_mask},
+    {'name': 'calculate_indices', 'modules': ['ProcessingImage'], 'run': run_indices},
+    {'name': 'anomaly', 'modules': ['mask_Anomaly'], 'setup': setup_normalized, 'run': run_anomaly},
+    {'name': 'load_masks', 'modules': ['generate_Timeseries'], 'run': run_load_masks},
+    {'name': 'extract_pixel_timeseries', 'modules': ['generate_Timeseries'], 'setup': setup_masks,
+     'run': run_extract_pixel_timeseries},
+    {'name': 'create_sequences', 'setup': setup_sequences, 'run': run_create_sequences},
+    {'name': 'inference', 'modules': ['pest_Risk_LSTM'], 'optional': ['tensorflow'], 'setup': setup_inference,
+     'run': run_inference},
+]
+
+
+# ------------------- BASELINE -------------------
+def run_suite(config, repeat=3, stages=None):
+    work_dir = tempfile.mkdtemp(prefix='terra_bench_')
+    try:
+        print(f"[INFO] Generating {config['dates']} synthetic {config['size']}x{config['size']} scenes in {work_dir}")
+        generate_dataset(os.path.join(work_dir, 'raw'), config['dates'], config['size'],
+                         config['cloud_fraction'], config['hotspot_density'], config['seed'])
+        results, failed = {}, []
+        for stage in STAGES:
+            if stages and stage['name'] not in stages:
+                continue
+            runs = [measure(stage, work_dir) for _ in range(repeat)]
+            skipped = [r['skipped'] for r in runs if 'skipped' in r]
+            if skipped:
+                print(f"[INFO] {stage['name']} skipped: {skipped[0]}")
+                continue
+            errors = [r['error'] for r in runs if 'error' in r]
+            if errors:
+                print(f"[ERROR] {stage['name']} failed: {errors[0]}")
+                failed.append(stage['name'])
+                continue
+            # Best wall time, worst memory and I/O across repeats
+            results[stage['name']] = {
+                'wall_s': min(r['wall_s'] for r in runs),
+                'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+                'rss_delta_mb': max((r['rss_delta_mb'] or 0) for r in runs),
+                'bytes_read': max((r['bytes_read'] or 0) for r in runs),
+                'bytes_written': max((r['bytes_written'] or 0) for r in runs),
+            }
+        return results, failed
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance, min_wall_s=0.2):
+    """Return regression messages for metrics that grew more than `tolerance` over the baseline."""
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ['wall_s', 'rss_delta_mb', 'bytes_read', 'bytes_written']:
+            old, new = base.get(metric), cur.get(metric)
+            if not old or new is None:
+                continue
+            # Very short stages are dominated by timer noise
+            if metric == 'wall_s' and max(old, new) < min_wall_s:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {old:.4g} -> {new:.4g} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'stage':<26} {'wall s':>8} {'base s':>8} {'RSS MB':>8} {'+RSS MB':>8} {'read MB':>9} {'write MB':>9}")
+    for name, r in results.items():
+        base = baseline.get(name, {}).get('wall_s') if baseline else None
+        print(f"{name:<26} {r['wall_s']:>8.3f} {base if base is not None else float('nan'):>8.3f} "
+              f"{r['peak_rss_mb']:>8.1f} {r['rss_delta_mb']:>8.1f} "
+              f"{r['bytes_read'] / 2 ** 20:>9.1f} {r['bytes_written'] / 2 ** 20:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on deterministic synthetic scenes")
+    parser.add_argument('--size', type=int, default=512, help='Scene width and height in pixels')
+    parser.add_argument('--dates', type=int, default=6)
+    parser.add_argument('--cloud_fraction', type=float, default=0.1)
+    parser.add_argument('--hotspot_density', type=float, default=2e-5, help='Stress hotspots per pixel')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', default=None, help=f"Subset of: {', '.join(s['name'] for s in STAGES)}")
+    parser.add_argument('--baseline', type=str, default='benchmark_baseline.json')
+    parser.add_argument('--update', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative growth before flagging')
+    parser.add_argument('--min_wall_s', type=float, default=0.2, help='Ignore wall-time changes of stages faster than this')
+    args = parser.parse_args()
+
+    config = {'size': args.size, 'dates': args.dates, 'cloud_fraction': args.cloud_fraction,
+              'hotspot_density': args.hotspot_density, 'seed': args.seed}
+    results, failed = run_suite(config, args.repeat, args.stages)
+    if failed:
+        print_results(results)
+        print(f"[ERROR] {len(failed)} stage(s) failed, baseline not compared or updated: {', '.join(failed)}")
+        sys.exit(1)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved.get('config') == config:
+            baseline = saved['stages']
+        else:
+            print(f"[WARN] {args.baseline} was recorded with a different config, not comparing")
+    print_results(results, baseline)
+
+    if args.update or baseline is None:
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'machine': platform.platform(), 'python': platform.python_version(),
+                       'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': results}, f, indent=2)
+        print(f"[INFO] Baseline saved to {args.baseline}")
+        return
+    regressions = compare(results, baseline, args.tolerance, args.min_wall_s)
+    for message in regressions:
+        print(f"[WARN] Regression: {message}")
+    if regressions:
+        sys.exit(1)
+    print("[INFO] No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
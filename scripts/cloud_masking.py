@@ -3,6 +3,8 @@ import numpy as np
 import rasterio
 from tqdm import tqdm
 
+from tracing import traced, annotate
+
 def cloud_mask(image_data, blue_band, swir_band=None, blue_thresh=0.3, swir_thresh=0.3):
     """
     Cloud mask based on thresholding blue (and optionally SWIR) band.
@@ -16,39 +18,47 @@ def cloud_mask(image_data, blue_band, swir_band=None, blue_thresh=0.3, swir_thre
         cloud_pixels = blue > blue_thresh
     return cloud_pixels
 
-raw_folder = '/Volumes/SSD/Proj_Terra/data/raw'
-output_folder = '/Volumes/SSD/Proj_Terra/data/cloud_masked'
-os.makedirs(output_folder, exist_ok=True)
+@traced('cloud_mask')
+def mask_file(file_path, output_path):
+    with rasterio.open(file_path) as src:
+        image = src.read()  # Read all bands
+        profile = src.profile
+        annotate(file=os.path.basename(file_path), pixels=src.width * src.height)
+
+        # Determine band indices: blue usually band 2 in RGB, 0-based indexing
+        # Adjust swir_band if more bands exist; else None
+        blue_band = 2 if image.shape[0] >= 3 else 0
+        swir_band = 4 if image.shape[0] > 4 else None
+
+        cloud_mask_arr = cloud_mask(image, blue_band, swir_band)
 
-files = [f for f in os.listdir(raw_folder) if (f.endswith('.tiff') or f.endswith('.tif')) and not f.startswith('._')]
+        masked_image = image.copy()
+        nodata_val = profile.get('nodata', 0) or 0
+        for b in range(masked_image.shape[0]):
+            band = masked_image[b]
+            band[cloud_mask_arr] = nodata_val
+            masked_image[b] = band
 
-for file in tqdm(files, desc='Cloud masking images'):
-    file_path = os.path.join(raw_folder, file)
-    try:
-        with rasterio.open(file_path) as src:
-            image = src.read()  # Read all bands
-            profile = src.profile
+        profile.update(dtype=rasterio.float32)
 
-            # Determine band indices: blue usually band 2 in RGB, 0-based indexing
-            # Adjust swir_band if more bands exist; else None
-            blue_band = 2 if image.shape[0] >= 3 else 0
-            swir_band = 4 if image.shape[0] > 4 else None
+        with rasterio.open(output_path, 'w', **profile) as dst:
+            dst.write(masked_image.astype(rasterio.float32))
 
-            cloud_mask_arr = cloud_mask(image, blue_band, swir_band)
+def main(raw_folder, output_folder):
+    os.makedirs(output_folder, exist_ok=True)
 
-            masked_image = image.copy()
-            nodata_val = profile.get('nodata', 0) or 0
-            for b in range(masked_image.shape[0]):
-                band = masked_image[b]
-                band[cloud_mask_arr] = nodata_val
-                masked_image[b] = band
+    files = [f for f in os.listdir(raw_folder) if (f.endswith('.tiff') or f.endswith('.tif')) and not f.startswith('._')]
 
-            profile.update(dtype=rasterio.float32)
+    for file in tqdm(files, desc='Cloud masking images'):
+        file_path = os.path.join(raw_folder, file)
+        try:
+            mask_file(file_path, os.path.join(output_folder, file))
+        except Exception as e:
+            print(f"Skipping file {file} due to error: {e}")
 
-            output_path = os.path.join(output_folder, file)
-            with rasterio.open(output_path, 'w', **profile) as dst:
-                dst.write(masked_image.astype(rasterio.float32))
-    except Exception as e:
-        print(f"Skipping file {file} due to error: {e}")
+    print("Cloud masked images saved to folder:", output_folder)
 
-print("Cloud masked images saved to folder:", output_folder)
+if __name__ == '__main__':
+    raw_folder = '/Volumes/SSD/Proj_Terra/data/raw'
+    output_folder = '/Volumes/SSD/Proj_Terra/data/cloud_masked'
+    main(raw_folder, output_folder)
@@ -0,0 +1,188 @@
+import os
+import re
+import argparse
+import warnings
+from contextlib import ExitStack
+from datetime import date
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from tqdm import tqdm
+
+from raster_preview import add_overviews
+from tracing import traced, annotate
+
+INDEX_NAMES = ['NDVI', 'EVI', 'NDWI']
+# Median buffer dtypes: NDVI and NDWI are normalized differences in [-1, 1], so
+# float16 is plenty; EVI is unbounded (bright or dark pixels reach the thousands
+# and would overflow float16 to inf), so it keeps float32
+BUFFER_DTYPES = [np.float16, np.float32, np.float16]
+PERIODS = ['10d', 'month']
+METHODS = ['median', 'best']
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def period_start(date_str, period='10d'):
+    """First day of the period holding a date: dekads start on the 1st, 11th and 21st."""
+    d = date.fromisoformat(date_str)
+    if period == 'month':
+        return d.replace(day=1)
+    return d.replace(day=min((d.day - 1) // 10, 2) * 10 + 1)
+
+
+def composite_name(start):
+    return f"composite_{start.isoformat()}"
+
+
+class Compositor:
+    """
+    Running composite of NDVI/EVI/NDWI observations for one period, fed one
+    date at a time. An observation counts where all three indices are finite
+    (cloud-masked pixels come out of ProcessingImage as NaN).
+
+    'best' keeps the highest-NDVI observation per pixel (max-value compositing,
+    which favours clear, unshadowed pixels): O(1) state per pixel.
+    'median' keeps up to max_obs valid observations per pixel in a ring buffer
+    and takes their median; beyond max_obs the oldest are overwritten.
+    """
+    def __init__(self, shape, method='median', max_obs=8):
+        if method not in METHODS:
+            raise ValueError(f"Unknown composite method {method!r}, expected one of {METHODS}")
+        self.shape = shape
+        self.method = method
+        self.max_obs = max_obs
+        n = int(np.prod(shape))
+        self.count = np.zeros(n, np.uint16)
+        if method == 'best':
+            self.best = np.full((len(INDEX_NAMES), n), np.nan, np.float32)
+        else:
+            self.stacks = [np.full((max_obs, n), np.nan, dtype) for dtype in BUFFER_DTYPES]
+
+    def add(self, ndvi, evi, ndwi):
+        obs = np.stack([ndvi, evi, ndwi]).reshape(len(INDEX_NAMES), -1).astype(np.float32)
+        valid = np.isfinite(obs).all(axis=0)
+        if self.method == 'best':
+            # Comparisons with the NaN start value are False, so the first valid observation always wins
+            take = valid & ~(obs[0] <= self.best[0])
+            self.best[:, take] = obs[:, take]
+        else:
+            idx = np.flatnonzero(valid)
+            slot = self.count[idx] % self.max_obs
+            for stack, values in zip(self.stacks, obs):
+                stack[slot, idx] = values[idx]
+        self.count[valid] += 1
+
+    def result(self):
+        """(indices array of shape (3, *shape), valid-observation count of shape `shape`)."""
+        if self.method == 'best':
+            out = self.best
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN pixels stay NaN
+                out = np.stack([np.nanmedian(stack.astype(np.float32), axis=0) for stack in self.stacks])
+        return out.reshape((len(INDEX_NAMES),) + self.shape), self.count.reshape(self.shape)
+
+
+def index_paths(index_dir, name):
+    return [os.path.join(index_dir, name, f"{name}_{idx}.tif") for idx in INDEX_NAMES]
+
+
+def composite_paths(out_dir, name):
+    return index_paths(out_dir, name) + [os.path.join(out_dir, name, f"{name}_COUNT.tif")]
+
+
+def find_index_dates(index_dir):
+    """Names of the index_outputs folders that carry a date and all three indices."""
+    return [name for name in sorted(os.listdir(index_dir))
+            if DATE_PATTERN.search(name) and not name.startswith('._')
+            and all(os.path.exists(p) for p in index_paths(index_dir, name))]
+
+
+def group_periods(names, period='10d'):
+    """{composite name: [date names]} in date order, for names containing YYYY-MM-DD."""
+    groups = {}
+    for date_str, name in sorted((DATE_PATTERN.search(n).group(0), n) for n in names if DATE_PATTERN.search(n)):
+        groups.setdefault(composite_name(period_start(date_str, period)), []).append(name)
+    return groups
+
+
+@traced('composite')
+def composite_period(names, index_dir, out_dir, label, method='median', max_obs=8, strip_rows=512):
+    """
+    Composite the dates in `names` into out_dir/<label>/<label>_{NDVI,EVI,NDWI,COUNT}.tif.
+    Rows are processed in strips and every date's strip is read once, so memory
+    is bounded by strip_rows x width x max_obs whatever the scene size.
+    """
+    outputs = composite_paths(out_dir, label)
+    os.makedirs(os.path.dirname(outputs[0]), exist_ok=True)
+    with ExitStack() as stack:
+        sources = []
+        for name in names:
+            srcs = [stack.enter_context(rasterio.open(p)) for p in index_paths(index_dir, name)]
+            if sources and srcs[0].shape != sources[0][0].shape:
+                print(f"[WARN] {name} is {srcs[0].shape}, not {sources[0][0].shape}; left out of {label}")
+                continue
+            sources.append(srcs)
+        profile = sources[0][0].profile
+        height, width = sources[0][0].shape
+        annotate(period=label, dates=len(sources), pixels=height * width)
+
+        profile.update(driver='GTiff', count=1, dtype='float32', nodata=np.nan, tiled=True, blockxsize=256, blockysize=256)
+        dsts = [stack.enter_context(rasterio.open(p, 'w', **profile)) for p in outputs[:-1]]
+        count_profile = dict(profile, dtype='uint16', nodata=None)
+        count_dst = stack.enter_context(rasterio.open(outputs[-1], 'w', **count_profile))
+
+        gaps = 0
+        for row_off in range(0, height, strip_rows):
+            window = Window(0, row_off, width, min(strip_rows, height - row_off))
+            comp = Compositor((window.height, width), method, max_obs)
+            for srcs in sources:
+                comp.add(*(src.read(1, window=window) for src in srcs))
+            out, count = comp.result()
+            for dst, band in zip(dsts, out):
+                dst.write(band, 1, window=window)
+            count_dst.write(count, 1, window=window)
+            gaps += int((count == 0).sum())
+
+        for dst in dsts:
+            add_overviews(dst, 'average')
+        add_overviews(count_dst, 'nearest')
+    print(f"[INFO] {label}: {len(sources)} dates, {gaps / (height * width) * 100:.1f}% pixels without a clear observation")
+    return outputs
+
+
+def is_up_to_date(outputs, inputs):
+    if not all(os.path.exists(p) for p in outputs):
+        return False
+    return min(os.path.getmtime(p) for p in outputs) >= max(os.path.getmtime(p) for p in inputs)
+
+
+def build_composites(index_dir, out_dir, period='10d', method='median', max_obs=8, overwrite=False):
+    """Composite every period found in index_dir; periods whose outputs are newer than their inputs are skipped."""
+    groups = group_periods(find_index_dates(index_dir), period)
+    print(f"[INFO] {sum(len(v) for v in groups.values())} dates -> {len(groups)} {period} {method} composites")
+    labels = []
+    for label, names in tqdm(groups.items(), desc="Compositing"):
+        inputs = [p for name in names for p in index_paths(index_dir, name)]
+        if not overwrite and is_up_to_date(composite_paths(out_dir, label), inputs):
+            print(f"[INFO] {label} is up to date, skipping")
+        else:
+            composite_period(names, index_dir, out_dir, label, method, max_obs)
+        labels.append(label)
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cloud-free NDVI/EVI/NDWI composites per 10-day or monthly period")
+    parser.add_argument('--index_dir', type=str, default='index_outputs', help='Per-date index folders from ProcessingImage')
+    parser.add_argument('--output_dir', type=str, default='composites', help='Same folder layout, one folder per period')
+    parser.add_argument('--period', choices=PERIODS, default='10d')
+    parser.add_argument('--method', choices=METHODS, default='median', help="median, or 'best' = max-NDVI pixel")
+    parser.add_argument('--max_obs', type=int, default=8, help='Observations kept per pixel for the median')
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args()
+    build_composites(args.index_dir, args.output_dir, args.period, args.method, args.max_obs, args.overwrite)
+
+
+if __name__ == '__main__':
+    main()
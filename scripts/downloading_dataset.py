@@ -16,18 +16,21 @@ from sentinelhub import (
 import warnings
 
 # ------------------- CONFIG -------------------
-config = SHConfig()
-config.instance_id = "3b4ab58e-afa2-4ea7-9ab2-42665d063bd9"
-config.sh_client_id = "57239557-1374-4b9f-afa0-8fdfd70150bb"
-config.sh_client_secret = "mWgfW9u3zcHkdDjo9A9YPSiGULftegMP"
+def make_config():
+    config = SHConfig()
+    config.instance_id = "3b4ab58e-afa2-4ea7-9ab2-42665d063bd9"
+    config.sh_client_id = "57239557-1374-4b9f-afa0-8fdfd70150bb"
+    config.sh_client_secret = "mWgfW9u3zcHkdDjo9A9YPSiGULftegMP"
+    return config
+
 
 bbox_coords = [79, 10.57, 79.047, 10.617]
-bbox = BBox(bbox=bbox_coords, crs=CRS.WGS84)
 
 size = (2023, 2058)
+# Sentinel Hub Process API limit per request side; larger outputs are split into tiles
+MAX_REQUEST_PX = 2500
 time_range = ("2023-01-01", "2025-09-05")
 output_dir = "tanjavur_sentinel_downloads"
-os.makedirs(output_dir, exist_ok=True)
 
 evalscript = """
 //VERSION=3
@@ -48,83 +51,111 @@ function evaluatePixel(sample) {
 
 
 # ------------------- DOWNLOAD FUNCTION -------------------
-def download_all_images():
+def search_acquisitions(bbox_coords, time_range, config, max_cloud_coverage=None):
+    """Dates (YYYY-MM-DD) with Sentinel-2 L2A products over the bbox."""
     catalog = SentinelHubCatalog(config=config)
 
     # Search for Sentinel-2 L2A products
     search_iterator = catalog.search(
         DataCollection.SENTINEL2_L2A,
-        bbox=bbox,
-        time=time_range
+        bbox=BBox(bbox=bbox_coords, crs=CRS.WGS84),
+        time=time_range,
+        filter=f"eo:cloud_cover < {max_cloud_coverage}" if max_cloud_coverage is not None else None,
     )
 
-    all_items = list(search_iterator)
-    all_timestamps = [datetime.fromisoformat(item['properties']['datetime']) for item in all_items]
-    print(f"Found {len(all_timestamps)} images to download.")
-
-    transform = from_bounds(bbox.min_x, bbox.min_y, bbox.max_x, bbox.max_y, size[0], size[1])
+    all_timestamps = [datetime.fromisoformat(item['properties']['datetime']) for item in search_iterator]
+    return sorted({timestamp.strftime('%Y-%m-%d') for timestamp in all_timestamps})
+
+
+def download_date(date_str, filename, bbox_coords, size, config, max_attempts=None, throttle=None):
+    """
+    Download one date's 9-band scene to a georeferenced TIFF, retrying on errors.
+    Sizes over MAX_REQUEST_PX are fetched as tiles and mosaicked (tiled_download.py).
+    `throttle` is called before every request (e.g. a shared rate limiter).
+    """
+    if max(size) > MAX_REQUEST_PX:
+        from tiled_download import download_date_tiled
+        return download_date_tiled(date_str, filename, bbox_coords, size, config, max_attempts=max_attempts,
+                                   throttle=throttle)
+
+    aoi_bbox = BBox(bbox=bbox_coords, crs=CRS.WGS84)
+    transform = from_bounds(aoi_bbox.min_x, aoi_bbox.min_y, aoi_bbox.max_x, aoi_bbox.max_y, size[0], size[1])
+
+    request = SentinelHubRequest(
+        evalscript=evalscript,
+        input_data=[
+            SentinelHubRequest.input_data(
+                data_collection=DataCollection.SENTINEL2_L2A,
+                time_interval=(date_str, date_str),
+            )
+        ],
+        responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+        bbox=aoi_bbox,
+        size=size,
+        config=config,
+    )
 
-    for idx, timestamp in enumerate(all_timestamps):
-        date_str = timestamp.strftime('%Y-%m-%d')
-        filename = os.path.join(output_dir, f"tanjavur_{date_str}.tiff")
+    # ----------------- RETRY LOGIC -----------------
+    attempt = 0
+    while True:
+        attempt += 1
+        if throttle is not None:
+            throttle()
+        try:
+            # Suppress rate-limit warnings (we handle them manually)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # ignore all warnings for get_data
+                data = request.get_data()[0]
+
+            data = np.squeeze(data)
+
+            # Save georeferenced TIFF
+            with rasterio.open(
+                    filename,
+                    'w',
+                    driver='GTiff',
+                    height=data.shape[0],
+                    width=data.shape[1],
+                    count=data.shape[2] if len(data.shape) > 2 else 1,
+                    dtype=data.dtype,
+                    crs='EPSG:4326',
+                    transform=transform
+            ) as dst:
+                if len(data.shape) > 2:
+                    for i in range(data.shape[2]):
+                        dst.write(data[:, :, i], i + 1)
+                else:
+                    dst.write(data, 1)
+
+            print(f"Downloaded and saved {filename}")
+            return filename
+        except Exception as e:
+            if max_attempts is not None and attempt >= max_attempts:
+                raise
+            print(f"Error downloading {date_str}: {e}. Retrying in 5 seconds...")
+            time.sleep(5)
+
+
+def download_all_images(output_dir=output_dir, time_range=time_range, bbox_coords=bbox_coords, size=size,
+                        prefix='tanjavur'):
+    os.makedirs(output_dir, exist_ok=True)
+    config = make_config()
+
+    dates = search_acquisitions(bbox_coords, time_range, config)
+    print(f"Found {len(dates)} images to download.")
+
+    for idx, date_str in enumerate(dates):
+        filename = os.path.join(output_dir, f"{prefix}_{date_str}.tiff")
 
         if os.path.exists(filename):
             print(f"Skipping {filename}, already downloaded.")
             continue
 
-        print(f"Requesting data for date: {date_str} ({idx + 1}/{len(all_timestamps)})")
-
-        request = SentinelHubRequest(
-            evalscript=evalscript,
-            input_data=[
-                SentinelHubRequest.input_data(
-                    data_collection=DataCollection.SENTINEL2_L2A,
-                    time_interval=(date_str, date_str),
-                )
-            ],
-            responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
-            bbox=bbox,
-            size=size,
-            config=config,
-        )
-
-        # ----------------- RETRY LOGIC -----------------
-        downloaded = False
-        while not downloaded:
-            try:
-                # Suppress rate-limit warnings (we handle them manually)
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")  # ignore all warnings for get_data
-                    data = request.get_data()[0]
-
-                data = np.squeeze(data)
-
-                # Save georeferenced TIFF
-                with rasterio.open(
-                        filename,
-                        'w',
-                        driver='GTiff',
-                        height=data.shape[0],
-                        width=data.shape[1],
-                        count=data.shape[2] if len(data.shape) > 2 else 1,
-                        dtype=data.dtype,
-                        crs='EPSG:4326',
-                        transform=transform
-                ) as dst:
-                    if len(data.shape) > 2:
-                        for i in range(data.shape[2]):
-                            dst.write(data[:, :, i], i + 1)
-                    else:
-                        dst.write(data, 1)
-
-                downloaded = True
-                print(f"Downloaded and saved {filename}")
-
-                # Small delay to avoid API throttling
-                time.sleep(2)
-            except Exception as e:
-                print(f"Error downloading {date_str}: {e}. Retrying in 5 seconds...")
-                time.sleep(5)
+        print(f"Requesting data for date: {date_str} ({idx + 1}/{len(dates)})")
+        download_date(date_str, filename, bbox_coords, size, config)
+
+        # Small delay to avoid API throttling
+        time.sleep(2)
 
     print("\nAll images downloaded successfully! ✅")
 
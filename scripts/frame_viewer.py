@@ -0,0 +1,174 @@
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.transforms import Bbox
+
+
+def colormap_lut(cmap):
+    """256-entry RGBA uint8 lookup table for a matplotlib colormap name."""
+    return (colormaps[cmap](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+
+
+def reduce_blocks(array, factor, how='mean'):
+    """Block-reduce a 2D array by an integer factor ('max' keeps isolated mask pixels)."""
+    if factor <= 1:
+        return array
+    h, w = array.shape
+    pad_value = 0 if how == 'max' else np.nan
+    padded = np.pad(array.astype(np.float32), ((0, -h % factor), (0, -w % factor)), constant_values=pad_value)
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    if how == 'max':
+        return blocks.max(axis=(1, 3))
+    with np.errstate(invalid='ignore'):
+        return np.nanmean(blocks, axis=(1, 3))
+
+
+class FramePanel:
+    """
+    One animated image in a figure.
+
+    frames: sequence (or array stack) of 2D arrays.
+    cmap: colormap name, or a list with one name per frame.
+    vmin/vmax: fixed colour range; None scales each frame to its own range.
+    reduce: 'mean' for continuous data, 'max' for masks.
+    """
+    def __init__(self, ax, frames, cmap='viridis', vmin=None, vmax=None, reduce='mean'):
+        self.ax = ax
+        self.frames = frames
+        self.cmaps = cmap if isinstance(cmap, (list, tuple)) else [cmap] * len(frames)
+        self.luts = {name: colormap_lut(name) for name in set(self.cmaps)}
+        self.vmin, self.vmax = vmin, vmax
+        self.reduce = reduce
+        h, w = np.shape(frames[0])
+        self.shape = (h, w)
+        self.image = ax.imshow(np.zeros((1, 1, 4), dtype=np.uint8), extent=(0, w, h, 0),
+                               interpolation='nearest', animated=True)
+
+    def render(self, i, factor):
+        """Downsample frame i and map it through its LUT to an RGBA buffer."""
+        data = reduce_blocks(np.asarray(self.frames[i]), factor, self.reduce)
+        vmin = np.nanmin(data) if self.vmin is None else self.vmin
+        vmax = np.nanmax(data) if self.vmax is None else self.vmax
+        scaled = (data - vmin) / (vmax - vmin if vmax > vmin else 1.0)
+        idx = (np.clip(np.nan_to_num(scaled, nan=0.0), 0, 1) * 255).astype(np.uint8)
+        return self.luts[self.cmaps[i]][idx]
+
+
+class BlitFrameViewer:
+    """
+    Plays frames on a Tk matplotlib canvas by blitting only the image artists
+    (and an optional title text) over a cached background, instead of
+    redrawing axes, titles and colorbars every frame.
+
+    Frames are downsampled to the on-screen axes size and converted to RGBA
+    with lookup tables on a background thread, `prefetch` frames ahead.
+    """
+    def __init__(self, canvas, panels, n_frames, interval=1000, title=None, title_fn=None,
+                 repeat=True, prefetch=3):
+        self.canvas = canvas
+        self.fig = canvas.figure
+        self.panels = panels
+        self.n_frames = n_frames
+        self.interval = interval
+        self.title = title
+        self.title_fn = title_fn
+        self.repeat = repeat
+        self.prefetch = prefetch
+        self.frame = 0
+        self.background = None
+        self._title_bbox = None  # screen area of the last title drawn
+        self.factors = [1] * len(panels)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._after_id = None
+        if title is not None:
+            title.set_animated(True)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.mpl_connect('resize_event', lambda event: self._reset_cache())
+
+    def _display_factors(self):
+        factors = []
+        for panel in self.panels:
+            bbox = panel.ax.get_window_extent()
+            h, w = panel.shape
+            factors.append(max(1, math.floor(min(h / max(bbox.height, 1), w / max(bbox.width, 1)))))
+        return factors
+
+    def _reset_cache(self):
+        with self._lock:
+            self._pending = {}
+
+    def _on_draw(self, event):
+        # Full redraw happened (first show, resize): refresh background and factors
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        factors = self._display_factors()
+        if factors != self.factors:
+            self.factors = factors
+            self._reset_cache()
+        self._draw_artists()
+
+    def _render(self, i, factors):
+        return [panel.render(i, f) for panel, f in zip(self.panels, factors)]
+
+    def _request(self, i):
+        with self._lock:
+            if i not in self._pending:
+                self._pending[i] = self._pool.submit(self._render, i, list(self.factors))
+            return self._pending[i]
+
+    def _draw_artists(self):
+        for panel in self.panels:
+            panel.ax.draw_artist(panel.image)
+        if self.title is not None:
+            self.fig.draw_artist(self.title)
+
+    def show_frame(self, i):
+        buffers = self._request(i).result()
+        for panel, rgba in zip(self.panels, buffers):
+            panel.image.set_data(rgba)
+        if self.title is not None and self.title_fn is not None:
+            self.title.set_text(self.title_fn(i))
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        for panel in self.panels:
+            self.canvas.blit(panel.ax.bbox)
+        if self.title is not None:
+            # Blit the old title's area too, or a longer previous title leaves pixels behind
+            bbox = self.title.get_window_extent().expanded(1.2, 1.5)
+            self.canvas.blit(Bbox.union([bbox, self._title_bbox]) if self._title_bbox is not None else bbox)
+            self._title_bbox = bbox
+        # Drop the shown frame and queue the next ones
+        with self._lock:
+            self._pending.pop(i, None)
+        for k in range(1, self.prefetch + 1):
+            nxt = i + k
+            if nxt >= self.n_frames:
+                if not self.repeat:
+                    break
+                nxt %= self.n_frames
+            self._request(nxt)
+
+    def _tick(self):
+        self.show_frame(self.frame)
+        self.frame += 1
+        if self.frame >= self.n_frames:
+            if not self.repeat:
+                return
+            self.frame = 0
+        self._after_id = self.canvas.get_tk_widget().after(self.interval, self._tick)
+
+    def start(self):
+        self.canvas.draw()
+        self._tick()
+
+    def stop(self):
+        if self._after_id is not None:
+            self.canvas.get_tk_widget().after_cancel(self._after_id)
+            self._after_id = None
+        self._pool.shutdown(wait=False)
@@ -8,9 +8,17 @@ from affine import Affine
 import warnings
 from tqdm import tqdm
 
+from vector_pyramid import write_vector_pyramid
+from tracing import traced, annotate
+
 warnings.filterwarnings("ignore", category=UserWarning, module="geopandas")
 
 
+def date_from_mask_name(path):
+    return Path(path).stem.replace('pest_mask_tanjavur_', '')
+
+
+@traced('timeseries.load_masks')
 def load_masks(folder_path, bbox=None):
     """
     Load all pest mask TIFF files from a folder into a numpy array stack.
@@ -37,14 +45,16 @@ def load_masks(folder_path, bbox=None):
                     pixel_width = (max_lon - min_lon) / w
                     pixel_height = (max_lat - min_lat) / h
                     meta['transform'] = Affine.translation(min_lon, max_lat) * Affine.scale(pixel_width, -pixel_height)
-        date_str = f.stem.replace('pest_mask_tanjavur_', '')
-        dates.append(date_str)
+        dates.append(date_from_mask_name(f))
     masks_stack = np.array(masks)
+    annotate(dates=len(dates), pixels=masks_stack.size)
     return masks_stack, dates, meta
 
 
+@traced('timeseries.csv_write', cat='io')
 def extract_pixel_timeseries(masks_stack, dates, output_csv):
     n_times, h, w = masks_stack.shape
+    annotate(pixels=masks_stack.size)
     data = masks_stack.reshape(n_times, -1).T
     df = pd.DataFrame(data, columns=dates)
     df.insert(0, 'pixel_id', range(df.shape[0]))
@@ -76,7 +86,30 @@ def raster_to_polygons(mask, transform, crs):
     return gdf
 
 
-def save_vector_polygons(masks_stack, dates, meta, output_dir):
+@traced('timeseries.polygonize')
+def save_date_polygons(mask, date, transform, crs, output_dir, vector_format='geojson', zooms=None):
+    """
+    Polygonize one date's mask and save it as GeoJSON, or as full-resolution
+    plus per-zoom simplified FlatGeobuf files when vector_format='fgb'.
+    Returns the risk summary row, or None if no risk areas were found.
+    """
+    annotate(date=date, pixels=mask.size)
+    gdf = raster_to_polygons(mask, transform, crs)
+    risk_gdf = gdf[gdf['raster_val'] == 1].copy()
+    if risk_gdf.empty:
+        print(f"[WARN] No risk areas detected on {date}.")
+        return None
+    if vector_format == 'fgb':
+        out_fp = write_vector_pyramid(risk_gdf, output_dir, f'pest_risk_{date}', zooms)[0]
+    else:
+        out_fp = Path(output_dir) / f'pest_risk_{date}.geojson'
+        risk_gdf.to_file(out_fp, driver='GeoJSON')
+    print(f"[INFO] Saved {len(risk_gdf)} risk polygons on {date} to {out_fp}")
+    total_area = risk_gdf.to_crs(epsg=3857)['geometry'].area.sum() / 10000
+    return {'date': date, 'risk_polygon_count': len(risk_gdf), 'risk_area_ha': total_area}
+
+
+def save_vector_polygons(masks_stack, dates, meta, output_dir, vector_format='geojson', zooms=None):
     output_dir = Path(output_dir)
     output_dir.mkdir(exist_ok=True)
     transform = meta['transform']
@@ -84,17 +117,9 @@ def save_vector_polygons(masks_stack, dates, meta, output_dir):
     summary_rows = []
     for i, date in tqdm(enumerate(dates), total=len(dates), desc="Processing dates"):
         print(f"[INFO] Processing {date} ({i + 1}/{len(dates)})...")
-        mask = masks_stack[i]
-        gdf = raster_to_polygons(mask, transform, crs)
-        risk_gdf = gdf[gdf['raster_val'] == 1].copy()
-        if risk_gdf.empty:
-            print(f"[WARN] No risk areas detected on {date}.")
-        else:
-            out_fp = output_dir / f'pest_risk_{date}.geojson'
-            risk_gdf.to_file(out_fp, driver='GeoJSON')
-            print(f"[INFO] Saved {len(risk_gdf)} risk polygons on {date} to {out_fp}")
-            total_area = risk_gdf.to_crs(epsg=3857)['geometry'].area.sum() / 10000
-            summary_rows.append({'date': date, 'risk_polygon_count': len(risk_gdf), 'risk_area_ha': total_area})
+        row = save_date_polygons(masks_stack[i], date, transform, crs, output_dir, vector_format, zooms)
+        if row is not None:
+            summary_rows.append(row)
     summary_df = pd.DataFrame(summary_rows)
     summary_csv = output_dir / 'risk_summary.csv'
     summary_df.to_csv(summary_csv, index=False)
@@ -109,6 +134,8 @@ def main():
     parser.add_argument('--pixel_csv', type=str, default='pixel_timeseries.csv', help='CSV for per-pixel time series')
     parser.add_argument('--vector_dir', type=str, default='debug_pest_risk_vectors', help='Directory for vector polygons and summary')
     parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617], help='Bounding box: min_lon min_lat max_lon max_lat')
+    parser.add_argument('--vector_format', choices=['geojson', 'fgb'], default='geojson', help='GeoJSON, or FlatGeobuf with per-zoom simplified levels')
+    parser.add_argument('--zooms', nargs='+', type=int, default=None, help='Zoom levels for simplified FlatGeobuf outputs')
     args = parser.parse_args()
 
     bbox = args.bbox
@@ -119,7 +146,7 @@ def main():
     extract_pixel_timeseries(masks_stack, dates, args.pixel_csv)
 
     print("[INFO] Converting masks to polygons and summarizing...")
-    summary_df = save_vector_polygons(masks_stack, dates, meta, args.vector_dir)
+    summary_df = save_vector_polygons(masks_stack, dates, meta, args.vector_dir, args.vector_format, args.zooms)
 
     print("[INFO] All done!")
 
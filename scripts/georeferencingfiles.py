@@ -2,15 +2,17 @@ import os
 import rasterio
 from rasterio.transform import from_bounds
 
+from tracing import traced
+
 input_dir = 'tanjavur_sentinel_downloads'
 output_dir = 'tanjavur_georef'
-os.makedirs(output_dir, exist_ok=True)
 
 bbox_coords = [79, 10.57, 79.047, 10.617]  # Known bounding box (min_lon, min_lat, max_lon, max_lat)
 size = (2023, 2058)  # Known image size (width, height)
 crs = 'EPSG:4326'
 
-def add_georeferencing(input_path, output_path, bbox, size, crs):
+@traced('georef')
+def add_georeferencing(input_path, output_path, bbox, size, crs, delete_input=True):
     with rasterio.open(input_path) as src:
         img = src.read()  # Read all bands
         profile = src.profile
@@ -32,8 +34,9 @@ def add_georeferencing(input_path, output_path, bbox, size, crs):
     print(f"Saved georeferenced TIFF: {output_path}")
 
     # Delete original file after georeferencing
-    os.remove(input_path)
-    print(f"Deleted original file: {input_path}")
+    if delete_input:
+        os.remove(input_path)
+        print(f"Deleted original file: {input_path}")
 
 def batch_georeference(input_folder, output_folder, bbox, size, crs):
     for filename in os.listdir(input_folder):
@@ -44,4 +47,5 @@ def batch_georeference(input_folder, output_folder, bbox, size, crs):
             add_georeferencing(input_path, output_path, bbox, size, crs)
 
 if __name__ == '__main__':
+    os.makedirs(output_dir, exist_ok=True)
     batch_georeference(input_dir, output_dir, bbox_coords, size, crs)
\ No newline at end of file
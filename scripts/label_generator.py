@@ -3,6 +3,8 @@ import numpy as np
 import os
 import glob
 
+from raster_preview import add_overviews
+
 def generate_ndvi_label(ndvi_path, threshold=0.3, output_path=None):
     with rasterio.open(ndvi_path) as src:
         ndvi = src.read(1).astype(np.float32)
@@ -24,6 +26,7 @@ def generate_ndvi_label(ndvi_path, threshold=0.3, output_path=None):
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             with rasterio.open(output_path, 'w', **profile) as dst:
                 dst.write(label, 1)
+                add_overviews(dst, 'nearest')
             print(f"Saved label mask to {output_path}")
     return label
 
@@ -1,9 +1,22 @@
 import os
+import time
 import numpy as np
 import rasterio
 from numpy.ma import masked_invalid
-from scipy.ndimage import median_filter
-import matplotlib.pyplot as plt
+from scipy.ndimage import median_filter, minimum_filter, maximum_filter
+
+from raster_preview import add_overviews
+from tracing import traced, span, annotate
+
+# Thresholds for anomaly detection (tune as needed)
+NDVI_THRES = 0.3
+EVI_THRES = 0.3
+NDWI_THRES = 0.3
+BASELINE_SIZE = 15
+# Reach of one output pixel: the baseline median window plus the 3x3 label median
+HALO = BASELINE_SIZE // 2 + 1
+# Block edge of the coarse level; 0 or None runs the full-resolution filters everywhere
+COARSE_BLOCK = 64
 
 
 def read_raster(path):
@@ -17,11 +30,13 @@ def write_raster(data, meta, path):
     meta.update(dtype=rasterio.uint8, count=1)
     with rasterio.open(path, 'w', **meta) as dst:
         dst.write(data.astype(rasterio.uint8), 1)
+        add_overviews(dst, 'nearest')
 
 
 def compute_anomaly(data, baseline):
-    data_masked = masked_invalid(data)
-    baseline_masked = masked_invalid(baseline)
+    # Float math: uint8 inputs would wrap around on subtraction
+    data_masked = masked_invalid(np.asarray(data, dtype=np.float32))
+    baseline_masked = masked_invalid(np.asarray(baseline, dtype=np.float32))
     anomaly = np.abs(data_masked - baseline_masked) / (baseline_masked + 1e-6)
     return anomaly.filled(0)
 
@@ -31,7 +46,8 @@ def create_label_mask(anomaly, threshold):
     return median_filter(label, size=3)
 
 
-def process_and_save_for_date(date_folder_path, output_base_path):
+@traced('anomaly')
+def process_and_save_for_date(date_folder_path, output_base_path, coarse_block=COARSE_BLOCK):
     ndvi_path = os.path.join(date_folder_path, os.path.basename(date_folder_path) + '_NDVI.tif')
     evi_path = os.path.join(date_folder_path, os.path.basename(date_folder_path) + '_EVI.tif')
     ndwi_path = os.path.join(date_folder_path, os.path.basename(date_folder_path) + '_NDWI.tif')
@@ -40,45 +56,167 @@ def process_and_save_for_date(date_folder_path, output_base_path):
         print(f"Missing NDVI, EVI or NDWI file in {date_folder_path}. Skipping.")
         return
 
-    ndvi, meta = read_raster(ndvi_path)
-    evi, _ = read_raster(evi_path)
-    ndwi, _ = read_raster(ndwi_path)
+    with span('anomaly.read', cat='io'):
+        ndvi, meta = read_raster(ndvi_path)
+        evi, _ = read_raster(evi_path)
+        ndwi, _ = read_raster(ndwi_path)
+    annotate(date=os.path.basename(date_folder_path), pixels=ndvi.size)
+
+    with span('anomaly.median_filter'):
+        refined_pest_mask = refine_pest_mask(ndvi, evi, ndwi, coarse_block)
+
+    # Save refined mask
+    date_folder_name = os.path.basename(date_folder_path)
+    save_dir = os.path.join(output_base_path, 'PestRefinedData')
+    os.makedirs(save_dir, exist_ok=True)
+    save_path = os.path.join(save_dir, f'refined_pest_mask_{date_folder_name}.tif')
+
+    with span('anomaly.write', cat='io'):
+        write_raster(refined_pest_mask, meta, save_path)
+    print(f'Saved refined pest/disease risk mask: {save_path}')
+
+
+def refine_pest_mask(ndvi, evi, ndwi, coarse_block=COARSE_BLOCK):
+    """
+    Pest/disease risk mask: NDVI anomalies that are not explained by EVI or
+    NDWI anomalies (environmental stress). With coarse_block set, blocks that
+    cannot contain an NDVI anomaly are skipped (see candidate_blocks); the
+    result is the same as the full-resolution run.
+    """
+    if coarse_block:
+        return refine_pest_mask_coarse(ndvi, evi, ndwi, coarse_block)
+    return refine_pest_mask_full(ndvi, evi, ndwi)
 
+
+def refine_pest_mask_full(ndvi, evi, ndwi):
     # Compute spatial median baseline as proxy
-    ndvi_baseline = median_filter(ndvi, size=15)
-    evi_baseline = median_filter(evi, size=15)
-    ndwi_baseline = median_filter(ndwi, size=15)
+    ndvi_baseline = median_filter(ndvi, size=BASELINE_SIZE)
+    evi_baseline = median_filter(evi, size=BASELINE_SIZE)
+    ndwi_baseline = median_filter(ndwi, size=BASELINE_SIZE)
 
     # Calculate anomaly maps
     ndvi_anomaly = compute_anomaly(ndvi, ndvi_baseline)
     evi_anomaly = compute_anomaly(evi, evi_baseline)
     ndwi_anomaly = compute_anomaly(ndwi, ndwi_baseline)
 
-    # Thresholds for anomaly detection (tune as needed)
-    ndvi_thres = 0.3
-    evi_thres = 0.3
-    ndwi_thres = 0.3
-
     # Create binary anomaly masks
-    ndvi_mask = create_label_mask(ndvi_anomaly, ndvi_thres)
-    evi_mask = create_label_mask(evi_anomaly, evi_thres)
-    ndwi_mask = create_label_mask(ndwi_anomaly, ndwi_thres)
+    ndvi_mask = create_label_mask(ndvi_anomaly, NDVI_THRES)
+    evi_mask = create_label_mask(evi_anomaly, EVI_THRES)
+    ndwi_mask = create_label_mask(ndwi_anomaly, NDWI_THRES)
 
     # Refine pest/disease risk mask by removing environmental stress areas
     refined_pest_mask = np.logical_and(ndvi_mask == 1,
                                        np.logical_not(np.logical_or(evi_mask == 1, ndwi_mask == 1))).astype(np.uint8)
-
-    # Save refined mask
-    date_folder_name = os.path.basename(date_folder_path)
-    save_dir = os.path.join(output_base_path, 'PestRefinedData')
-    os.makedirs(save_dir, exist_ok=True)
-    save_path = os.path.join(save_dir, f'refined_pest_mask_{date_folder_name}.tif')
-
-    write_raster(refined_pest_mask, meta, save_path)
-    print(f'Saved refined pest/disease risk mask: {save_path}')
-
-
-def main(base_normalized_path):
+    return refined_pest_mask
+
+
+def block_range(data, block):
+    """Per-block min and max of a 2-D array (a decimated level); NaN blocks get -inf/+inf."""
+    h, w = data.shape
+    # Edge padding never widens a block's range
+    padded = np.pad(np.asarray(data, dtype=np.float64), ((0, -h % block), (0, -w % block)), mode='edge')
+    blocks = padded.reshape(padded.shape[0] // block, block, padded.shape[1] // block, block)
+    lo, hi = blocks.min(axis=(1, 3)), blocks.max(axis=(1, 3))
+    nan = np.isnan(lo) | np.isnan(hi)
+    lo[nan], hi[nan] = -np.inf, np.inf
+    return lo, hi
+
+
+def candidate_blocks(ndvi, block=COARSE_BLOCK, threshold=NDVI_THRES):
+    """
+    Boolean grid of blocks that may hold an NDVI anomaly. Every value and every
+    baseline median an output pixel depends on lies in [lo, hi] of its block
+    plus the HALO, so |x - b| / b <= (hi - lo) / lo there. Blocks where that
+    bound stays under the threshold cannot produce a risk pixel (the EVI and
+    NDWI masks only ever remove pixels).
+    """
+    if block % HALO:
+        raise ValueError(f"coarse block must be a multiple of {HALO} pixels")
+    # HALO-sized cells dilated by one cell give each cell's range over cell + HALO,
+    # which is then reduced to blocks
+    lo, hi = block_range(ndvi, HALO)
+    lo = minimum_filter(lo, size=3, mode='nearest')
+    hi = maximum_filter(hi, size=3, mode='nearest')
+    cells = block // HALO
+    ny, nx = -(-lo.shape[0] // cells), -(-lo.shape[1] // cells)
+    lo = np.pad(lo, ((0, ny * cells - lo.shape[0]), (0, nx * cells - lo.shape[1])), mode='edge')
+    hi = np.pad(hi, ((0, ny * cells - hi.shape[0]), (0, nx * cells - hi.shape[1])), mode='edge')
+    lo = lo.reshape(ny, cells, nx, cells).min(axis=(1, 3))
+    hi = hi.reshape(ny, cells, nx, cells).max(axis=(1, 3))
+    # Small margin so float rounding in compute_anomaly can never beat the bound.
+    # Constant regions (e.g. cloud fill) have x == b everywhere, so no anomaly either.
+    return ~((hi - lo < threshold * lo * (1 - 1e-4)) | (hi == lo))
+
+
+def label_mask(data, threshold):
+    baseline = median_filter(data, size=BASELINE_SIZE)
+    return create_label_mask(compute_anomaly(data, baseline), threshold)
+
+
+def refine_pest_mask_coarse(ndvi, evi, ndwi, block=COARSE_BLOCK):
+    """
+    Full-resolution filters only on runs of candidate blocks, each cropped with
+    a HALO margin. Inside a run, EVI and NDWI are filtered only around pixels
+    that actually carry an NDVI anomaly.
+    """
+    h, w = ndvi.shape
+    candidates = candidate_blocks(ndvi, block)
+    out = np.zeros((h, w), dtype=np.uint8)
+    annotate(candidate_blocks=int(candidates.sum()), blocks=int(candidates.size))
+    for i, row in enumerate(candidates):
+        # Runs of consecutive candidate blocks in this block row
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], row.astype(np.int8), [0]])))
+        for j0, j1 in zip(edges[::2], edges[1::2]):
+            y0, y1 = i * block, min(h, (i + 1) * block)
+            x0, x1 = j0 * block, min(w, j1 * block)
+            cy0, cy1, cx0, cx1 = max(0, y0 - HALO), min(h, y1 + HALO), max(0, x0 - HALO), min(w, x1 + HALO)
+            ndvi_mask = label_mask(ndvi[cy0:cy1, cx0:cx1], NDVI_THRES)[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+            rows, cols = np.nonzero(ndvi_mask)
+            if rows.size == 0:
+                continue
+            # Bounding box of the NDVI hits, in image coordinates, plus its own halo
+            by0, by1 = y0 + rows.min(), y0 + rows.max() + 1
+            bx0, bx1 = x0 + cols.min(), x0 + cols.max() + 1
+            sy0, sy1, sx0, sx1 = max(0, by0 - HALO), min(h, by1 + HALO), max(0, bx0 - HALO), min(w, bx1 + HALO)
+            inner = (slice(by0 - sy0, by1 - sy0), slice(bx0 - sx0, bx1 - sx0))
+            stress = (label_mask(evi[sy0:sy1, sx0:sx1], EVI_THRES)[inner] == 1) | \
+                     (label_mask(ndwi[sy0:sy1, sx0:sx1], NDWI_THRES)[inner] == 1)
+            hits = ndvi_mask[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0] == 1
+            out[by0:by1, bx0:bx1] = np.logical_and(hits, ~stress)
+    return out
+
+
+def validate_coarse(ndvi, evi, ndwi, block=COARSE_BLOCK):
+    """Compare the coarse-to-fine mask with the full-resolution one: recall, mismatches and timings."""
+    start = time.perf_counter()
+    full = refine_pest_mask_full(ndvi, evi, ndwi)
+    full_s = time.perf_counter() - start
+    start = time.perf_counter()
+    coarse = refine_pest_mask_coarse(ndvi, evi, ndwi, block)
+    coarse_s = time.perf_counter() - start
+    positives = int(full.sum())
+    found = int((full & coarse).sum())
+    return {
+        'recall': found / positives if positives else 1.0,
+        'mismatched_pixels': int((full != coarse).sum()),
+        'candidate_fraction': float(candidate_blocks(ndvi, block).mean()),
+        'full_s': full_s,
+        'coarse_s': coarse_s,
+    }
+
+
+def validate_folder(date_folder_path, coarse_block=COARSE_BLOCK):
+    name = os.path.basename(date_folder_path)
+    ndvi, evi, ndwi = (read_raster(os.path.join(date_folder_path, f"{name}_{idx}.tif"))[0]
+                       for idx in ('NDVI', 'EVI', 'NDWI'))
+    stats = validate_coarse(ndvi, evi, ndwi, coarse_block)
+    print(f"[INFO] {name}: recall {stats['recall']:.4f}, {stats['mismatched_pixels']} mismatched pixels, "
+          f"{stats['candidate_fraction'] * 100:.1f}% blocks searched, "
+          f"{stats['full_s']:.2f}s full vs {stats['coarse_s']:.2f}s coarse")
+    return stats
+
+
+def main(base_normalized_path, coarse_block=COARSE_BLOCK, validate=False):
     # Output directory base
     output_base_path = base_normalized_path  # You may change this if needed
 
@@ -86,9 +224,12 @@ def main(base_normalized_path):
                     if os.path.isdir(os.path.join(base_normalized_path, f)) and f.startswith('tanjavur_')]
 
     for folder in sorted(date_folders):
-        process_and_save_for_date(folder, output_base_path)
+        if validate:
+            validate_folder(folder, coarse_block or COARSE_BLOCK)
+        else:
+            process_and_save_for_date(folder, output_base_path, coarse_block)
 
 
 if __name__ == '__main__':
     normalized_base_path = '/Volumes/SSD/Proj_Terra/data/normalized/'
-    main(normalized_base_path)
\ No newline at end of file
+    main(normalized_base_path)
@@ -0,0 +1,391 @@
+import os
+import time
+import queue
+import argparse
+import secrets
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client, deliver_challenge, answer_challenge
+import numpy as np
+
+from tracing import span
+
+DEFAULT_ADDRESS = '127.0.0.1:6010'
+# Connections unpickle what they receive, so the key is a per-user secret, never a shipped default
+KEY_FILE = os.environ.get('TERRA_MODEL_KEY_FILE', os.path.join(os.path.expanduser('~'), '.terra_model_server.key'))
+BACKLOG = 128
+STOP = object()  # batcher queue sentinel
+
+
+def parse_address(address):
+    """'host:port' -> (host, port) for TCP; anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(':')
+    return (host, int(port)) if sep and port.isdigit() else address
+
+
+def load_authkey(create=False, key_file=KEY_FILE):
+    """
+    TERRA_MODEL_KEY if set, else the key in key_file. The server creates the
+    file (random, mode 0600) on first start; a key file other users can read
+    is refused.
+    """
+    if os.environ.get('TERRA_MODEL_KEY'):
+        return os.environ['TERRA_MODEL_KEY'].encode()
+    if create and not os.path.exists(key_file):
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        print(f"[INFO] Generated model server key in {key_file}")
+    if not os.path.exists(key_file):
+        raise FileNotFoundError(f"No model server key: start the server first or set TERRA_MODEL_KEY ({key_file})")
+    if os.stat(key_file).st_mode & 0o077:
+        raise PermissionError(f"{key_file} is readable by other users; chmod 600 it")
+    with open(key_file) as f:
+        return f.read().strip().encode()
+
+
+def keras_loader(path):
+    from tensorflow.keras.models import load_model
+    return load_model(path)
+
+
+# ------------------- BATCHING -------------------
+class Request:
+    __slots__ = ('X', 'done', 'result', 'error', 'queued_at')
+
+    def __init__(self, X):
+        self.X = X
+        self.done = threading.Event()
+        self.result = self.error = None
+        self.queued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    One thread per loaded model. The first waiting request opens a batch; more
+    requests join it until max_batch samples are queued or max_wait_ms has
+    passed since the first one arrived, then the batch runs as one predict()
+    and each caller gets its own slice back. Requests of max_batch samples or
+    more run on their own.
+    """
+    def __init__(self, name, model, max_batch=8192, max_wait_ms=5.0, predict_batch=4096):
+        self.name = name
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.predict_batch = predict_batch
+        self.queue = queue.Queue()
+        self.carry = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.stats = {'requests': 0, 'samples': 0, 'batches': 0, 'errors': 0}
+        self.latencies = deque(maxlen=1000)
+        self.recent = deque()  # (finished_at, samples) over the last minute, for throughput
+        self.busy_s = 0.0
+        self.thread = threading.Thread(target=self._run, name=f'batcher-{os.path.basename(name)}', daemon=True)
+        self.thread.start()
+
+    def submit(self, X):
+        req = Request(np.asarray(X, dtype=np.float32))
+        with self.lock:
+            if self.closed:
+                raise RuntimeError(f"{self.name} was unloaded")
+            self.queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def stop(self):
+        self.queue.put(STOP)
+
+    def _gather(self):
+        first, self.carry = self.carry or self.queue.get(), None
+        if first is STOP:
+            return None
+        batch, samples = [first], len(first.X)
+        deadline = first.queued_at + self.max_wait
+        while samples < self.max_batch:
+            try:
+                req = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if req is STOP or samples + len(req.X) > self.max_batch:
+                # Opens the next batch instead (or stops the thread after this one)
+                self.carry = req
+                break
+            batch.append(req)
+            samples += len(req.X)
+        return batch
+
+    def _close(self):
+        """Fail whatever is still queued once the model is unloaded."""
+        with self.lock:
+            self.closed = True
+        while not self.queue.empty():
+            req = self.queue.get()
+            if req is not STOP:
+                req.error = RuntimeError(f"{self.name} was unloaded")
+                req.done.set()
+
+    def _run(self):
+        while True:
+            batch = self._gather()
+            if batch is None:
+                return self._close()
+            start = time.perf_counter()
+            try:
+                X = batch[0].X if len(batch) == 1 else np.concatenate([r.X for r in batch])
+                with span('serve.predict', cat='tensorflow', samples=len(X), requests=len(batch)):
+                    y = np.asarray(self.model.predict(X, batch_size=self.predict_batch, verbose=0))
+                offset = 0
+                for r in batch:
+                    r.result = y[offset:offset + len(r.X)]
+                    offset += len(r.X)
+            except Exception as e:
+                self.stats['errors'] += len(batch)
+                for r in batch:
+                    r.error = e
+            finished = time.perf_counter()
+            self.busy_s += finished - start
+            self.stats['requests'] += len(batch)
+            self.stats['samples'] += sum(len(r.X) for r in batch)
+            self.stats['batches'] += 1
+            self.recent.append((finished, sum(len(r.X) for r in batch)))
+            for r in batch:
+                self.latencies.append(finished - r.queued_at)
+                r.done.set()
+
+    def metrics(self):
+        now = time.perf_counter()
+        while self.recent and now - self.recent[0][0] > 60:
+            self.recent.popleft()
+        lat = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return dict(self.stats,
+                    queue_depth=self.queue.qsize(),
+                    mean_batch_requests=self.stats['requests'] / max(self.stats['batches'], 1),
+                    samples_per_s_1m=sum(n for _, n in self.recent) / 60,
+                    busy_s=self.busy_s,
+                    latency_p50_ms=float(np.percentile(lat, 50)),
+                    latency_p95_ms=float(np.percentile(lat, 95)))
+
+
+# ------------------- REGISTRY -------------------
+class ModelRegistry:
+    """Checkpoints kept hot in LRU order; loading a new one past max_models unloads the least recently used."""
+    def __init__(self, max_models=3, loader=keras_loader, **batch_options):
+        self.max_models = max_models
+        self.loader = loader
+        self.batch_options = batch_options
+        self.models = OrderedDict()
+        self.loading = {}  # path -> Future of the batcher while its checkpoint loads
+        self.lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, path):
+        """
+        Batcher for a checkpoint, loading it on first use. Loading runs outside
+        the registry lock, so models already loaded keep serving meanwhile;
+        concurrent requests for the same checkpoint wait on one load.
+        """
+        with self.lock:
+            if path in self.models:
+                self.models.move_to_end(path)
+                return self.models[path]
+            pending = self.loading.get(path)
+            if pending is None:
+                pending = self.loading[path] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+
+        try:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No checkpoint {path}")
+            start = time.perf_counter()
+            batcher = MicroBatcher(path, self.loader(path), **self.batch_options)
+            print(f"[INFO] Loaded {path} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            with self.lock:
+                del self.loading[path]
+            pending.set_exception(e)
+            raise
+        with self.lock:
+            del self.loading[path]
+            self.loads += 1
+            self.models[path] = batcher
+            while len(self.models) > self.max_models:
+                old_path, old = self.models.popitem(last=False)
+                old.stop()
+                print(f"[INFO] Unloaded {old_path}")
+        pending.set_result(batcher)
+        return batcher
+
+    def metrics(self):
+        with self.lock:
+            models = dict(self.models)
+        return {'loads': self.loads, 'models': {path: b.metrics() for path, b in models.items()}}
+
+
+# ------------------- SERVER -------------------
+class ModelServer:
+    """
+    Local inference worker. Each client connection gets a thread; messages are
+    dicts: {'op': 'predict', 'model': path, 'X': array} -> {'y': array},
+    {'op': 'load', 'model': path}, {'op': 'metrics'}. Errors come back as
+    {'error': message}. Clients must prove they hold the key from
+    load_authkey() before any message is read.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, registry=None, default_model=None, log_interval=60.0):
+        self.address = address
+        self.registry = registry or ModelRegistry()
+        self.default_model = default_model
+        self.log_interval = log_interval
+        self.authkey = load_authkey(create=True)
+        # No authkey here: the handshake runs on each connection's thread (serve_connection),
+        # so one slow client cannot hold up accept() for everyone else
+        self.listener = Listener(parse_address(address), backlog=BACKLOG)
+        if isinstance(parse_address(address), str):
+            os.chmod(address, 0o600)
+        self.started = time.time()
+        self.connections = 0
+        self.lock = threading.Lock()  # guards connections, updated from every connection thread
+
+    def handle(self, msg):
+        op = msg.get('op', 'predict')
+        if op == 'metrics':
+            with self.lock:
+                connections = self.connections
+            return dict(self.registry.metrics(), uptime_s=time.time() - self.started, connections=connections)
+        model = msg.get('model') or self.default_model
+        if not model:
+            raise ValueError("No model given and the server has no default model")
+        model = os.path.abspath(model)
+        if op == 'load':
+            self.registry.get(model)
+            return {'loaded': model}
+        if op == 'predict':
+            return {'y': self.registry.get(model).submit(msg['X'])}
+        raise ValueError(f"Unknown op {op!r}")
+
+    def serve_connection(self, conn):
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+        except Exception as e:  # wrong key, or not a model client at all
+            print(f"[WARN] Rejected connection: {e}")
+            conn.close()
+            return
+        with self.lock:
+            self.connections += 1
+        try:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = self.handle(msg)
+                except Exception as e:
+                    reply = {'error': f"{type(e).__name__}: {e}"}
+                conn.send(reply)
+        finally:
+            with self.lock:
+                self.connections -= 1
+            conn.close()
+
+    def _log_metrics(self):
+        while True:
+            time.sleep(self.log_interval)
+            for path, m in self.registry.metrics()['models'].items():
+                print(f"[INFO] {os.path.basename(path)}: {m['samples_per_s_1m']:.0f} samples/s, "
+                      f"queue {m['queue_depth']}, {m['mean_batch_requests']:.1f} requests/batch, "
+                      f"p95 {m['latency_p95_ms']:.1f} ms")
+
+    def serve_forever(self):
+        print(f"[INFO] Model server listening on {self.address}")
+        if self.log_interval:
+            threading.Thread(target=self._log_metrics, daemon=True).start()
+        try:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except OSError as e:
+                    print(f"[WARN] Accept failed: {e}")
+                    continue
+                threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            self.listener.close()
+
+
+# ------------------- CLIENT -------------------
+class ModelClient:
+    """
+    Drop-in stand-in for a Keras model: predict(X) goes to the server, e.g.
+    risk_query.query_risk(roi, mask_dir, model=ModelClient(model='ckpt.h5')).
+    Each thread keeps its own connection, so concurrent callers are batched
+    together on the server rather than serialised here.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, model=None):
+        self.address = address
+        self.model = os.path.abspath(model) if model and os.path.exists(model) else model
+        self.authkey = load_authkey()
+        self._local = threading.local()
+
+    def _call(self, msg):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = Client(parse_address(self.address), authkey=self.authkey)
+        conn.send(msg)
+        reply = conn.recv()
+        if 'error' in reply:
+            raise RuntimeError(f"Model server: {reply['error']}")
+        return reply
+
+    def predict(self, X, batch_size=None, verbose=0):
+        """Same call shape as keras Model.predict; batching is the server's job, so batch_size is ignored."""
+        return self._call({'op': 'predict', 'model': self.model, 'X': np.asarray(X, dtype=np.float32)})['y']
+
+    def load(self):
+        return self._call({'op': 'load', 'model': self.model})
+
+    def metrics(self):
+        return self._call({'op': 'metrics'})
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-lived local LSTM inference worker with micro-batching")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help='Run the worker')
+    serve.add_argument('--address', type=str, default=DEFAULT_ADDRESS, help='host:port or a Unix socket path')
+    serve.add_argument('--preload', nargs='*', default=[], help='Checkpoints to load at start; the first is the default')
+    serve.add_argument('--max_models', type=int, default=3, help='Checkpoints kept loaded')
+    serve.add_argument('--max_batch', type=int, default=8192, help='Samples per coalesced batch')
+    serve.add_argument('--max_wait_ms', type=float, default=5.0, help='Longest a request waits for others to join its batch')
+    serve.add_argument('--log_interval', type=float, default=60.0, help='Seconds between metric log lines (0 = off)')
+    metrics = sub.add_parser('metrics', help="Print a running worker's throughput and queue depth")
+    metrics.add_argument('--address', type=str, default=DEFAULT_ADDRESS)
+    args = parser.parse_args()
+
+    if args.command == 'metrics':
+        import json
+        print(json.dumps(ModelClient(args.address).metrics(), indent=2))
+        return
+    preload = [os.path.abspath(p) for p in args.preload]
+    registry = ModelRegistry(args.max_models, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    for path in preload:
+        registry.get(path)
+    ModelServer(args.address, registry, preload[0] if preload else None, args.log_interval).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,23 +2,34 @@ import os
 import numpy as np
 import imageio.v2 as imageio
 
-def normalize_index_image(input_path, output_path):
+from tracing import traced
+
+def normalize_index_array(image, name=''):
     """
-    Normalize an index image (NDVI, NDWI, EVI) from [-1, 1] to [0, 1],
-    replace invalid values, and save as 8-bit image.
+    Normalize an index array (NDVI, NDWI, EVI) from [-1, 1] to 8-bit [0, 255],
+    replacing invalid values with -1 first.
     """
-    image = imageio.imread(input_path).astype(np.float32)
+    image = np.asarray(image, dtype=np.float32).copy()
     # Replace NaN and infinite values
     invalid_mask = np.isnan(image) | np.isinf(image)
     if np.any(invalid_mask):
-        print(f"Found {np.sum(invalid_mask)} invalid values in {input_path}, replacing with -1.")
+        print(f"Found {np.sum(invalid_mask)} invalid values in {name}, replacing with -1.")
         image[invalid_mask] = -1.0
     # Clip to [-1, 1]
     image = np.clip(image, -1, 1)
     # Normalize to [0,1]
     normalized_image = (image + 1) / 2
     # Convert to 8-bit
-    normalized_8bit = (normalized_image * 255).astype(np.uint8)
+    return (normalized_image * 255).astype(np.uint8)
+
+@traced('normalize')
+def normalize_index_image(input_path, output_path):
+    """
+    Normalize an index image (NDVI, NDWI, EVI) from [-1, 1] to [0, 1],
+    replace invalid values, and save as 8-bit image.
+    """
+    image = imageio.imread(input_path).astype(np.float32)
+    normalized_8bit = normalize_index_array(image, input_path)
     # Create output directory if it doesn't exist
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     # Save normalized image
@@ -1,9 +1,11 @@
 import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import rasterio
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from matplotlib.animation import PillowWriter
+from PIL import Image, ImageDraw, GifImagePlugin
+
+from tracing import traced
 
 def load_masks_folder(folder_path):
     files = [f for f in os.listdir(folder_path) if f.endswith('.tif') and f.startswith('refined_pest_mask_')]
@@ -22,6 +24,9 @@ def load_masks_folder(folder_path):
     return masks_stack, dates
 
 def animate_risk_timeseries_save_gif(masks_stack, dates, output_file='pest_disease_risk_timelapse.gif'):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation, PillowWriter
+
     fig, ax = plt.subplots(figsize=(6, 6))
     img = ax.imshow(masks_stack[0], cmap='gray', vmin=0, vmax=1)
     ax.axis('off')
@@ -40,7 +45,123 @@ def animate_risk_timeseries_save_gif(masks_stack, dates, output_file='pest_disea
     print(f'Animation saved as {output_file}')
     plt.close(fig)
 
+# Palette indices: mask classes map straight to indices, overlay uses the top two
+RISK_PALETTE = [30, 30, 30, 220, 20, 60] + [0, 0, 0] * 252 + [0, 0, 0, 255, 255, 255]
+TEXT_BG, TEXT_FG = 254, 255
+
+
+def list_mask_files(folder_path):
+    files = sorted(f for f in os.listdir(folder_path) if f.endswith('.tif') and f.startswith('refined_pest_mask_'))
+    dates = [f.replace('refined_pest_mask_tanjavur_', '').replace('.tif', '') for f in files]
+    return [os.path.join(folder_path, f) for f in files], dates
+
+
+def block_or_downsample(mask, factor):
+    """Downsample a binary mask so a block is set if any of its pixels is set."""
+    if factor <= 1:
+        return mask
+    h, w = mask.shape
+    padded = np.pad(mask, ((0, -h % factor), (0, -w % factor)))
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).max(axis=(1, 3))
+
+
+def label_margin():
+    """Height of the strip above each frame that holds the date, the same for every date."""
+    draw = ImageDraw.Draw(Image.new('P', (1, 1)))
+    return draw.textbbox((4, 4), 'Date: Agjy_0123456789-')[3] + 4
+
+
+def render_frame(path, date, factor=1):
+    """
+    Read one mask and return a palette-indexed uint8 frame with the date
+    written in a margin above it, so the label never hides risk pixels.
+    """
+    with rasterio.open(path) as src:
+        mask = src.read(1)
+    frame = block_or_downsample((mask > 0).astype(np.uint8), factor)
+    margin = label_margin()
+    canvas = np.full((frame.shape[0] + margin, frame.shape[1]), TEXT_BG, dtype=np.uint8)
+    canvas[margin:] = frame
+    img = Image.fromarray(canvas, mode='P')
+    ImageDraw.Draw(img).text((4, 4), f'Date: {date}', fill=TEXT_FG)
+    return np.asarray(img)
+
+
+def iter_frames(paths, dates, factor=1, workers=4):
+    """Render frames in parallel, yielding them in date order with at most 2*workers in flight."""
+    if workers <= 1:
+        for path, date in zip(paths, dates):
+            yield render_frame(path, date, factor)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for path, date in zip(paths, dates):
+            pending.append(pool.submit(render_frame, path, date, factor))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for fut in pending:
+            yield fut.result()
+
+
+def _to_image(frame):
+    img = Image.fromarray(frame, mode='P')
+    img.putpalette(RISK_PALETTE)
+    return img
+
+
+def write_gif_stream(frames, output_file, duration_ms=500):
+    """Write frames to a looping GIF one at a time, so only the current frame is in memory."""
+    with open(output_file, 'wb') as f:
+        first = True
+        for frame in frames:
+            img = _to_image(frame)
+            if first:
+                header, _ = GifImagePlugin.getheader(img, RISK_PALETTE, {'loop': 0, 'duration': duration_ms})
+                f.write(b''.join(header))
+                first = False
+            for fragment in GifImagePlugin.getdata(img, (0, 0), duration=duration_ms, disposal=1):
+                f.write(fragment)
+        f.write(b';')
+
+
+@traced('animate')
+def encode_risk_timelapse(folder_path, output_file='pest_disease_risk_timelapse.gif', factor=1, fps=2, workers=4):
+    """
+    Stream refined masks into an animated GIF, WebP or APNG (picked from the
+    extension) without matplotlib and without stacking every date in memory.
+    """
+    paths, dates = list_mask_files(folder_path)
+    if not paths:
+        print(f"No refined masks found in {folder_path}")
+        return
+    duration_ms = int(1000 / fps)
+    frames = iter_frames(paths, dates, factor, workers)
+    ext = os.path.splitext(output_file)[1].lower()
+    if ext == '.gif':
+        write_gif_stream(frames, output_file, duration_ms)
+    else:
+        first = _to_image(next(frames)).convert('RGB')
+        rest = (_to_image(fr).convert('RGB') for fr in frames)
+        fmt = 'WEBP' if ext == '.webp' else 'PNG'
+        if fmt == 'PNG':
+            # The APNG writer walks append_images twice (frame modes first, then
+            # encoding), so a generator would be exhausted after the first frame
+            rest = list(rest)
+        first.save(output_file, format=fmt, save_all=True, append_images=rest,
+                   duration=duration_ms, loop=0, lossless=True)
+    print(f'Animation saved as {output_file} ({len(paths)} frames)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode refined pest masks into a time-lapse animation")
+    parser.add_argument('--folder', type=str, default='/Volumes/SSD/Proj_Terra/data/normalized/PestRefinedData')
+    parser.add_argument('--output', type=str, default='pest_disease_risk_timelapse.gif', help='.gif, .webp or .png (APNG)')
+    parser.add_argument('--downsample', type=int, default=1, help='Block-OR downsampling factor')
+    parser.add_argument('--fps', type=float, default=2)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    encode_risk_timelapse(args.folder, args.output, args.downsample, args.fps, args.workers)
+
+
 if __name__ == '__main__':
-    folder_path = '/Volumes/SSD/Proj_Terra/data/normalized/PestRefinedData'
-    masks_stack, dates = load_masks_folder(folder_path)
-    animate_risk_timeseries_save_gif(masks_stack, dates)
\ No newline at end of file
+    main()
@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import LSTM, Dense, Dropout, Input
 from tensorflow.keras.optimizers import Adam
@@ -13,6 +12,8 @@ from tqdm import tqdm
 import os
 from typing import Tuple
 
+from tracing import span
+
 
 def load_data(csv_path: str, sample_frac: float = 0.05, random_state: int = 42) -> np.ndarray:
     df = pd.read_csv(csv_path)
@@ -92,6 +93,7 @@ def build_lstm_model(seq_length: int) -> Model:
 
 
 def plot_predicted_probabilities(pred_probs: np.ndarray, bins: int = 50) -> None:
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(8, 5))
     plt.hist(pred_probs, bins=bins, alpha=0.7, color='c')
     plt.title("Predicted Pest Risk Probabilities on Test Set")
@@ -158,18 +160,20 @@ def main(
     csv_logger = CSVLogger('training_log.csv')
 
     # Train model
-    history = model.fit(
-        X_train, y_train,
-        epochs=epochs,
-        batch_size=batch_size,
-        validation_split=0.1,
-        callbacks=[checkpoint, early_stop, csv_logger],
-        class_weight=class_weights_dict,
-        verbose=1
-    )
+    with span('train.fit', cat='tensorflow', samples=len(X_train)):
+        history = model.fit(
+            X_train, y_train,
+            epochs=epochs,
+            batch_size=batch_size,
+            validation_split=0.1,
+            callbacks=[checkpoint, early_stop, csv_logger],
+            class_weight=class_weights_dict,
+            verbose=1
+        )
 
     # Evaluate
-    y_pred_prob = model.predict(X_test, verbose=0)
+    with span('train.predict', cat='tensorflow', samples=len(X_test)):
+        y_pred_prob = model.predict(X_test, verbose=0)
     y_pred = (y_pred_prob > threshold).astype(int).flatten()
 
     print("Test Accuracy:", accuracy_score(y_test, y_pred))
@@ -181,7 +185,8 @@ def main(
 
     # Predict future pest risk for last sequences from sampled data
     last_sequences = data_sampled[:, -seq_length:].reshape(-1, seq_length, 1)
-    future_pred_prob = model.predict(last_sequences, verbose=0)
+    with span('train.predict', cat='tensorflow', samples=len(last_sequences)):
+        future_pred_prob = model.predict(last_sequences, verbose=0)
     future_pred = (future_pred_prob > threshold).astype(int).flatten()
     print(f"Predicted pest risk for next time step for first 10 pixels: {future_pred[:10]}")
 
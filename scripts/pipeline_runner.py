@@ -0,0 +1,349 @@
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tracing import span
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = '.pipeline_cache.json'
+INDEX_NAMES = ['NDVI', 'EVI', 'NDWI']
+# The fused scene node runs code from all of these, so any of them changing invalidates it
+SCENE_MODULES = ['scene_pipeline', 'cloud_masking', 'ProcessingImage', 'normalize', 'mask_Anomaly']
+
+
+# ------------------- HASHING -------------------
+def file_digest(path, file_cache):
+    """
+    SHA-256 of a file's content. Digests are memoised by (size, mtime) in
+    file_cache so unchanged files are not re-read on every run.
+    """
+    st = os.stat(path)
+    cached = file_cache.get(path)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    file_cache[path] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+
+def code_digest(module_names):
+    """Hash of a stage's source file(s), used as its code version. Takes one module name or a list."""
+    if isinstance(module_names, str):
+        module_names = [module_names]
+    h = hashlib.sha256()
+    for name in module_names:
+        with open(os.path.join(SCRIPT_DIR, name + '.py'), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def node_hash(stage, module_name, params, inputs, file_cache):
+    payload = {
+        'stage': stage,
+        'code': code_digest(module_name),
+        'params': params,
+        'inputs': [(os.path.basename(p), file_digest(p, file_cache)) for p in inputs],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def load_cache(work_dir):
+    path = os.path.join(work_dir, CACHE_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'nodes': {}, 'files': {}}
+
+
+def save_cache(work_dir, cache):
+    path = os.path.join(work_dir, CACHE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+
+# ------------------- STAGES -------------------
+def stage_paths(work_dir):
+    return {
+        'georef': os.path.join(work_dir, 'georef'),
+        'cloud_masked': os.path.join(work_dir, 'cloud_masked'),
+        'indices': os.path.join(work_dir, 'index_outputs'),
+        'normalized': os.path.join(work_dir, 'normalized'),
+        'masks': os.path.join(work_dir, 'normalized', 'PestRefinedData'),
+        'vectors': os.path.join(work_dir, 'pest_risk_vectors'),
+        'pixel_csv': os.path.join(work_dir, 'pixel_timeseries.csv'),
+    }
+
+
+def date_stages(raw_path, paths, params):
+    """
+    Per-date chain: georef -> cloud_mask -> indices -> normalize -> anomaly,
+    or a single in-memory scene node when params['fused'] is set. In composite
+    mode the chain stops after indices.
+    Each entry is (stage, module, params, inputs, outputs, run).
+    """
+    file_name = os.path.basename(raw_path)
+    name = os.path.splitext(file_name)[0]
+    georef_path = os.path.join(paths['georef'], file_name)
+    masked_path = os.path.join(paths['cloud_masked'], file_name)
+    index_files = [os.path.join(paths['indices'], name, f"{name}_{idx}.tif") for idx in INDEX_NAMES]
+    norm_files = [os.path.join(paths['normalized'], name, f"{name}_{idx}.tif") for idx in INDEX_NAMES]
+    mask_path = os.path.join(paths['masks'], f'refined_pest_mask_{name}.tif')
+    georef_params = {'bbox': params['bbox'], 'size': params['size'], 'crs': params['crs']}
+
+    def run_georef():
+        from georeferencingfiles import add_georeferencing
+        add_georeferencing(raw_path, georef_path, params['bbox'], params['size'], params['crs'], delete_input=False)
+
+    def run_cloud_mask():
+        from cloud_masking import mask_file
+        mask_file(georef_path, masked_path)
+
+    def run_indices():
+        from ProcessingImage import process_file
+        process_file(masked_path, paths['indices'])
+
+    def run_normalize():
+        from normalize import normalize_index_image
+        for src, dst in zip(index_files, norm_files):
+            normalize_index_image(src, dst)
+
+    def run_anomaly():
+        from mask_Anomaly import process_and_save_for_date
+        process_and_save_for_date(os.path.join(paths['normalized'], name), paths['normalized'])
+
+    def run_scene():
+        from scene_pipeline import process_scene
+        process_scene(raw_path, os.path.dirname(paths['georef']), params['bbox'], params['size'], params['crs'])
+
+    if params.get('fused'):
+        return name, [('scene', SCENE_MODULES, georef_params, [raw_path], [mask_path], run_scene)]
+
+    stages = [
+        ('georef', 'georeferencingfiles', georef_params, [raw_path], [georef_path], run_georef),
+        ('cloud_mask', 'cloud_masking', {}, [georef_path], [masked_path], run_cloud_mask),
+        ('indices', 'ProcessingImage', {}, [masked_path], index_files, run_indices),
+        ('normalize', 'normalize', {}, index_files, norm_files, run_normalize),
+        ('anomaly', 'mask_Anomaly', {}, norm_files, [mask_path], run_anomaly),
+    ]
+    if params.get('composite'):
+        # Normalize and anomaly run on the period composites instead (period_stages)
+        return name, stages[:3]
+    return name, stages
+
+
+def composite_stage_paths(work_dir, params):
+    """Stage folders of composite mode, kept apart from the per-date outputs."""
+    return stage_paths(os.path.join(work_dir, f"composites_{params['composite']}_{params['composite_method']}"))
+
+
+def period_stages(label, date_names, paths, comp_paths, params):
+    """Per-period chain in composite mode: composite -> normalize -> anomaly."""
+    index_files = [os.path.join(paths['indices'], n, f"{n}_{idx}.tif") for n in date_names for idx in INDEX_NAMES]
+    comp_files = [os.path.join(comp_paths['indices'], label, f"{label}_{idx}.tif") for idx in INDEX_NAMES + ['COUNT']]
+    norm_files = [os.path.join(comp_paths['normalized'], label, f"{label}_{idx}.tif") for idx in INDEX_NAMES]
+    mask_path = os.path.join(comp_paths['masks'], f'refined_pest_mask_{label}.tif')
+    comp_params = {'period': params['composite'], 'method': params['composite_method']}
+
+    def run_composite():
+        from composite import composite_period
+        composite_period(date_names, paths['indices'], comp_paths['indices'], label, params['composite_method'])
+
+    def run_normalize():
+        from normalize import normalize_index_image
+        for src, dst in zip(comp_files, norm_files):
+            normalize_index_image(src, dst)
+
+    def run_anomaly():
+        from mask_Anomaly import process_and_save_for_date
+        process_and_save_for_date(os.path.join(comp_paths['normalized'], label), comp_paths['normalized'])
+
+    return [
+        ('composite', 'composite', comp_params, index_files, comp_files, run_composite),
+        ('normalize', 'normalize', {}, comp_files[:3], norm_files, run_normalize),
+        ('anomaly', 'mask_Anomaly', {}, norm_files, [mask_path], run_anomaly),
+    ]
+
+
+def run_node(key, module_name, params, inputs, outputs, run, nodes, file_cache):
+    """Run one node unless its hash matches the cache. Returns the new hash or None."""
+    missing = [p for p in inputs if not os.path.exists(p)]
+    if missing:
+        print(f"[WARN] {key}: missing inputs {missing}, skipping")
+        return None
+    h = node_hash(key.split(':')[0], module_name, params, inputs, file_cache)
+    if nodes.get(key) == h and all(os.path.exists(p) for p in outputs):
+        print(f"[CACHE] {key}")
+        return h
+    for out in outputs:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    print(f"[RUN] {key}")
+    with span(f"node.{key.split(':')[0]}", node=key):
+        run()
+    if not all(os.path.exists(p) for p in outputs):
+        print(f"[WARN] {key}: stage did not produce all outputs")
+        return None
+    return h
+
+
+def run_date_chain(raw_path, work_dir, params, nodes, file_cache):
+    """Worker entry point: run one date's chain, return updated node hashes and file digests."""
+    import sys
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    paths = stage_paths(work_dir)
+    name, stages = date_stages(raw_path, paths, params)
+    return run_chain(name, stages, nodes, file_cache), file_cache
+
+
+def run_period_chain(label, date_names, work_dir, params, nodes, file_cache):
+    """Worker entry point for one composite period, like run_date_chain."""
+    import sys
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    stages = period_stages(label, date_names, stage_paths(work_dir), composite_stage_paths(work_dir, params), params)
+    return run_chain(label, stages, nodes, file_cache), file_cache
+
+
+def run_chain(name, stages, nodes, file_cache):
+    updates = {}
+    for stage, module_name, stage_params, inputs, outputs, run in stages:
+        key = f'{stage}:{name}'
+        h = run_node(key, module_name, stage_params, inputs, outputs, run, nodes, file_cache)
+        if h is None:
+            break
+        updates[key] = h
+    return updates
+
+
+def run_timeseries(paths, params, nodes, file_cache):
+    mask_files = sorted(os.path.join(paths['masks'], f) for f in os.listdir(paths['masks'])
+                        if f.startswith('refined_pest_mask_') and f.endswith('.tif')) \
+        if os.path.isdir(paths['masks']) else []
+    if not mask_files:
+        print("[WARN] No refined masks to aggregate.")
+        return None
+    outputs = [paths['pixel_csv'], os.path.join(paths['vectors'], 'risk_summary.csv')]
+
+    def run():
+        from generate_Timeseries import load_masks, extract_pixel_timeseries, save_vector_polygons
+        masks_stack, dates, meta = load_masks(paths['masks'], params['bbox'])
+        extract_pixel_timeseries(masks_stack, dates, paths['pixel_csv'])
+        save_vector_polygons(masks_stack, dates, meta, paths['vectors'])
+
+    return run_node('timeseries:all', 'generate_Timeseries', {'bbox': params['bbox']},
+                    mask_files, outputs, run, nodes, file_cache)
+
+
+def run_zonal(paths, params, nodes, file_cache):
+    mask_files = sorted(os.path.join(paths['masks'], f) for f in os.listdir(paths['masks'])
+                        if f.startswith('refined_pest_mask_') and f.endswith('.tif'))
+    output = os.path.join(paths['vectors'], 'zonal_stats.csv')
+
+    def run():
+        from zonal_stats import zonal_timeseries
+        zonal_timeseries(params['zones'], paths['masks'], output, paths['indices'],
+                         cache_dir=os.path.join(os.path.dirname(paths['pixel_csv']), 'zone_index_cache'),
+                         bbox=params['bbox'])
+
+    return run_node('zonal:all', 'zonal_stats', {'bbox': params['bbox']}, [params['zones']] + mask_files, [output], run, nodes, file_cache)
+
+
+def run_training(paths, nodes, file_cache, seq_length):
+    def run():
+        from pest_Risk_LSTM import main as train_main
+        train_main(csv_path=paths['pixel_csv'], seq_length=seq_length)
+
+    return run_node('train:all', 'pest_Risk_LSTM', {'seq_length': seq_length},
+                    [paths['pixel_csv']], ['lstm_pest_model_final.h5'], run, nodes, file_cache)
+
+
+# ------------------- MAIN -------------------
+def collect_results(futures, work_dir, cache):
+    for fut in as_completed(futures):
+        try:
+            updates, file_cache = fut.result()
+        except Exception as e:
+            print(f"[ERROR] {os.path.basename(futures[fut])}: {e}")
+            continue
+        cache['nodes'].update(updates)
+        cache['files'].update(file_cache)
+        save_cache(work_dir, cache)
+
+
+def run_pipeline(raw_dir, work_dir, params, workers=4, download=False, train=False, seq_length=10):
+    os.makedirs(work_dir, exist_ok=True)
+    if download:
+        from downloading_dataset import download_all_images
+        download_all_images(raw_dir, bbox_coords=params['bbox'], size=tuple(params['size']))
+
+    cache = load_cache(work_dir)
+    raw_files = sorted(os.path.join(raw_dir, f) for f in os.listdir(raw_dir)
+                       if (f.endswith('.tif') or f.endswith('.tiff')) and not f.startswith('._'))
+    print(f"[INFO] {len(raw_files)} acquisitions in {raw_dir}, {workers} workers")
+
+    paths = stage_paths(work_dir)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_date_chain, p, work_dir, params, cache['nodes'], cache['files']): p
+                   for p in raw_files}
+        collect_results(futures, work_dir, cache)
+
+        if params.get('composite'):
+            from composite import find_index_dates, group_periods
+            names = {os.path.splitext(os.path.basename(p))[0] for p in raw_files}
+            groups = group_periods([n for n in find_index_dates(paths['indices']) if n in names], params['composite'])
+            print(f"[INFO] {len(names)} dates -> {len(groups)} {params['composite']} composites")
+            futures = {pool.submit(run_period_chain, label, date_names, work_dir, params, cache['nodes'], cache['files']): label
+                       for label, date_names in groups.items()}
+            collect_results(futures, work_dir, cache)
+            paths = composite_stage_paths(work_dir, params)
+
+    h = run_timeseries(paths, params, cache['nodes'], cache['files'])
+    if h:
+        cache['nodes']['timeseries:all'] = h
+        if params.get('zones'):
+            zh = run_zonal(paths, params, cache['nodes'], cache['files'])
+            if zh:
+                cache['nodes']['zonal:all'] = zh
+        if train:
+            h = run_training(paths, cache['nodes'], cache['files'], seq_length)
+            if h:
+                cache['nodes']['train:all'] = h
+    save_cache(work_dir, cache)
+    print("[INFO] Pipeline done!")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached DAG runner over the pest risk pipeline scripts")
+    parser.add_argument('--raw_dir', type=str, default='tanjavur_sentinel_downloads', help='Folder with raw Sentinel-2 TIFFs')
+    parser.add_argument('--work_dir', type=str, default='pipeline_outputs', help='Folder for stage outputs and the cache manifest')
+    parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617], help='Bounding box: min_lon min_lat max_lon max_lat')
+    parser.add_argument('--size', nargs=2, type=int, default=[2023, 2058], help='Image size: width height')
+    parser.add_argument('--crs', type=str, default='EPSG:4326')
+    parser.add_argument('--workers', type=int, default=4, help='Parallel date workers')
+    parser.add_argument('--fused', action='store_true', help='Run each date in memory with scene_pipeline')
+    parser.add_argument('--composite', choices=['10d', 'month'], default=None,
+                        help='Run anomaly detection and the time series on cloud-free period composites')
+    parser.add_argument('--composite_method', choices=['median', 'best'], default='median')
+    parser.add_argument('--zones', type=str, default=None, help='Field polygons for per-field statistics per date')
+    parser.add_argument('--download', action='store_true', help='Download new acquisitions first')
+    parser.add_argument('--train', action='store_true', help='Retrain the LSTM after aggregation')
+    parser.add_argument('--seq_length', type=int, default=10)
+    args = parser.parse_args()
+    if args.fused and args.composite:
+        parser.error('--fused writes masks only, so it cannot feed --composite')
+
+    params = {'bbox': args.bbox, 'size': args.size, 'crs': args.crs, 'fused': args.fused,
+              'composite': args.composite, 'composite_method': args.composite_method, 'zones': args.zones}
+    run_pipeline(args.raw_dir, args.work_dir, params, args.workers, args.download, args.train, args.seq_length)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,17 @@ import glob
 import rasterio
 import numpy as np
 
+from band_stack import stack_sources, build_stack_vrt
+from tracing import traced
+
 RAW_DIR = "/Volumes/SSD/Proj_Terra/data/raw"
 INDEX_DIR = "/Volumes/SSD/Proj_Terra/data"
 PATCHED_DIR = "/Volumes/SSD/Proj_Terra/data/patched"
 
-os.makedirs(PATCHED_DIR, exist_ok=True)
 
 
-def process_date(date_name: str):
+@traced('patch')
+def process_date(date_name: str, materialize: bool = False):
     print(f"▶ Processing date: {date_name}")
 
     # 🔹 Find raw file (.tif or .tiff)
@@ -31,6 +34,13 @@ def process_date(date_name: str):
     ndvi_path = ndvi_files[0]
     ndwi_path = ndwi_files[0]
 
+    # 🔹 Default: virtual stack (raw + NDVI + NDWI) that references the sources
+    if not materialize:
+        sources = stack_sources(raw_path, {'NDVI': ndvi_path, 'NDWI': ndwi_path})
+        out_path = build_stack_vrt(sources, os.path.join(PATCHED_DIR, f"{date_name}_patched.vrt"))
+        print(f"✅ Virtual patched stack saved: {out_path}")
+        return
+
     # 🔹 Read raster bands
     with rasterio.open(raw_path) as raw_ds, \
          rasterio.open(ndvi_path) as ndvi_ds, \
@@ -53,10 +63,11 @@ def process_date(date_name: str):
     print(f"✅ Patched file saved: {out_path}")
 
 
-def main():
+def main(materialize: bool = False):
     if not os.path.exists(INDEX_DIR):
         print(f"❌ Index directory not found: {INDEX_DIR}")
         return
+    os.makedirs(PATCHED_DIR, exist_ok=True)
 
     # Get only folders inside INDEX_DIR
     date_folders = [d for d in os.listdir(INDEX_DIR)
@@ -67,10 +78,11 @@ def main():
         return
 
     for date_name in sorted(date_folders):
-        process_date(date_name)
+        process_date(date_name, materialize)
 
     print("🎉 All dates processed and patched!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    main(materialize="--materialize" in sys.argv)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import math
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+
+# Approximate metres per degree, for pixel areas on geographic grids
+M_PER_DEG_LAT = 110574.0
+M_PER_DEG_LON = 111320.0
+
+
+def overview_factors(width, height, min_size=256):
+    """Power-of-two decimation factors until the smallest overview is under min_size."""
+    factors = []
+    f = 2
+    while max(width, height) / f >= min_size / 2:
+        factors.append(f)
+        f *= 2
+    return factors
+
+
+def add_overviews(dst, resampling='nearest'):
+    """
+    Build internal overviews on a GeoTIFF opened for writing, after its data
+    has been written. Use 'nearest' for masks/labels and 'average' for indices.
+    """
+    factors = overview_factors(dst.width, dst.height)
+    if factors:
+        dst.build_overviews(factors, Resampling[resampling])
+        dst.update_tags(ns='rio_overview', resampling=resampling)
+
+
+def preview_shape(width, height, max_size):
+    factor = max(1, math.ceil(max(width, height) / max_size))
+    return max(1, height // factor), max(1, width // factor)
+
+
+def read_preview(path, max_size=512, band=1, masked=False):
+    """
+    Read a band decimated to at most max_size pixels on its long side.
+    GDAL serves the read from the closest internal overview, so only a
+    fraction of the full-resolution data is decoded.
+    Returns (array, transform) with the transform scaled to the preview grid.
+    """
+    with rasterio.open(path) as src:
+        out_h, out_w = preview_shape(src.width, src.height, max_size)
+        data = src.read(band, out_shape=(out_h, out_w), resampling=Resampling.nearest, masked=masked)
+        transform = src.transform * src.transform.scale(src.width / out_w, src.height / out_h)
+    return data, transform
+
+
+def downsample_for_display(array, max_size=512):
+    """
+    Shrink an in-memory array for display with block-max, so isolated
+    positive pixels in risk maps stay visible at widget size.
+    """
+    h, w = array.shape
+    factor = max(1, math.ceil(max(h, w) / max_size))
+    if factor == 1:
+        return array
+    padded = np.pad(array, ((0, -h % factor), (0, -w % factor)))
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).max(axis=(1, 3))
+
+
+def mask_grid(mask_path, bbox=None):
+    """(transform, width, height, crs) of a mask; masks written without georeferencing fall back to bbox, as in load_masks."""
+    with rasterio.open(mask_path) as src:
+        transform, width, height, crs = src.transform, src.width, src.height, src.crs
+    if transform.is_identity and bbox:
+        transform, crs = from_bounds(*bbox, width, height), crs or 'EPSG:4326'
+    return transform, width, height, crs
+
+
+def pixel_area_m2(transform, height, crs):
+    """Area of one pixel per row (m²); rows differ on a geographic grid."""
+    if crs is not None and rasterio.crs.CRS.from_user_input(crs).is_geographic:
+        lat = transform.f + (np.arange(height) + 0.5) * transform.e
+        return abs(transform.a * transform.e) * M_PER_DEG_LON * M_PER_DEG_LAT * np.cos(np.radians(lat))
+    return np.full(height, abs(transform.a * transform.e))
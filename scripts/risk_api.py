@@ -0,0 +1,379 @@
+import os
+import re
+import json
+import gzip
+import math
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+import numpy as np
+import rasterio
+from affine import Affine
+
+from raster_preview import mask_grid, pixel_area_m2
+from tracing import traced, annotate
+
+API_VERSION = 1
+GZIP_MIN_BYTES = 1024
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+# ------------------- AGGREGATES -------------------
+def source_files(work_dir, forecast_path=None):
+    """Inputs the aggregates are built from: refined masks, the vector summary, zonal stats and the forecast raster."""
+    mask_dir = os.path.join(work_dir, 'normalized', 'PestRefinedData')
+    masks = sorted(os.path.join(mask_dir, f) for f in os.listdir(mask_dir)
+                   if f.startswith('refined_pest_mask_') and f.endswith('.tif')) if os.path.isdir(mask_dir) else []
+    vectors = os.path.join(work_dir, 'pest_risk_vectors')
+    extra = [os.path.join(vectors, 'risk_summary.csv'), os.path.join(vectors, 'zonal_stats.csv'), forecast_path]
+    return masks, [p for p in extra if p and os.path.exists(p)]
+
+
+def signature(paths):
+    """Cheap change detector: a hash of every input's path, size and mtime."""
+    h = hashlib.sha1(str(API_VERSION).encode())
+    for p in paths:
+        st = os.stat(p)
+        h.update(f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+def mask_date(mask_path):
+    return os.path.basename(mask_path)[len('refined_pest_mask_'):-4]
+
+
+@traced('api.build')
+def build_aggregates(work_dir, cache_dir, forecast_path=None, bbox=None, force=False):
+    """
+    Precompute what the API serves into cache_dir, unless the inputs are unchanged:
+      mask_bits.npy   (height, width, ceil(dates / 8)) uint8, the mask stack bit-packed
+                      along time, so a pixel's whole history is one contiguous read
+      forecast.npy    the forecast raster, when it is on the mask grid
+      manifest.json   grid, dates, per-date risk totals and the forecast summary
+    """
+    masks, extra = source_files(work_dir, forecast_path)
+    if not masks:
+        raise FileNotFoundError(f"No refined masks under {work_dir}")
+    sig = signature(masks + extra)
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('signature') == sig:
+            print(f"[CACHE] API aggregates in {cache_dir}")
+            return manifest
+
+    os.makedirs(cache_dir, exist_ok=True)
+    transform, width, height, crs = mask_grid(masks[0], bbox)
+    row_ha = pixel_area_m2(transform, height, crs) / 1e4
+    bits = np.zeros((height, width, math.ceil(len(masks) / 8)), dtype=np.uint8)
+    summary = []
+    for group in range(0, len(masks), 8):
+        chunk = np.zeros((8, height, width), dtype=bool)
+        for i, path in enumerate(masks[group:group + 8]):
+            with rasterio.open(path) as src:
+                risk = src.read(1) == 1
+            if risk.shape != (height, width):
+                raise ValueError(f"{os.path.basename(path)} is {risk.shape}, not {(height, width)}")
+            chunk[i] = risk
+            risk_rows = risk.sum(axis=1)
+            summary.append({
+                'date': mask_date(path),
+                'risk_pixels': int(risk_rows.sum()),
+                'risk_pct': float(risk_rows.sum() / risk.size * 100),
+                'risk_ha': float(risk_rows @ row_ha),
+            })
+        bits[:, :, group // 8] = np.packbits(chunk, axis=0)[0]
+    _save_npy(os.path.join(cache_dir, 'mask_bits.npy'), bits)
+
+    polygons = os.path.join(work_dir, 'pest_risk_vectors', 'risk_summary.csv')
+    if polygons in extra:
+        import pandas as pd
+        # generate_Timeseries names dates differently from the mask files; match on the YYYY-MM-DD part
+        by_date = {DATE_PATTERN.search(str(r.pop('date'))).group(0): r
+                   for r in pd.read_csv(polygons).to_dict('records') if DATE_PATTERN.search(str(r['date']))}
+        for row in summary:
+            match = DATE_PATTERN.search(row['date'])
+            row.update(by_date.get(match.group(0) if match else None, {'risk_polygon_count': 0, 'risk_area_ha': 0.0}))
+
+    forecast = None
+    if forecast_path in extra:
+        with rasterio.open(forecast_path) as src:
+            pred = src.read(1)
+        forecast = {'path': forecast_path, 'modified': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(os.path.getmtime(forecast_path))),
+                    'after_date': summary[-1]['date'], 'risk_pixels': int((pred == 1).sum()),
+                    'risk_pct': float((pred == 1).mean() * 100), 'on_mask_grid': pred.shape == (height, width)}
+        if forecast['on_mask_grid']:
+            forecast['risk_ha'] = float((pred == 1).sum(axis=1) @ row_ha)
+            _save_npy(os.path.join(cache_dir, 'forecast.npy'), pred.astype(np.uint8))
+        else:
+            print(f"[WARN] Forecast raster is {pred.shape}, not on the {height}x{width} mask grid; point lookups disabled")
+
+    manifest = {
+        'signature': sig,
+        'built': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'grid': {'transform': list(transform)[:6], 'width': width, 'height': height, 'crs': str(crs) if crs else None},
+        'dates': [row['date'] for row in summary],
+        'summary': summary,
+        'forecast': forecast,
+    }
+    tmp = manifest_path + '.part'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+    annotate(dates=len(masks), pixels=width * height)
+    print(f"[INFO] API aggregates for {len(masks)} dates ({bits.nbytes / 1e6:.1f} MB of packed masks) saved to {cache_dir}")
+    return manifest
+
+
+def _save_npy(path, array):
+    with open(path + '.part', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.part', path)
+
+
+def _records(df):
+    """DataFrame rows as dicts with NaN turned into null (NaN is not valid JSON)."""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+# ------------------- STORE -------------------
+class RiskStore:
+    """
+    Aggregates of one pipeline work_dir plus an LRU of encoded responses.
+    The inputs are re-checked at most every refresh_s seconds; any change
+    rebuilds the aggregates and drops the response cache.
+    """
+    def __init__(self, work_dir, cache_dir=None, forecast_path=None, bbox=None, refresh_s=30.0, cache_size=256):
+        self.work_dir = work_dir
+        self.cache_dir = cache_dir or os.path.join(work_dir, 'api_cache')
+        self.forecast_path = forecast_path
+        self.bbox = bbox
+        self.refresh_s = refresh_s
+        self.cache_size = cache_size
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+        self.checked = 0.0
+        self.hits = self.misses = 0
+        self.load(build_aggregates(work_dir, self.cache_dir, forecast_path, bbox))
+
+    def load(self, manifest):
+        grid = manifest['grid']
+        self.manifest = manifest
+        self.version = manifest['signature'][:12]
+        self.dates = manifest['dates']
+        self.transform = Affine(*grid['transform'])
+        self.width, self.height, self.crs = grid['width'], grid['height'], grid['crs']
+        self.bits = np.load(os.path.join(self.cache_dir, 'mask_bits.npy'), mmap_mode='r')
+        forecast = manifest['forecast']
+        self.forecast = (np.load(os.path.join(self.cache_dir, 'forecast.npy'), mmap_mode='r')
+                         if forecast and forecast['on_mask_grid'] else None)
+        self.fields = self.field_series = None
+        zonal = os.path.join(self.work_dir, 'pest_risk_vectors', 'zonal_stats.csv')
+        if os.path.exists(zonal):
+            import pandas as pd
+            table = pd.read_csv(zonal, dtype={'zone_id': str})
+            self.fields = _records(table[table['date'] == table['date'].max()].drop(columns='date'))
+            self.field_series = {zone_id: _records(rows.drop(columns='zone_id'))
+                                 for zone_id, rows in table.groupby('zone_id', sort=False)}
+        self.responses.clear()
+        self.checked = time.monotonic()
+
+    def refresh(self):
+        if time.monotonic() - self.checked < self.refresh_s:
+            return
+        with self.lock:
+            if time.monotonic() - self.checked < self.refresh_s:
+                return
+            masks, extra = source_files(self.work_dir, self.forecast_path)
+            if masks and signature(masks + extra) != self.manifest['signature']:
+                print("[INFO] Pipeline outputs changed, rebuilding API aggregates")
+                self.load(build_aggregates(self.work_dir, self.cache_dir, self.forecast_path, self.bbox))
+            self.checked = time.monotonic()
+
+    # -------- endpoints: each returns a JSON-serialisable object or raises KeyError / ValueError --------
+    def health(self, query):
+        return {'status': 'ok', 'version': self.version, 'built': self.manifest['built'], 'dates': len(self.dates),
+                'fields': len(self.fields) if self.fields is not None else 0,
+                'cache': {'entries': len(self.responses), 'hits': self.hits, 'misses': self.misses}}
+
+    def summary(self, query):
+        rows = self.manifest['summary']
+        start, end = query.get('start'), query.get('end')
+        for bound in (start, end):
+            if bound and not DATE_PATTERN.fullmatch(bound):
+                raise ValueError(f"Dates must be YYYY-MM-DD, got {bound!r}")
+        if start or end:
+            # Names carry a prefix (tanjavur_, composite_); compare their YYYY-MM-DD part
+            days = [(r, DATE_PATTERN.search(r['date'])) for r in rows]
+            rows = [r for r, m in days if m and (not start or m.group(0) >= start) and (not end or m.group(0) <= end)]
+        return {'dates': len(rows), 'summary': rows}
+
+    def fields_list(self, query):
+        if self.fields is None:
+            raise KeyError('No zonal_stats.csv in this work_dir (run the pipeline with --zones)')
+        return {'fields': self.fields}
+
+    def field(self, query, zone_id):
+        if self.field_series is None or zone_id not in self.field_series:
+            raise KeyError(f"Unknown field {zone_id!r}")
+        return {'zone_id': zone_id, 'series': self.field_series[zone_id]}
+
+    def pixel(self, query):
+        """(row, col) from ?row=&col=, or from ?lon=&lat= (WGS84) through the grid transform."""
+        if 'row' in query and 'col' in query:
+            row, col = int(query['row']), int(query['col'])
+        elif 'lon' in query and 'lat' in query:
+            x, y = float(query['lon']), float(query['lat'])
+            if not (math.isfinite(x) and math.isfinite(y)):
+                raise ValueError(f"lon and lat must be finite, got {query['lon']!r}, {query['lat']!r}")
+            if self.crs and not rasterio.crs.CRS.from_user_input(self.crs).is_geographic:
+                from rasterio.warp import transform as warp
+                xs, ys = warp('EPSG:4326', self.crs, [x], [y])
+                x, y = xs[0], ys[0]
+            col, row = (math.floor(v) for v in ~self.transform * (x, y))
+        else:
+            raise ValueError('Pass row and col, or lon and lat')
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            raise ValueError(f"Pixel ({row}, {col}) is outside the {self.height}x{self.width} grid")
+        return row, col
+
+    def timeseries(self, query):
+        row, col = self.pixel(query)
+        risk = np.unpackbits(np.asarray(self.bits[row, col]))[:len(self.dates)]
+        lon, lat = self.transform * (col + 0.5, row + 0.5)
+        return {
+            'row': row, 'col': col, 'x': lon, 'y': lat,
+            'dates': self.dates,
+            'risk': risk.tolist(),
+            'risk_dates': int(risk.sum()),
+            'forecast': int(self.forecast[row, col]) if self.forecast is not None else None,
+        }
+
+    def latest_forecast(self, query):
+        if self.manifest['forecast'] is None:
+            raise KeyError('No forecast raster (write one with `terra predict`)')
+        result = dict(self.manifest['forecast'])
+        if 'lon' in query or 'row' in query:
+            row, col = self.pixel(query)
+            result.update(row=row, col=col,
+                          value=int(self.forecast[row, col]) if self.forecast is not None else None)
+        return result
+
+    def route(self, path):
+        """(handler, extra args) for a request path, or None."""
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        static = {'health': self.health, 'summary': self.summary, 'fields': self.fields_list,
+                  'timeseries': self.timeseries, 'forecast': self.latest_forecast}
+        if len(parts) == 1 and parts[0] in static:
+            return static[parts[0]], ()
+        if len(parts) == 2 and parts[0] == 'fields':
+            return self.field, (parts[1],)
+        return None
+
+    def response(self, path, query):
+        """(status, body, gzipped body or None, etag), from the LRU when the same request was answered before."""
+        self.refresh()
+        key = (self.version, path, tuple(sorted(query.items())))
+        with self.lock:
+            if key in self.responses:
+                self.responses.move_to_end(key)
+                self.hits += 1
+                return self.responses[key]
+            self.misses += 1
+
+        target = self.route(path)
+        try:
+            if target is None:
+                raise LookupError(f"Unknown endpoint {path}")
+            status, payload = 200, target[0](query, *target[1])
+        except (KeyError, LookupError) as e:
+            status, payload = 404, {'error': str(e.args[0]) if e.args else str(e)}
+        except (ValueError, OverflowError) as e:
+            status, payload = 400, {'error': str(e)}
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        zipped = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        entry = (status, body, zipped, '"' + hashlib.md5(body).hexdigest() + '"')
+        if status == 200 and target[0] != self.health:
+            with self.lock:
+                self.responses[key] = entry
+                while len(self.responses) > self.cache_size:
+                    self.responses.popitem(last=False)
+        return entry
+
+
+# ------------------- HTTP -------------------
+class RiskAPIHandler(BaseHTTPRequestHandler):
+    """JSON handler with ETag revalidation (304) and gzip when the client accepts it."""
+    store = None
+    max_age = 60
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'ETag')
+        super().end_headers()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        status, body, zipped, etag = self.store.response(url.path, query)
+        if status == 200 and etag in (t.strip() for t in self.headers.get('If-None-Match', '').split(',')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        if zipped is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = zipped
+            self.send_response(status)
+            self.send_header('Content-Encoding', 'gzip')
+        else:
+            self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if status == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f'public, max-age={self.max_age}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(store, port=8001):
+    handler = type('Handler', (RiskAPIHandler,), {'store': store})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    print(f"[INFO] Risk API for {len(store.dates)} dates at http://127.0.0.1:{port}/"
+          "{summary,fields,fields/<id>,timeseries,forecast,health}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve risk summaries, field stats, pixel time series and the forecast over local HTTP")
+    parser.add_argument('--work_dir', type=str, default='pipeline_outputs', help='pipeline_runner work directory')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Aggregate directory (default: <work_dir>/api_cache)')
+    parser.add_argument('--forecast', type=str, default='future_pest_risk_prediction.tif')
+    parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617],
+                        help='Grid bounds for masks without georeferencing: min_lon min_lat max_lon max_lat')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--refresh', type=float, default=30.0, help='Seconds between checks for new pipeline outputs')
+    parser.add_argument('--cache_size', type=int, default=256, help='Encoded responses kept in memory')
+    parser.add_argument('--build_only', action='store_true', help='Precompute the aggregates and exit')
+    args = parser.parse_args()
+    if args.build_only:
+        build_aggregates(args.work_dir, args.cache_dir or os.path.join(args.work_dir, 'api_cache'), args.forecast,
+                         args.bbox, force=True)
+        return
+    serve(RiskStore(args.work_dir, args.cache_dir, args.forecast, args.bbox, args.refresh, args.cache_size), args.port)
+
+
+if __name__ == '__main__':
+    main()
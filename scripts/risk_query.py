@@ -0,0 +1,161 @@
+import os
+import json
+import math
+import time
+import argparse
+import numpy as np
+import rasterio
+from rasterio.features import geometry_mask, bounds as geometry_bounds
+from rasterio.windows import Window, transform as window_transform
+from rasterio.warp import transform_geom
+
+from raster_preview import mask_grid, pixel_area_m2
+from tracing import span
+
+SEQ_LENGTH = 10
+_models = {}
+
+
+def get_model(model_path):
+    """Keras checkpoint, loaded once per process and reused by later queries."""
+    if model_path not in _models:
+        from tensorflow.keras.models import load_model
+        _models[model_path] = load_model(model_path)
+    return _models[model_path]
+
+
+def latest_masks(mask_dir, n):
+    files = sorted(f for f in os.listdir(mask_dir) if f.startswith('refined_pest_mask_') and f.endswith('.tif'))
+    if len(files) < n:
+        raise ValueError(f"Need {n} mask dates in {mask_dir}, found {len(files)}")
+    return [os.path.join(mask_dir, f) for f in files[-n:]]
+
+
+def geometry_window(geom_bounds, transform, width, height):
+    """Smallest pixel window covering the bounds through the inverse affine transform, or None if outside."""
+    min_x, min_y, max_x, max_y = geom_bounds
+    inv = ~transform
+    cols, rows = zip(*(inv * (x, y) for x in (min_x, max_x) for y in (min_y, max_y)))
+    c0, c1 = max(0, math.floor(min(cols))), min(width, math.ceil(max(cols)))
+    r0, r1 = max(0, math.floor(min(rows))), min(height, math.ceil(max(rows)))
+    if c0 >= c1 or r0 >= r1:
+        return None
+    return Window(c0, r0, c1 - c0, r1 - r0)
+
+
+def as_geometry(roi):
+    """GeoJSON geometry from a geometry, a Feature, or a (min_lon, min_lat, max_lon, max_lat) bbox."""
+    if isinstance(roi, dict):
+        return roi.get('geometry', roi)
+    min_x, min_y, max_x, max_y = roi
+    return {'type': 'Polygon', 'coordinates': [[(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y), (min_x, min_y)]]}
+
+
+def query_risk(roi, mask_dir, model=None, model_path=None, seq_length=SEQ_LENGTH, threshold=0.5, bbox=None,
+               roi_crs='EPSG:4326', return_probabilities=False):
+    """
+    Forecast risk for one field or bbox: reads only the ROI window of the last
+    seq_length masks and runs the LSTM on the pixels inside the geometry.
+    `model` is anything with predict(X) (a Keras model or a serving client);
+    otherwise model_path is loaded once per process.
+    """
+    start = time.perf_counter()
+    files = latest_masks(mask_dir, seq_length)
+    transform, width, height, crs = mask_grid(files[-1], bbox)
+    geom = as_geometry(roi)
+    if crs is not None and str(crs) != str(roi_crs):
+        geom = transform_geom(roi_crs, crs, geom)
+
+    window = geometry_window(geometry_bounds(geom), transform, width, height)
+    if window is None:
+        raise ValueError("ROI does not overlap the raster")
+    win_transform = window_transform(window, transform)
+    shape = (window.height, window.width)
+    inside = geometry_mask([geom], shape, win_transform, invert=True)
+    if not inside.any():
+        # Fields smaller than a pixel: take every pixel they touch
+        inside = geometry_mask([geom], shape, win_transform, invert=True, all_touched=True)
+
+    with span('query.read', cat='io', window=f"{window.width}x{window.height}"):
+        stack = np.empty((seq_length,) + shape, dtype=np.float32)
+        for i, f in enumerate(files):
+            with rasterio.open(f) as src:
+                stack[i] = src.read(1, window=window)
+
+    X = stack[:, inside].T.reshape(-1, seq_length, 1)
+    model = model if model is not None else get_model(model_path)
+    with span('query.predict', cat='tensorflow', samples=len(X)):
+        probs = np.asarray(model.predict(X, verbose=0), dtype=np.float32).reshape(-1)
+
+    row_area = pixel_area_m2(transform, height, crs)[window.row_off:window.row_off + window.height]
+    pixel_ha = np.broadcast_to(row_area[:, None], shape)[inside] / 1e4
+    result = {
+        'pixels': int(inside.sum()),
+        'hectares': float(pixel_ha.sum()),
+        'window': [window.col_off, window.row_off, window.width, window.height],
+        'dates': [os.path.basename(f)[len('refined_pest_mask_'):-4] for f in files],
+        'current_risk_pct': float(stack[-1][inside].mean() * 100),
+        'forecast_risk_pct': float((probs > threshold).mean() * 100),
+        'forecast_risk_ha': float(pixel_ha[probs > threshold].sum()),
+        'mean_probability': float(probs.mean()),
+        'p90_probability': float(np.percentile(probs, 90)),
+        'max_probability': float(probs.max()),
+    }
+    if return_probabilities:
+        grid = np.full(shape, np.nan, dtype=np.float32)
+        grid[inside] = probs
+        result['probabilities'] = grid
+        result['transform'] = win_transform
+        result['crs'] = crs
+    result['latency_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def save_probabilities(result, out_tif):
+    grid = result['probabilities']
+    with rasterio.open(out_tif, 'w', driver='GTiff', height=grid.shape[0], width=grid.shape[1], count=1,
+                       dtype='float32', crs=result['crs'], transform=result['transform'], nodata=np.nan) as dst:
+        dst.write(grid, 1)
+    print(f"[INFO] Forecast probabilities saved to {out_tif}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast pest risk for a field or bbox from the latest masks")
+    parser.add_argument('--mask_dir', type=str, default='normalized/PestRefinedData')
+    parser.add_argument('--model', type=str, required=True, help='Keras .h5 checkpoint')
+    parser.add_argument('--server', type=str, default=None,
+                        help='Send predictions to a running model_server (host:port or socket path) instead of loading the model')
+    roi = parser.add_mutually_exclusive_group(required=True)
+    roi.add_argument('--roi_bbox', nargs=4, type=float, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'))
+    roi.add_argument('--geojson', type=str, help='Geometry, Feature or FeatureCollection (one answer per feature)')
+    parser.add_argument('--seq_length', type=int, default=SEQ_LENGTH)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617],
+                        help='Grid bounds for masks without georeferencing')
+    parser.add_argument('--output', type=str, default=None, help='GeoTIFF of forecast probabilities (single ROI)')
+    args = parser.parse_args()
+
+    if args.geojson:
+        with open(args.geojson) as f:
+            content = json.load(f)
+        rois = content['features'] if content.get('type') == 'FeatureCollection' else [content]
+    else:
+        rois = [args.roi_bbox]
+    model = None
+    if args.server:
+        from model_server import ModelClient
+        model = ModelClient(args.server, args.model)
+    for i, roi in enumerate(rois):
+        result = query_risk(roi, args.mask_dir, model=model, model_path=args.model, seq_length=args.seq_length,
+                            threshold=args.threshold, bbox=args.bbox, return_probabilities=bool(args.output))
+        if args.output and len(rois) == 1:
+            save_probabilities(result, args.output)
+        for key in ('probabilities', 'transform', 'crs'):
+            result.pop(key, None)
+        if isinstance(roi, dict):
+            result['id'] = roi.get('id', (roi.get('properties') or {}).get('id', i))
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
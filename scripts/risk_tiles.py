@@ -0,0 +1,312 @@
+import os
+import io
+import math
+import argparse
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import numpy as np
+import rasterio
+from rasterio.transform import array_bounds
+from PIL import Image
+
+from raster_preview import mask_grid
+from tracing import traced
+
+TILE_SIZE = 256
+
+
+# ------------------- TILE MATH -------------------
+def lonlat_to_tile(lon, lat, z):
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_pixel_lonlat(x, y, z):
+    """Longitudes of the tile's pixel columns and latitudes of its pixel rows (pixel centres)."""
+    n = 2 ** z
+    offsets = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lons = (x + offsets) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+    return lons, lats
+
+
+def tiles_for_bounds(bounds, z):
+    west, south, east, north = bounds
+    x0, y0 = lonlat_to_tile(west, north, z)
+    x1, y1 = lonlat_to_tile(east, south, z)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+# ------------------- RENDERING -------------------
+def mask_palette():
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[1:] = (220, 20, 60, 180)  # any non-zero class drawn in red
+    return lut
+
+
+def probability_palette():
+    """Transparent at 0, yellow to red as probability rises."""
+    v = np.linspace(0, 1, 256)
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[:, 0] = 255
+    lut[:, 1] = (220 * (1 - v)).astype(np.uint8)
+    lut[:, 2] = 0
+    lut[:, 3] = (200 * np.clip(v * 2, 0, 1)).astype(np.uint8)
+    lut[0, 3] = 0
+    return lut
+
+
+_raster = {}
+
+
+def raster_grid(raster_path, bbox=None):
+    """(transform, width, height, crs), with the bbox fallback for masks written without georeferencing."""
+    grid = mask_grid(raster_path, bbox)
+    if grid[0].is_identity:
+        raise ValueError(f"{raster_path} has no georeferencing; pass the AOI bbox")
+    return grid
+
+
+def _init_worker(raster_path, kind, bbox=None):
+    with rasterio.open(raster_path) as src:
+        data = src.read(1)
+    _raster['transform'] = raster_grid(raster_path, bbox)[0]
+    if kind == 'probability':
+        data = np.nan_to_num(data.astype(np.float32), nan=0.0)
+        data = (np.clip(data, 0, 1) * 255).astype(np.uint8)
+    else:
+        data = data.astype(np.uint8)
+    _raster['data'] = data
+    _raster['lut'] = probability_palette() if kind == 'probability' else mask_palette()
+
+
+def _reduction_factor(t, height, z):
+    """
+    Source pixels per reduced pixel at zoom z: enough that a reduced pixel is at
+    least one tile pixel wide and tall, so nearest sampling cannot step over it.
+    Mercator tile pixels are shortest in latitude away from the equator, so the
+    height uses the raster's latitude closest to it.
+    """
+    tile_lon = 360.0 / (2 ** z * TILE_SIZE)
+    north, south = t.f, t.f + t.e * height
+    lat = 0.0 if south <= 0 <= north else min(abs(north), abs(south))
+    tile_lat = tile_lon * math.cos(math.radians(lat))
+    return max(math.ceil(tile_lon / abs(t.a)), math.ceil(tile_lat / abs(t.e)), 1)
+
+
+def _level_for_zoom(z, raster=_raster):
+    """
+    Block-max reduced copy of the raster for zooms where one tile pixel covers
+    several source pixels, so small hotspots survive nearest sampling.
+    """
+    t = raster['transform']
+    data = raster['data']
+    factor = _reduction_factor(t, data.shape[0], z)
+    if factor < 2:
+        return data, t
+    if factor not in raster:
+        h, w = data.shape
+        ph, pw = -h % factor, -w % factor
+        padded = np.pad(data, ((0, ph), (0, pw)))
+        reduced = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).max(axis=(1, 3))
+        raster[factor] = (reduced, t * t.scale(factor, factor))
+    return raster[factor]
+
+
+def render_tile(x, y, z, raster=_raster):
+    """Nearest-neighbour sample the EPSG:4326 raster onto a Web-Mercator tile. None if empty."""
+    data, t = _level_for_zoom(z, raster)
+    lons, lats = tile_pixel_lonlat(x, y, z)
+    cols = np.floor((lons - t.c) / t.a).astype(np.int64)
+    rows = np.floor((lats - t.f) / t.e).astype(np.int64)
+    col_ok = (cols >= 0) & (cols < data.shape[1])
+    row_ok = (rows >= 0) & (rows < data.shape[0])
+    if not col_ok.any() or not row_ok.any():
+        return None
+    tile = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+    tile[np.ix_(row_ok, col_ok)] = data[np.ix_(rows[row_ok], cols[col_ok])]
+    if not tile.any():
+        return None
+    return raster['lut'][tile]
+
+
+def native_zoom(transform, height):
+    """First zoom at which tiles sample the raster without reducing it."""
+    z = 0
+    while z < 24 and _reduction_factor(transform, height, z) > 1:
+        z += 1
+    return z
+
+
+def check_coverage(transform, width, height, min_zoom=10, probes=64, seed=0):
+    """
+    Plant single risk pixels on the grid (corners plus random positions) and
+    render each one at every zoom from min_zoom up to native resolution.
+    Returns the (row, col, z) probes whose pixel did not show on any tile.
+    """
+    rng = np.random.default_rng(seed)
+    cells = [(0, 0), (0, width - 1), (height - 1, 0), (height - 1, width - 1)]
+    cells += list(zip(rng.integers(0, height, probes), rng.integers(0, width, probes)))
+    max_zoom = max(native_zoom(transform, height), min_zoom)
+    missing = []
+    for row, col in cells:
+        data = np.zeros((height, width), dtype=np.uint8)
+        data[row, col] = 1
+        probe = {'transform': transform, 'data': data, 'lut': mask_palette()}
+        west, north = transform * (col, row)
+        east, south = transform * (col + 1, row + 1)
+        for z in range(min_zoom, max_zoom + 1):
+            tiles = tiles_for_bounds((west, south, east, north), z)
+            if all(render_tile(x, y, z, probe) is None for x, y in tiles):
+                missing.append((int(row), int(col), z))
+    return missing
+
+
+def render_tiles(tiles, out_dir, fmt):
+    written = 0
+    for x, y, z in tiles:
+        rgba = render_tile(x, y, z)
+        if rgba is None:
+            continue
+        path = os.path.join(out_dir, str(z), str(x), f"{y}.{fmt}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.fromarray(rgba, mode='RGBA').save(path, format='PNG' if fmt == 'png' else 'WEBP', lossless=True)
+        written += 1
+    return written
+
+
+@traced('tiles.pyramid')
+def build_pyramid(raster_path, out_dir, min_zoom=10, max_zoom=16, kind='mask', fmt='png', workers=4, chunk=64,
+                  bbox=None):
+    """
+    Render a raster into out_dir/{z}/{x}/{y}.<fmt>, skipping tiles with no risk pixels.
+    Masks without georeferencing (as normalize writes them) are placed on bbox.
+    """
+    transform, width, height, _ = raster_grid(raster_path, bbox)
+    all_tiles = [(x, y, z) for z in range(min_zoom, max_zoom + 1)
+                 for x, y in tiles_for_bounds(array_bounds(height, width, transform), z)]
+    chunks = [all_tiles[i:i + chunk] for i in range(0, len(all_tiles), chunk)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(raster_path, kind, bbox)) as pool:
+        written = sum(pool.map(render_tiles, chunks, [out_dir] * len(chunks), [fmt] * len(chunks)))
+    print(f"[INFO] {raster_path}: {written}/{len(all_tiles)} non-empty tiles written to {out_dir}")
+    return written
+
+
+# ------------------- TILE SERVER -------------------
+TILE_TYPES = {'.png': 'image/png', '.webp': 'image/webp'}
+
+
+def _empty_tile_bytes(fmt='PNG'):
+    buf = io.BytesIO()
+    Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0)).save(buf, format=fmt, lossless=True)
+    return buf.getvalue()
+
+
+class TileRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static tile handler with HTTP caching: ETag/Last-Modified, 304 on
+    revalidation, and a shared transparent tile for skipped empty tiles.
+    """
+    max_age = 86400
+    empty_tiles = {'.png': _empty_tile_bytes('PNG'), '.webp': _empty_tile_bytes('WEBP')}
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        ext = os.path.splitext(path)[1].lower()
+        if not os.path.isfile(path):
+            if ext in self.empty_tiles:
+                self.send_response(200)
+                self.send_header('Content-Type', TILE_TYPES[ext])
+                self.send_header('Content-Length', str(len(self.empty_tiles[ext])))
+                self.send_header('Cache-Control', f'public, max-age={self.max_age}')
+                self.end_headers()
+                self.wfile.write(self.empty_tiles[ext])
+                return
+            return super().do_GET()
+
+        st = os.stat(path)
+        etag = '"' + hashlib.md5(f"{st.st_size}-{st.st_mtime_ns}".encode()).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', TILE_TYPES.get(ext) or self.guess_type(path))
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+        self.send_header('Cache-Control', f'public, max-age={self.max_age}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(tiles_dir, port=8000):
+    handler = lambda *a, **kw: TileRequestHandler(*a, directory=tiles_dir, **kw)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    print(f"[INFO] Serving tiles from {tiles_dir} at http://127.0.0.1:{port}/<date>/{{z}}/{{x}}/{{y}}.<png|webp>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render risk rasters to XYZ tiles and serve them locally")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Render tile pyramids')
+    build.add_argument('--input_folder', type=str, default='/Volumes/SSD/Proj_Terra/data/normalized/PestRefinedData', help='Folder with mask or probability TIFFs')
+    build.add_argument('--pattern', type=str, default='refined_pest_mask_*.tif')
+    build.add_argument('--kind', choices=['mask', 'probability'], default='mask')
+    build.add_argument('--tiles_dir', type=str, default='risk_tiles')
+    build.add_argument('--min_zoom', type=int, default=10)
+    build.add_argument('--max_zoom', type=int, default=16)
+    build.add_argument('--format', choices=['png', 'webp'], default='png')
+    build.add_argument('--workers', type=int, default=4)
+    build.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617],
+                       help='Grid bounds for masks without georeferencing: min_lon min_lat max_lon max_lat')
+    check = sub.add_parser('check', help='Verify a single risk pixel shows at every zoom up to native resolution')
+    check.add_argument('--raster', type=str, required=True, help='Mask or probability TIFF whose grid is checked')
+    check.add_argument('--min_zoom', type=int, default=10)
+    check.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617],
+                       help='Grid bounds for masks without georeferencing: min_lon min_lat max_lon max_lat')
+    srv = sub.add_parser('serve', help='Serve a tile folder over HTTP')
+    srv.add_argument('--tiles_dir', type=str, default='risk_tiles')
+    srv.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.tiles_dir, args.port)
+        return
+    if args.command == 'check':
+        transform, width, height, _ = raster_grid(args.raster, args.bbox)
+        missing = check_coverage(transform, width, height, args.min_zoom)
+        top = max(native_zoom(transform, height), args.min_zoom)
+        if missing:
+            for row, col, z in missing:
+                print(f"[ERROR] Risk pixel ({row}, {col}) missing at z{z}")
+            raise SystemExit(1)
+        print(f"[INFO] Single risk pixels show at every zoom z{args.min_zoom}-z{top} on the {width}x{height} grid")
+        return
+    for raster_path in sorted(Path(args.input_folder).glob(args.pattern)):
+        date = raster_path.stem.split('_')[-1]
+        build_pyramid(str(raster_path), os.path.join(args.tiles_dir, date), args.min_zoom, args.max_zoom,
+                      args.kind, args.format, args.workers, bbox=args.bbox)
+
+
+if __name__ == '__main__':
+    main()
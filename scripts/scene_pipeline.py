@@ -0,0 +1,113 @@
+import os
+import argparse
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+from tqdm import tqdm
+
+from cloud_masking import cloud_mask
+from ProcessingImage import mask_and_calculate_indices, save_geotiff
+from normalize import normalize_index_array
+from mask_Anomaly import refine_pest_mask, write_raster
+from tracing import traced, annotate
+
+ARTIFACTS = ['georef', 'cloud_masked', 'indices', 'normalized', 'mask']
+INDEX_NAMES = ['NDVI', 'EVI', 'NDWI']
+
+
+@traced('scene')
+def process_scene(raw_path, output_base, bbox, size, crs='EPSG:4326', keep=('mask',)):
+    """
+    Run one raw acquisition from bands to refined pest mask in memory.
+
+    Equivalent to georeferencingfiles -> cloud_masking -> ProcessingImage ->
+    normalize -> mask_Anomaly, but the scene is decoded once and only the
+    artifacts listed in `keep` are written, using the same folder layout as
+    the standalone scripts.
+    """
+    file_name = os.path.basename(raw_path)
+    name = os.path.splitext(file_name)[0]
+    annotate(date=name)
+
+    with rasterio.open(raw_path) as src:
+        image = src.read()
+        profile = src.profile
+
+    # Georeferencing: only the profile changes
+    transform = from_bounds(bbox[0], bbox[1], bbox[2], bbox[3], size[0], size[1])
+    profile.update(driver='GTiff', height=image.shape[1], width=image.shape[2],
+                   count=image.shape[0], crs=crs, transform=transform)
+    if 'georef' in keep:
+        out_dir = os.path.join(output_base, 'georef')
+        os.makedirs(out_dir, exist_ok=True)
+        with rasterio.open(os.path.join(out_dir, file_name), 'w', **profile) as dst:
+            dst.write(image)
+
+    # Cloud masking (same band choice as cloud_masking.py)
+    blue_band = 2 if image.shape[0] >= 3 else 0
+    swir_band = 4 if image.shape[0] > 4 else None
+    cloud_mask_arr = cloud_mask(image, blue_band, swir_band)
+    nodata_val = profile.get('nodata', 0) or 0
+    image[:, cloud_mask_arr] = nodata_val
+    image = image.astype(np.float32, copy=False)
+    profile.update(dtype=rasterio.float32)
+    if 'cloud_masked' in keep:
+        out_dir = os.path.join(output_base, 'cloud_masked')
+        os.makedirs(out_dir, exist_ok=True)
+        with rasterio.open(os.path.join(out_dir, file_name), 'w', **profile) as dst:
+            dst.write(image)
+
+    # Spectral indices
+    indices = dict(zip(INDEX_NAMES, mask_and_calculate_indices(image)))
+    del image
+    if 'indices' in keep:
+        out_dir = os.path.join(output_base, 'index_outputs', name)
+        os.makedirs(out_dir, exist_ok=True)
+        for idx, data in indices.items():
+            save_geotiff(data, os.path.join(out_dir, f"{name}_{idx}.tif"), profile.copy(), transform, crs)
+
+    # 8-bit normalization
+    normalized = {idx: normalize_index_array(data, f"{name}_{idx}") for idx, data in indices.items()}
+    del indices
+    meta = {
+        'driver': 'GTiff', 'height': profile['height'], 'width': profile['width'],
+        'count': 1, 'dtype': rasterio.uint8, 'crs': crs, 'transform': transform,
+    }
+    if 'normalized' in keep:
+        out_dir = os.path.join(output_base, 'normalized', name)
+        os.makedirs(out_dir, exist_ok=True)
+        for idx, data in normalized.items():
+            write_raster(data, meta.copy(), os.path.join(out_dir, f"{name}_{idx}.tif"))
+
+    # Anomaly detection and refined mask
+    refined_pest_mask = refine_pest_mask(normalized['NDVI'], normalized['EVI'], normalized['NDWI'])
+    if 'mask' in keep:
+        out_dir = os.path.join(output_base, 'normalized', 'PestRefinedData')
+        os.makedirs(out_dir, exist_ok=True)
+        save_path = os.path.join(out_dir, f'refined_pest_mask_{name}.tif')
+        write_raster(refined_pest_mask, meta.copy(), save_path)
+        print(f'Saved refined pest/disease risk mask: {save_path}')
+    return refined_pest_mask, meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fused in-memory scene pipeline: raw bands -> refined pest mask")
+    parser.add_argument('--raw_dir', type=str, default='tanjavur_sentinel_downloads', help='Folder with raw Sentinel-2 TIFFs')
+    parser.add_argument('--output_dir', type=str, default='pipeline_outputs', help='Base folder for kept artifacts')
+    parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617], help='Bounding box: min_lon min_lat max_lon max_lat')
+    parser.add_argument('--size', nargs=2, type=int, default=[2023, 2058], help='Image size: width height')
+    parser.add_argument('--crs', type=str, default='EPSG:4326')
+    parser.add_argument('--keep', nargs='+', choices=ARTIFACTS, default=['mask'], help='Artifacts to write to disk')
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.raw_dir)
+                   if (f.endswith('.tif') or f.endswith('.tiff')) and not f.startswith('._'))
+    for file in tqdm(files, desc="Processing scenes"):
+        try:
+            process_scene(os.path.join(args.raw_dir, file), args.output_dir, args.bbox, args.size, args.crs, args.keep)
+        except Exception as e:
+            print(f"Error processing {file}: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import re
+import sqlite3
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.warp import transform as warp_transform
+from tqdm import tqdm
+
+from raster_preview import mask_grid
+from sensor_rollups import METRICS, RESOLUTIONS
+
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def load_nodes(nodes_csv):
+    """Node positions: CSV with node_name, lon, lat (EPSG:4326)."""
+    nodes = pd.read_csv(nodes_csv)
+    missing = {'node_name', 'lon', 'lat'} - set(nodes.columns)
+    if missing:
+        raise ValueError(f"{nodes_csv} is missing columns: {sorted(missing)}")
+    return nodes[['node_name', 'lon', 'lat']].reset_index(drop=True)
+
+
+def nodes_to_pixels(nodes, transform, width, height, crs=None):
+    """
+    Map node coordinates to raster row/col and pixel_id (row-major, as in
+    pixel_timeseries.csv) through the inverse affine transform, for all
+    nodes at once. Nodes outside the raster are dropped with a warning.
+    """
+    xs, ys = nodes['lon'].to_numpy(float), nodes['lat'].to_numpy(float)
+    if crs is not None and str(crs) != 'EPSG:4326':
+        xs, ys = (np.asarray(v) for v in warp_transform('EPSG:4326', crs, xs, ys))
+    cols, rows = ~transform * (xs, ys)
+    rows, cols = np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    if not inside.all():
+        print(f"[WARN] {int((~inside).sum())} node(s) fall outside the raster: "
+              f"{', '.join(nodes['node_name'][~inside])}")
+    out = nodes[inside].copy()
+    out['row'], out['col'] = rows[inside], cols[inside]
+    out['pixel_id'] = out['row'] * width + out['col']
+    return out.reset_index(drop=True)
+
+
+def neighborhood_indices(rows, cols, radius, height, width):
+    """(N, K) flat indices of each node's (2r+1)^2 window, with -1 where the window leaves the raster."""
+    offsets = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(offsets, offsets, indexing='ij')
+    rr = rows[:, None] + dy.ravel()[None, :]
+    cc = cols[:, None] + dx.ravel()[None, :]
+    valid = (rr >= 0) & (rr < height) & (cc >= 0) & (cc < width)
+    return np.where(valid, rr * width + cc, -1)
+
+
+def acquisition_time(date_name, hour=5.0):
+    """Epoch seconds of an acquisition from a mask/date name containing YYYY-MM-DD."""
+    match = DATE_PATTERN.search(date_name)
+    if match is None:
+        return None
+    return pd.Timestamp(match.group(0), tz='UTC').timestamp() + hour * 3600
+
+
+def sample_masks(mask_dir, nodes, radius=1, hour=5.0, bbox=None):
+    """
+    Per-date pixel values for every node: centre pixel risk and the risk
+    fraction over its neighborhood. One vectorized gather per date.
+    Masks without georeferencing (as normalize writes them) are placed on bbox.
+    Returns (DataFrame, meta).
+    """
+    files = sorted(Path(mask_dir).glob('refined_pest_mask_*.tif'))
+    if not files:
+        raise FileNotFoundError(f"No mask files found in {mask_dir}")
+    transform, width, height, crs = mask_grid(files[0], bbox)
+    if transform.is_identity:
+        raise ValueError(f"{files[0].name} has no georeferencing; pass the AOI bbox to place the nodes on it")
+    meta = {'transform': transform, 'width': width, 'height': height, 'crs': crs}
+    pixels = nodes_to_pixels(nodes, meta['transform'], meta['width'], meta['height'], meta['crs'])
+    neigh = neighborhood_indices(pixels['row'].to_numpy(), pixels['col'].to_numpy(),
+                                 radius, meta['height'], meta['width'])
+    valid = neigh >= 0
+    centre = pixels['pixel_id'].to_numpy()
+
+    frames = []
+    for f in tqdm(files, desc="Sampling masks"):
+        t = acquisition_time(f.stem, hour)
+        if t is None:
+            print(f"[WARN] No date in {f.name}, skipping")
+            continue
+        with rasterio.open(f) as src:
+            flat = src.read(1).ravel()
+        window = np.where(valid, flat[np.where(valid, neigh, 0)], 0).astype(np.float32)
+        frame = pixels[['node_name', 'pixel_id', 'row', 'col']].copy()
+        frame['date'] = DATE_PATTERN.search(f.stem).group(0)
+        frame['acquired_at'] = t
+        frame['risk'] = flat[centre]
+        frame['neighborhood_risk'] = window.sum(axis=1) / valid.sum(axis=1)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True), meta
+
+
+def load_rollups(rollup_db, resolution='1d'):
+    """Whole rollup table at one resolution with mean columns; keyed by bucket end."""
+    seconds = RESOLUTIONS[resolution]
+    cols = ', '.join(f"{m}_min, {m}_max, {m}_sum * 1.0 / count AS {m}_mean" for m in METRICS)
+    with sqlite3.connect(rollup_db) as conn:
+        rollups = pd.read_sql_query(f"SELECT node_name, bucket, count, {cols} FROM rollup_{resolution}", conn)
+    # Only buckets that closed before the acquisition are visible to it
+    rollups['bucket_end'] = (rollups.pop('bucket') + seconds).astype(np.float64)
+    return rollups.rename(columns={'count': 'sensor_count'})
+
+
+def fuse(samples, rollups, tolerance_hours=72.0):
+    """
+    As-of join: for each (node, acquisition) take the latest sensor rollup
+    bucket that ended at or before the acquisition, within the tolerance.
+    """
+    left = samples.sort_values('acquired_at')
+    right = rollups.sort_values('bucket_end')
+    joined = pd.merge_asof(left, right, left_on='acquired_at', right_on='bucket_end', by='node_name',
+                           direction='backward', tolerance=tolerance_hours * 3600)
+    joined['sensor_age_h'] = (joined['acquired_at'] - joined['bucket_end']) / 3600
+    return joined.drop(columns=['bucket_end']).sort_values(['node_name', 'acquired_at']).reset_index(drop=True)
+
+
+def build_feature_table(mask_dir, nodes_csv, rollup_db, output, resolution='1d', radius=1,
+                        tolerance_hours=72.0, hour=5.0, bbox=None):
+    nodes = load_nodes(nodes_csv)
+    samples, _ = sample_masks(mask_dir, nodes, radius, hour, bbox)
+    rollups = load_rollups(rollup_db, resolution)
+    table = fuse(samples, rollups, tolerance_hours)
+    unmatched = int(table['sensor_count'].isna().sum())
+    if unmatched:
+        print(f"[WARN] {unmatched} of {len(table)} rows have no sensor rollup within {tolerance_hours} h")
+    if output.endswith('.parquet'):
+        table.to_parquet(output, index=False)
+    else:
+        table.to_csv(output, index=False)
+    print(f"[INFO] Feature table with {len(table)} rows saved to {output}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Join ground-sensor rollups onto satellite risk pixels")
+    parser.add_argument('--mask_dir', type=str, required=True, help='Folder with refined_pest_mask_*.tif')
+    parser.add_argument('--nodes', type=str, required=True, help='CSV with node_name, lon, lat')
+    parser.add_argument('--rollups', type=str, default='sensor_rollups.db', help='sensor_rollups SQLite store')
+    parser.add_argument('--resolution', choices=list(RESOLUTIONS), default='1d')
+    parser.add_argument('--radius', type=int, default=1, help='Neighborhood radius in pixels (0 = centre only)')
+    parser.add_argument('--tolerance_hours', type=float, default=72.0, help='Max age of a sensor bucket at acquisition')
+    parser.add_argument('--acquisition_hour', type=float, default=5.0, help='UTC hour of the satellite overpass')
+    parser.add_argument('--output', type=str, default='sensor_features.csv', help='.csv or .parquet')
+    parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617],
+                        help='Grid bounds for masks without georeferencing: min_lon min_lat max_lon max_lat')
+    args = parser.parse_args()
+    build_feature_table(args.mask_dir, args.nodes, args.rollups, args.output, args.resolution, args.radius,
+                        args.tolerance_hours, args.acquisition_hour, args.bbox)
+
+
+if __name__ == '__main__':
+    main()
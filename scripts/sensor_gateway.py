@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import glob
+import struct
+import asyncio
+import sqlite3
+import argparse
+import urllib.request
+from datetime import datetime, timezone
+
+# ------------------- PACKET LAYOUT -------------------
+# struct SensorPacket in Arduni_UNO_Ground_Module.c, as sent by the UNO (AVR, no padding):
+#   int8_t temperature; uint8_t humidity; uint16_t light; uint8_t soil; uint8_t npk; uint8_t uv;
+PACKET_STRUCT = struct.Struct('<bBHBBB')
+# Gateway frame: uint16 node id followed by the raw packet. Serial frames start with SYNC.
+FRAME_STRUCT = struct.Struct('<HbBHBBB')
+SYNC = b'\xaa\x55'
+
+FIELDS = ['node_name', 'temperature', 'humidity', 'light', 'soil_moisture', 'npk', 'uv_index', 'received_at']
+
+
+def node_name(node_id):
+    return f"Node{node_id}"
+
+
+def decode_frame(frame, received_at=None):
+    """
+    Decode and validate one gateway frame. Returns a record dict with the same
+    columns the ESP32 posts to Supabase, or None if the packet is out of range.
+    """
+    node_id, temperature, humidity, light, soil, npk, uv = FRAME_STRUCT.unpack(frame)
+    # Ranges from the UNO firmware: AHT10 -40..85 C, percentages clamped to 0..100, UV scaled 0..25
+    if not (-40 <= temperature <= 85 and humidity <= 100 and soil <= 100 and npk <= 100 and uv <= 25):
+        return None
+    return {
+        'node_name': node_name(node_id),
+        'temperature': temperature,
+        'humidity': humidity,
+        'light': light,
+        'soil_moisture': soil,
+        'npk': npk,
+        'uv_index': uv / 10.0,  # same scaling as the ESP32 ground station
+        'received_at': time.time() if received_at is None else received_at,
+    }
+
+
+def encode_frame(node_id, temperature, humidity, light, soil, npk, uv):
+    return FRAME_STRUCT.pack(node_id, temperature, humidity, light, soil, npk, uv)
+
+
+# ------------------- SINKS -------------------
+class SQLiteSink:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS sensor_data ({', '.join(FIELDS)})")
+
+    def write(self, records):
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO sensor_data VALUES ({', '.join('?' * len(FIELDS))})",
+                [tuple(r[f] for f in FIELDS) for r in records])
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetSink:
+    """One Parquet file per batch under a folder (needs pyarrow)."""
+    def __init__(self, folder):
+        import pyarrow  # noqa: F401
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, records):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pylist(records)
+        pq.write_table(table, os.path.join(self.folder, f"sensor_{time.time_ns()}.parquet"))
+
+    def close(self):
+        pass
+
+
+class RestSink:
+    """Bulk JSON array POST, e.g. to a Supabase/PostgREST table or a local stand-in."""
+    def __init__(self, url, api_key=None, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', 'Prefer': 'return=minimal'}
+        if api_key:
+            self.headers.update({'apikey': api_key, 'Authorization': f'Bearer {api_key}'})
+
+    def write(self, records):
+        rows = [dict(r, received_at=datetime.fromtimestamp(r['received_at'], timezone.utc).isoformat())
+                for r in records]
+        req = urllib.request.Request(self.url, data=json.dumps(rows).encode(), headers=self.headers, method='POST')
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            if resp.status >= 300:
+                raise IOError(f"REST sink returned {resp.status}")
+
+    def close(self):
+        pass
+
+
+class PartialWriteError(IOError):
+    """A MultiSink batch reached some sinks but not others; `failed` holds the indices still owed it."""
+    def __init__(self, failed, errors):
+        super().__init__('; '.join(f"sink {i}: {e}" for i, e in zip(failed, errors)))
+        self.failed = failed
+
+
+class MultiSink:
+    """
+    Writes every batch to several sinks, e.g. raw rows plus rollups. Each sink
+    is tried even if an earlier one fails, and the failures are reported as a
+    PartialWriteError so only those sinks get the batch again on replay.
+    """
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, records, targets=None):
+        failed, errors = [], []
+        for i in (range(len(self.sinks)) if targets is None else targets):
+            try:
+                self.sinks[i].write(records)
+            except Exception as e:
+                failed.append(i)
+                errors.append(e)
+        if failed:
+            raise PartialWriteError(failed, errors)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def make_sink(spec):
+    """sqlite:<path> | parquet:<folder> | rest:<url> | rollup:<path>, comma-separated for several"""
+    if ',' in spec:
+        return MultiSink([make_sink(part) for part in spec.split(',')])
+    kind, _, target = spec.partition(':')
+    if kind == 'rollup':
+        from sensor_rollups import RollupStore
+        return RollupStore(target or 'sensor_rollups.db')
+    if kind == 'sqlite':
+        return SQLiteSink(target or 'sensor_data.db')
+    if kind == 'parquet':
+        return ParquetSink(target or 'sensor_parquet')
+    if kind == 'rest':
+        return RestSink(target, os.environ.get('SUPABASE_API_KEY'))
+    raise ValueError(f"Unknown sink: {spec}")
+
+
+# ------------------- SPOOL -------------------
+class DiskSpool:
+    """
+    Append-only JSON-lines segments holding batches the sink could not accept.
+    Batches owed to only some sinks of a MultiSink carry those sink indices in
+    the segment name (spool_<ns>.sinks-0-2.jsonl).
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def append(self, records, targets=None):
+        suffix = '' if targets is None else '.sinks-' + '-'.join(str(i) for i in targets)
+        path = os.path.join(self.folder, f"spool_{time.time_ns()}{suffix}.jsonl")
+        with open(path + '.tmp', 'w') as f:
+            for r in records:
+                f.write(json.dumps(r) + '\n')
+        os.replace(path + '.tmp', path)
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.folder, 'spool_*.jsonl')))
+
+    def read(self, path):
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @staticmethod
+    def targets(path):
+        """Sink indices a segment is owed to, or None for all of them."""
+        tag = os.path.basename(path)[:-len('.jsonl')].partition('.sinks-')[2]
+        return [int(i) for i in tag.split('-')] if tag else None
+
+
+# ------------------- GATEWAY -------------------
+class SensorGateway:
+    """
+    Buffers decoded packets in a bounded asyncio queue and flushes them to a
+    sink in batches of `batch_size` or every `flush_interval` seconds.
+
+    Backpressure: stream sources (serial) await queue space; datagram sources
+    cannot block, so when the queue is full their packets go straight to the
+    disk spool (or are counted as dropped without one). Failed sink writes
+    are spooled and replayed oldest-first once the sink accepts writes again.
+    """
+    def __init__(self, sink, batch_size=500, flush_interval=2.0, max_queue=50000, spool_dir=None,
+                 on_flush=None):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.spool = DiskSpool(spool_dir) if spool_dir else None
+        self.on_flush = on_flush
+        self.stats = {'received': 0, 'invalid': 0, 'dropped': 0, 'flushed': 0, 'batches': 0,
+                      'spooled': 0, 'replayed': 0, 'sink_errors': 0}
+        self._overflow = []
+        self._stopping = False
+
+    def _decode(self, frame):
+        self.stats['received'] += 1
+        record = decode_frame(frame)
+        if record is None:
+            self.stats['invalid'] += 1
+        return record
+
+    async def put_frame(self, frame):
+        record = self._decode(frame)
+        if record is not None:
+            await self.queue.put(record)
+
+    def put_frame_nowait(self, frame):
+        record = self._decode(frame)
+        if record is None:
+            return
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            if self.spool is None:
+                self.stats['dropped'] += 1
+            else:
+                self._overflow.append(record)
+                if len(self._overflow) >= self.batch_size:
+                    self._spool(self._overflow)
+                    self._overflow = []
+
+    def _spool(self, records, targets=None):
+        self.spool.append(records, targets)
+        self.stats['spooled'] += len(records)
+
+    def _sink_write(self, records, targets=None):
+        if targets is None:
+            self.sink.write(records)
+        else:
+            self.sink.write(records, targets=targets)
+
+    async def _write(self, records, targets=None):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._sink_write, records, targets)
+        if self.on_flush is not None:
+            self.on_flush(records)
+
+    async def _flush(self, batch):
+        try:
+            await self._write(batch)
+            self.stats['flushed'] += len(batch)
+            self.stats['batches'] += 1
+            return True
+        except Exception as e:
+            self.stats['sink_errors'] += 1
+            print(f"[WARN] Sink write failed ({e}); spooling {len(batch)} records")
+            if self.spool is not None:
+                # Sinks that already took the batch must not get it again on replay
+                self._spool(batch, getattr(e, 'failed', None))
+            else:
+                self.stats['dropped'] += len(batch)
+            return False
+
+    async def _replay_spool(self):
+        if self.spool is None:
+            return
+        for path in self.spool.segments():
+            records = self.spool.read(path)
+            try:
+                await self._write(records, self.spool.targets(path))
+            except PartialWriteError as e:
+                # Part of the replay landed: keep the segment for the still-failing sinks only
+                self.spool.append(records, e.failed)
+                os.remove(path)
+                return
+            except Exception:
+                return  # sink still down; retry on the next cycle
+            os.remove(path)
+            self.stats['replayed'] += len(records)
+            self.stats['flushed'] += len(records)
+
+    async def run_flusher(self):
+        sink_ok = True
+        while not (self._stopping and self.queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if self._overflow and self.spool is not None:
+                self._spool(self._overflow)
+                self._overflow = []
+            if sink_ok:
+                await self._replay_spool()
+            if batch:
+                sink_ok = await self._flush(batch)
+            elif not sink_ok:
+                sink_ok = True  # idle cycle: let the spool replay probe the sink again
+
+    async def stop(self):
+        self._stopping = True
+
+    def report(self):
+        s = self.stats
+        print(f"[STATS] received={s['received']} invalid={s['invalid']} flushed={s['flushed']} "
+              f"batches={s['batches']} spooled={s['spooled']} replayed={s['replayed']} "
+              f"dropped={s['dropped']} queue={self.queue.qsize()}")
+
+
+# ------------------- SOURCES -------------------
+class UDPFrameProtocol(asyncio.DatagramProtocol):
+    """Each datagram carries one or more back-to-back gateway frames."""
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def datagram_received(self, data, addr):
+        size = FRAME_STRUCT.size
+        if len(data) % size:
+            self.gateway.stats['invalid'] += 1
+            return
+        for offset in range(0, len(data), size):
+            self.gateway.put_frame_nowait(data[offset:offset + size])
+
+
+async def serve_udp(gateway, host, port):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: UDPFrameProtocol(gateway), local_addr=(host, port))
+    print(f"[INFO] Listening for UDP frames on {host}:{port}")
+    return transport
+
+
+async def read_serial(gateway, device, baudrate=115200):
+    """Read SYNC-prefixed frames from a serial radio bridge (needs pyserial)."""
+    import serial
+    loop = asyncio.get_running_loop()
+    port = serial.Serial(device, baudrate, timeout=0.5)
+    print(f"[INFO] Reading frames from {device} @ {baudrate}")
+    buf = b''
+    while True:
+        buf += await loop.run_in_executor(None, port.read, 256)
+        while True:
+            start = buf.find(SYNC)
+            if start < 0:
+                buf = buf[-1:]
+                break
+            end = start + len(SYNC) + FRAME_STRUCT.size
+            if len(buf) < end:
+                buf = buf[start:]
+                break
+            await gateway.put_frame(buf[start + len(SYNC):end])
+            buf = buf[end:]
+
+
+async def report_loop(gateway, interval):
+    while True:
+        await asyncio.sleep(interval)
+        gateway.report()
+
+
+async def run_gateway(args):
+    sink = make_sink(args.sink)
+    gateway = SensorGateway(sink, args.batch_size, args.flush_interval, args.max_queue, args.spool_dir)
+    tasks = [asyncio.create_task(gateway.run_flusher()), asyncio.create_task(report_loop(gateway, args.report_interval))]
+    transport = None
+    if args.serial:
+        tasks.append(asyncio.create_task(read_serial(gateway, args.serial, args.baudrate)))
+    else:
+        transport = await serve_udp(gateway, args.host, args.port)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if transport is not None:
+            transport.close()
+        sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batching ingestion gateway for ground sensor packets")
+    parser.add_argument('--sink', type=str, default='sqlite:sensor_data.db', help='sqlite:<path> | parquet:<folder> | rest:<url> | rollup:<path>, comma-separated for several')
+    parser.add_argument('--host', type=str, default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9750, help='UDP port for gateway frames')
+    parser.add_argument('--serial', type=str, default=None, help='Serial device instead of UDP, e.g. /dev/ttyUSB0')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--batch_size', type=int, default=500)
+    parser.add_argument('--flush_interval', type=float, default=2.0, help='Max seconds before a partial batch is flushed')
+    parser.add_argument('--max_queue', type=int, default=50000)
+    parser.add_argument('--spool_dir', type=str, default='sensor_spool', help='On-disk spool for sink outages')
+    parser.add_argument('--report_interval', type=float, default=30.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_gateway(args))
+    except KeyboardInterrupt:
+        print("[INFO] Gateway stopped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import json
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+
+METRICS = ['temperature', 'humidity', 'light', 'soil_moisture', 'npk', 'uv_index']
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+
+def parse_time(value):
+    """Epoch seconds from a number or an ISO date/datetime string (UTC if no zone)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+
+
+class RollupStore:
+    """
+    Incrementally maintained min/max/sum/count per metric, node and time
+    bucket at 1-minute, 1-hour and 1-day resolution, stored in SQLite.
+
+    update() folds a batch into every resolution with one UPSERT per touched
+    bucket, so the cost is proportional to the batch, not the history.
+    """
+    def __init__(self, path='sensor_rollups.db'):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        metric_cols = ', '.join(f"{m}_min REAL, {m}_max REAL, {m}_sum REAL" for m in METRICS)
+        for res in RESOLUTIONS:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS rollup_{res} (node_name TEXT, bucket INTEGER, count INTEGER, "
+                f"{metric_cols}, PRIMARY KEY (node_name, bucket)) WITHOUT ROWID")
+        updates = ['count = count + excluded.count']
+        for m in METRICS:
+            updates += [f"{m}_min = min({m}_min, excluded.{m}_min)",
+                        f"{m}_max = max({m}_max, excluded.{m}_max)",
+                        f"{m}_sum = {m}_sum + excluded.{m}_sum"]
+        n_cols = 3 + 3 * len(METRICS)
+        self._upsert = {
+            res: f"INSERT INTO rollup_{res} VALUES ({', '.join('?' * n_cols)}) "
+                 f"ON CONFLICT(node_name, bucket) DO UPDATE SET {', '.join(updates)}"
+            for res in RESOLUTIONS
+        }
+
+    @staticmethod
+    def aggregate(records, seconds):
+        """Partial aggregates for one batch: {(node, bucket): [count, min, max, sum per metric...]}."""
+        groups = {}
+        for r in records:
+            key = (r['node_name'], int(r['received_at'] // seconds * seconds))
+            g = groups.get(key)
+            if g is None:
+                g = [0]
+                for m in METRICS:
+                    v = r[m]
+                    g += [v, v, 0.0]
+                groups[key] = g
+            g[0] += 1
+            for i, m in enumerate(METRICS):
+                v = r[m]
+                j = 1 + 3 * i
+                if v < g[j]:
+                    g[j] = v
+                if v > g[j + 1]:
+                    g[j + 1] = v
+                g[j + 2] += v
+        return groups
+
+    def update(self, records):
+        if not records:
+            return
+        with self.conn:
+            for res, seconds in RESOLUTIONS.items():
+                groups = self.aggregate(records, seconds)
+                self.conn.executemany(self._upsert[res], [(node, bucket, *g) for (node, bucket), g in groups.items()])
+
+    # Sink interface, so the store can sit behind sensor_gateway
+    def write(self, records):
+        self.update(records)
+
+    def close(self):
+        self.conn.close()
+
+    def pick_resolution(self, start, end, max_points):
+        """Finest resolution that returns at most max_points buckets per node."""
+        for res, seconds in sorted(RESOLUTIONS.items(), key=lambda kv: kv[1]):
+            if (end - start) / seconds <= max_points:
+                return res
+        return '1d'
+
+    def query(self, node_name=None, start=0, end=None, resolution=None, max_points=500):
+        """Return rows with per-metric min/max/mean for buckets in [start, end)."""
+        end = end if end is not None else 2 ** 40
+        resolution = resolution or self.pick_resolution(start, end, max_points)
+        cols = ', '.join(f"{m}_min, {m}_max, {m}_sum / count" for m in METRICS)
+        sql = f"SELECT node_name, bucket, count, {cols} FROM rollup_{resolution} WHERE bucket >= ? AND bucket < ?"
+        params = [int(start), int(end)]
+        if node_name:
+            sql += " AND node_name = ?"
+            params.append(node_name)
+        sql += " ORDER BY node_name, bucket"
+        rows = []
+        for row in self.conn.execute(sql, params):
+            out = {'node_name': row[0], 'bucket': row[1], 'count': row[2], 'resolution': resolution}
+            for i, m in enumerate(METRICS):
+                out[f'{m}_min'], out[f'{m}_max'], out[f'{m}_mean'] = row[3 + 3 * i:6 + 3 * i]
+            rows.append(out)
+        return rows
+
+    def backfill(self, raw_db):
+        """
+        Rebuild the rollups from an existing raw sensor_data table (e.g. from
+        sensor_gateway's SQLite sink). Buckets are aggregated inside SQLite and
+        written with INSERT OR REPLACE, so every bucket the raw table covers is
+        recomputed rather than added to: running it twice, or over buckets that
+        live `rollup:` ingestion already counted, gives the same result.
+        """
+        src = sqlite3.connect(raw_db)
+        total = src.execute("SELECT count(*) FROM sensor_data").fetchone()[0]
+        aggregates = ', '.join(f"min({m}), max({m}), sum({m})" for m in METRICS)
+        n_cols = 3 + 3 * len(METRICS)
+        with self.conn:
+            for res, seconds in RESOLUTIONS.items():
+                rows = src.execute(
+                    f"SELECT node_name, CAST(received_at / {seconds} AS INTEGER) * {seconds} AS bucket, count(*), "
+                    f"{aggregates} FROM sensor_data GROUP BY node_name, bucket")
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO rollup_{res} VALUES ({', '.join('?' * n_cols)})", rows)
+        src.close()
+        print(f"[INFO] Rebuilt rollups from {total} raw rows in {raw_db}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-bucketed sensor rollups")
+    parser.add_argument('--db', type=str, default='sensor_rollups.db')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bf = sub.add_parser('backfill', help='Build rollups from a raw sensor_data SQLite table')
+    bf.add_argument('--raw', type=str, default='sensor_data.db')
+    q = sub.add_parser('query', help='Print rollup rows as JSON')
+    q.add_argument('--node', type=str, default=None)
+    q.add_argument('--start', type=str, default='0', help='Epoch seconds or ISO date')
+    q.add_argument('--end', type=str, default=None)
+    q.add_argument('--resolution', choices=list(RESOLUTIONS), default=None, help='Default: finest within --max_points')
+    q.add_argument('--max_points', type=int, default=500)
+    args = parser.parse_args()
+
+    store = RollupStore(args.db)
+    if args.command == 'backfill':
+        store.backfill(args.raw)
+    else:
+        end = parse_time(args.end) if args.end else None
+        rows = store.query(args.node, parse_time(args.start), end, args.resolution, args.max_points)
+        print(json.dumps(rows, indent=2))
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import json
+import math
+import time
+import heapq
+import random
+import socket
+import asyncio
+import argparse
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from sensor_gateway import SensorGateway, RestSink, make_sink, serve_udp, encode_frame
+
+
+# ------------------- VIRTUAL NODES -------------------
+class VirtualNode:
+    """
+    Produces SensorPacket values with a diurnal cycle and per-node offsets,
+    within the ranges the UNO firmware can emit.
+    """
+    def __init__(self, node_id, rng):
+        self.node_id = node_id
+        self.phase = rng.uniform(-1, 1)
+        self.temp_base = rng.uniform(24, 30)
+        self.soil = rng.uniform(30, 70)
+        self.npk = rng.uniform(20, 80)
+        self.rng = rng
+
+    def packet(self, t):
+        day = math.sin(2 * math.pi * ((t / 86400.0) % 1.0) - math.pi / 2 + self.phase * 0.3)
+        daylight = max(day, 0.0)
+        temperature = self.temp_base + 6 * day + self.rng.gauss(0, 0.5)
+        humidity = 70 - 20 * day + self.rng.gauss(0, 2)
+        self.soil = min(max(self.soil + self.rng.gauss(-0.01, 0.2), 0), 100)
+        light = 60000 * daylight + self.rng.uniform(0, 50)
+        uv = 25 * daylight ** 2
+        return encode_frame(
+            self.node_id,
+            int(min(max(temperature, -40), 85)),
+            int(min(max(humidity, 0), 100)),
+            int(min(light, 65535)),
+            int(self.soil),
+            int(min(max(self.npk + self.rng.gauss(0, 1), 0), 100)),
+            int(min(uv, 25)),
+        )
+
+
+# ------------------- STAND-IN ENDPOINT -------------------
+class StandInHandler(BaseHTTPRequestHandler):
+    """Accepts PostgREST-style bulk inserts and only counts rows."""
+    rows = 0
+    latency = 0.0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        with StandInHandler.lock:
+            StandInHandler.rows += len(json.loads(body))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in(port, latency_ms):
+    StandInHandler.latency = latency_ms / 1000.0
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ------------------- LOAD STEP -------------------
+async def send_packets(nodes, rate_hz, jitter, duration, address, time_scale, rng):
+    """
+    Send each node's packets every 1/rate_hz seconds (+/- jitter fraction)
+    for `duration` seconds. Returns the number of packets sent.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    period = 1.0 / rate_hz
+    start = time.monotonic()
+    schedule = [(start + rng.uniform(0, period), i) for i in range(len(nodes))]
+    heapq.heapify(schedule)
+    sent = 0
+    while schedule:
+        due, i = schedule[0]
+        now = time.monotonic()
+        if due > now:
+            await asyncio.sleep(min(due - now, 0.01))
+            continue
+        heapq.heappop(schedule)
+        if due - start >= duration:
+            continue
+        sim_time = time.time() + (now - start) * time_scale
+        sent += 1
+        try:
+            sock.sendto(nodes[i].packet(sim_time), address)
+        except BlockingIOError:
+            pass  # send buffer full: shows up as dropped (sent - flushed)
+        heapq.heappush(schedule, (due + period * (1 + rng.uniform(-jitter, jitter)), i))
+    sock.close()
+    return sent
+
+
+async def run_step(n_nodes, args, sink, port):
+    rng = random.Random(args.seed + n_nodes)
+    nodes = [VirtualNode(i, rng) for i in range(n_nodes)]
+    latencies = []
+    max_queue = [0]
+
+    def on_flush(records):
+        now = time.time()
+        latencies.extend(now - r['received_at'] for r in records)
+
+    gateway = SensorGateway(sink, args.batch_size, args.flush_interval, args.max_queue, None, on_flush)
+    transport = await serve_udp(gateway, '127.0.0.1', port)
+    flusher = asyncio.create_task(gateway.run_flusher())
+
+    async def watch_queue():
+        while True:
+            max_queue[0] = max(max_queue[0], gateway.queue.qsize())
+            await asyncio.sleep(0.05)
+
+    watcher = asyncio.create_task(watch_queue())
+    start = time.monotonic()
+    sent = await send_packets(nodes, args.rate, args.jitter, args.duration, ('127.0.0.1', port),
+                              args.time_scale, rng)
+    send_time = time.monotonic() - start
+    # Drain: let the gateway flush what it already has
+    await asyncio.sleep(args.flush_interval * 2)
+    await gateway.stop()
+    await asyncio.wait_for(flusher, timeout=max(30, args.flush_interval * 10))
+    watcher.cancel()
+    transport.close()
+    await asyncio.sleep(0.1)  # let the socket close before the next step rebinds the port
+
+    flushed = gateway.stats['flushed']
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'nodes': n_nodes,
+        'offered_pps': sent / send_time if send_time else 0.0,
+        'throughput_pps': flushed / send_time if send_time else 0.0,
+        'sent': sent,
+        'flushed': flushed,
+        'dropped': sent - flushed,
+        'p50_ms': float(np.percentile(lat, 50)),
+        'p99_ms': float(np.percentile(lat, 99)),
+        'max_queue': max_queue[0],
+    }
+
+
+def print_row(r):
+    print(f"{r['nodes']:>7} {r['offered_pps']:>10.1f} {r['throughput_pps']:>10.1f} {r['dropped']:>8} "
+          f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_queue']:>9}")
+
+
+async def run_load_test(args):
+    stand_in = None
+    if args.sink == 'standin':
+        stand_in = start_stand_in(args.standin_port, args.standin_latency_ms)
+        sink = RestSink(f"http://127.0.0.1:{args.standin_port}/rest/v1/sensor_data")
+    else:
+        sink = make_sink(args.sink)
+
+    print(f"{'nodes':>7} {'offer/s':>10} {'thru/s':>10} {'dropped':>8} {'p50 ms':>9} {'p99 ms':>9} {'max queue':>9}")
+    results = []
+    for n_nodes in args.nodes:
+        r = await run_step(n_nodes, args, sink, args.port)
+        results.append(r)
+        print_row(r)
+        if r['dropped'] > args.max_drop * max(r['sent'], 1) or r['p99_ms'] > args.max_p99_ms:
+            print(f"[INFO] Saturated at {n_nodes} nodes (drops or p99 over budget)")
+            break
+    sink.close()
+    if stand_in is not None:
+        stand_in.shutdown()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] Results saved to {args.output}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the sensor ingestion path with virtual ground nodes")
+    parser.add_argument('--nodes', nargs='+', type=int, default=[100, 500, 1000, 2000, 5000], help='Node counts to step through')
+    parser.add_argument('--rate', type=float, default=0.1, help='Packets per second per node (firmware: every 10 s)')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Relative jitter on the send period')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per step')
+    parser.add_argument('--time_scale', type=float, default=1.0, help='Simulated seconds per real second for the diurnal cycle')
+    parser.add_argument('--sink', type=str, default='standin', help="'standin' (local REST stand-in) or a sensor_gateway sink spec")
+    parser.add_argument('--standin_port', type=int, default=9751)
+    parser.add_argument('--standin_latency_ms', type=float, default=20.0, help='Artificial per-request latency of the stand-in')
+    parser.add_argument('--port', type=int, default=9750, help='Gateway UDP port')
+    parser.add_argument('--batch_size', type=int, default=500)
+    parser.add_argument('--flush_interval', type=float, default=1.0)
+    parser.add_argument('--max_queue', type=int, default=50000)
+    parser.add_argument('--max_drop', type=float, default=0.01, help='Drop fraction treated as saturation')
+    parser.add_argument('--max_p99_ms', type=float, default=5000.0, help='p99 latency treated as saturation')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON file for results')
+    args = parser.parse_args()
+    asyncio.run(run_load_test(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+from collections import OrderedDict
 import torch
 from torch.utils.data import Dataset
 import numpy as np
@@ -8,12 +9,24 @@ import rasterio
 class TemporalSequenceDataset(Dataset):
     """
     Dataset that returns sequences of images per location in temporal order.
+
+    Every (location, start_date) window is a sample: windows start every `stride`
+    dates and the label is taken `horizon` dates after the last input date
+    (horizon=0 uses the label of the last input date). Decoded frames are kept in
+    a small LRU cache; each DataLoader worker gets its own copy of the dataset,
+    so the cache is per-worker and consecutive windows only read one new frame.
     """
-    def __init__(self, data_base_dir, label_base_dir, sequence_length=5, transform=None):
+    def __init__(self, data_base_dir, label_base_dir, sequence_length=5, transform=None,
+                 stride=1, horizon=0, cache_size=None):
         self.data_base_dir = data_base_dir
         self.label_base_dir = label_base_dir
         self.sequence_length = sequence_length
         self.transform = transform
+        self.stride = max(1, int(stride))
+        self.horizon = max(0, int(horizon))
+        # Enough to hold one window plus the frames the next window adds
+        self.cache_size = cache_size if cache_size is not None else sequence_length + self.stride + 1
+        self._frame_cache = OrderedDict()
 
         # List all sequence folders (assuming naming convention with dates)
         all_folders = sorted([d for d in os.listdir(data_base_dir) if os.path.isdir(os.path.join(data_base_dir, d))])
@@ -24,10 +37,17 @@ class TemporalSequenceDataset(Dataset):
             if loc not in self.locations:
                 self.locations[loc] = []
             self.locations[loc].append(folder)
-        # Filter locations with enough sequence length
-        self.locations = {k: sorted(v) for k, v in self.locations.items() if len(v) >= self.sequence_length}
+        # Filter locations with enough dates for at least one window plus horizon
+        span = self.sequence_length + self.horizon
+        self.locations = {k: sorted(v) for k, v in self.locations.items() if len(v) >= span}
         self.location_keys = list(self.locations.keys())
 
+        # Epoch index: one entry per (location, start position) window
+        self.index = []
+        for loc in self.location_keys:
+            for start in range(0, len(self.locations[loc]) - span + 1, self.stride):
+                self.index.append((loc, start))
+
     def read_indices(self, folder_path):
         ndvi = self.read_geotiff(glob.glob(os.path.join(folder_path, '*NDVI*.tif'))[0])
         evi = self.read_geotiff(glob.glob(os.path.join(folder_path, '*EVI*.tif'))[0])
@@ -45,31 +65,42 @@ class TemporalSequenceDataset(Dataset):
             array = np.nan_to_num(array, nan=0.0)
         return array
 
+    def read_frame(self, folder):
+        """Return the decoded (3, H, W) index tensor for a folder, using the frame cache."""
+        if folder in self._frame_cache:
+            self._frame_cache.move_to_end(folder)
+            return self._frame_cache[folder]
+        img = self.read_indices(os.path.join(self.data_base_dir, folder))
+        if self.cache_size > 0:
+            self._frame_cache[folder] = img
+            while len(self._frame_cache) > self.cache_size:
+                self._frame_cache.popitem(last=False)
+        return img
+
+    def read_label(self, folder, like):
+        label_path = os.path.join(self.label_base_dir, folder, f"{folder}_label.tif")
+        if os.path.exists(label_path):
+            label_array = self.read_geotiff(label_path)
+            return torch.tensor(label_array, dtype=torch.float32).unsqueeze(0)
+        return torch.zeros_like(like[:1])  # fallback
+
     def __len__(self):
-        return len(self.location_keys)
+        return len(self.index)
 
     def __getitem__(self, idx):
-        loc = self.location_keys[idx]
-        seq_folders = self.locations[loc][:self.sequence_length]
+        loc, start = self.index[idx]
+        folders = self.locations[loc]
+        seq_folders = folders[start:start + self.sequence_length]
         images = []
-        labels = []
         for folder in seq_folders:
-            folder_path = os.path.join(self.data_base_dir, folder)
-            img = self.read_indices(folder_path)
+            img = self.read_frame(folder)
             if self.transform:
                 img = self.transform(img)
             images.append(img)
 
-            # Read label for last time step only, or sequence labels if available
-            label_path = os.path.join(self.label_base_dir, folder, f"{folder}_label.tif")
-            if os.path.exists(label_path):
-                label_array = self.read_geotiff(label_path)
-                label_tensor = torch.tensor(label_array, dtype=torch.float32).unsqueeze(0)
-            else:
-                label_tensor = torch.zeros_like(img[:1])  # fallback
-            labels.append(label_tensor)
-
         images = torch.stack(images)  # (seq_len, 3, H, W)
-        labels = labels[-1]  # Using label of last timestamp only; adjust if needed
+        # Label of the last input date, or `horizon` dates after it
+        label_folder = folders[start + self.sequence_length - 1 + self.horizon]
+        labels = self.read_label(label_folder, images[-1])
 
         return images, labels
@@ -0,0 +1,229 @@
+"""
+terra: one entry point for the pest-risk pipeline.
+
+    python terra.py <command> [options]
+
+Only argparse is imported up front; each command imports its module (and
+numpy, rasterio, TensorFlow, geopandas, sentinelhub ...) when it runs, so
+`terra.py --help` stays fast. `terra.py startup` checks that budget.
+"""
+import os
+import sys
+import argparse
+
+# Commands backed by modules that already have an argparse main(): arguments are forwarded unchanged
+FORWARDED = {
+    'timeseries': ('generate_Timeseries', 'Per-pixel time series CSV and risk polygons from refined masks'),
+    'animate': ('pest_Risk_Anim', 'Risk timelapse as GIF, WebP or APNG'),
+    'pipeline': ('pipeline_runner', 'Cached end-to-end pipeline run'),
+    'watch': ('watch_pipeline', 'Process new acquisitions as they arrive'),
+    'tiles': ('risk_tiles', 'Build or serve XYZ risk tiles'),
+    'gateway': ('sensor_gateway', 'Batching ground-sensor ingestion gateway'),
+    'rollups': ('sensor_rollups', 'Time-bucketed sensor rollups'),
+    'fuse': ('sensor_fusion', 'Join sensor rollups onto risk pixels'),
+    'bench': ('benchmark', 'Stage benchmarks on synthetic scenes against a JSON baseline'),
+    'composite': ('composite', 'Cloud-free 10-day or monthly index composites'),
+    'zonal': ('zonal_stats', 'Per-field risk, hectares and mean indices for every date'),
+    'query': ('risk_query', 'Forecast risk for one field or bbox from windowed reads'),
+    'aoi': ('aoi_batch', 'Run many AOIs over one shared worker pool'),
+    'serve': ('model_server', 'Persistent micro-batching LSTM inference worker'),
+    'api': ('risk_api', 'Local HTTP API for risk summaries, fields, pixel series and the forecast'),
+}
+
+HEAVY_MODULES = ['numpy', 'rasterio', 'tensorflow', 'torch', 'geopandas', 'matplotlib', 'sentinelhub', 'pandas']
+# mask_Anomaly.HALO, repeated here so parsing does not import numpy; coarse blocks are whole HALO cells
+ANOMALY_HALO = 8
+
+
+def cmd_download(args):
+    from downloading_dataset import download_all_images
+    download_all_images(args.output_dir, (args.start, args.end))
+
+
+def cmd_mask(args):
+    from cloud_masking import main as cloud_mask_main
+    cloud_mask_main(args.raw_folder, args.output_folder)
+
+
+def cmd_indices(args):
+    from ProcessingImage import main as indices_main
+    indices_main(args.raw_folder, args.output_folder)
+
+
+def cmd_normalize(args):
+    from normalize import batch_normalize_images
+    batch_normalize_images(args.processed_dir, args.normalized_dir)
+
+
+def cmd_anomaly(args):
+    from mask_Anomaly import main as anomaly_main
+    anomaly_main(args.normalized_dir, args.coarse_block, args.validate)
+
+
+def cmd_labels(args):
+    from label_data import rasterize_labels
+    rasterize_labels(args.shapefile, args.reference, args.output, args.class_column)
+
+
+def cmd_train(args):
+    from pest_Risk_LSTM import main as train_main
+    train_main(csv_path=args.csv, sample_frac=args.sample_frac, seq_length=args.seq_length,
+               batch_size=args.batch_size, epochs=args.epochs, threshold=args.threshold)
+
+
+def cmd_predict(args):
+    from evalute_model import evaluate_model
+    from future_pred import save_future_prediction
+    sample_indices, future_pred = evaluate_model(args.model, args.csv, args.sample_frac, args.seq_length,
+                                                 threshold=args.threshold)
+    grid = {}
+    if args.reference:
+        import rasterio
+        with rasterio.open(args.reference) as src:
+            grid = dict(height=src.height, width=src.width, transform=src.transform, crs=src.crs)
+    save_future_prediction(sample_indices, future_pred, args.output, show=args.show, **grid)
+
+
+def cmd_stats(args):
+    from PestRiskPercentageCalc import calculate_pest_risk_percentage
+    for path in args.risk_maps:
+        print(f"{path}: Pest Risk Percentage: {calculate_pest_risk_percentage(path):.2f}%")
+
+
+def cmd_startup(args):
+    """Time `terra.py --help` in fresh interpreters and check no heavy module was imported."""
+    import os
+    import time
+    import subprocess
+    script = os.path.abspath(__file__)
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--help'], check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    probe = (f"import sys; sys.argv = ['terra', '--help']; sys.path.insert(0, {os.path.dirname(script)!r})\n"
+             f"import terra\ntry:\n    terra.main()\nexcept SystemExit:\n    pass\n"
+             f"print('LOADED:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', probe], check=True, capture_output=True, text=True).stdout
+    loaded = output.rsplit('LOADED:', 1)[-1].strip()
+    median = sorted(timings)[len(timings) // 2]
+    print(f"[INFO] terra --help: median {median:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    ok = median <= args.budget_ms and not loaded
+    if loaded:
+        print(f"[ERROR] Heavy modules imported at startup: {loaded}")
+    if median > args.budget_ms:
+        print("[ERROR] Cold start over budget")
+    sys.exit(0 if ok else 1)
+
+
+def coarse_block(value):
+    block = int(value)
+    if block < 0 or block % ANOMALY_HALO:
+        raise argparse.ArgumentTypeError(f"must be 0 or a multiple of {ANOMALY_HALO}, got {value}")
+    return block
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='terra', description="Pest-risk pipeline tools")
+    parser.add_argument('--trace', metavar='TRACE_JSON', help='Record stage spans to a Chrome trace and print a summary')
+    parser.add_argument('--profile', action='store_true', help='Also sample Python stacks (implies --trace trace.json)')
+    sub = parser.add_subparsers(dest='command', metavar='<command>')
+
+    p = sub.add_parser('download', help='Download Sentinel-2 L2A scenes for the AOI')
+    p.add_argument('--output_dir', type=str, default='tanjavur_sentinel_downloads')
+    p.add_argument('--start', type=str, default='2023-01-01')
+    p.add_argument('--end', type=str, default='2025-09-05')
+    p.set_defaults(func=cmd_download)
+
+    p = sub.add_parser('mask', help='Cloud-mask raw scenes')
+    p.add_argument('--raw_folder', type=str, default='/Volumes/SSD/Proj_Terra/data/raw')
+    p.add_argument('--output_folder', type=str, default='/Volumes/SSD/Proj_Terra/data/cloud_masked')
+    p.set_defaults(func=cmd_mask)
+
+    p = sub.add_parser('indices', help='NDVI, EVI and NDWI GeoTIFFs per scene')
+    p.add_argument('--raw_folder', type=str, default='raw')
+    p.add_argument('--output_folder', type=str, default='index_outputs')
+    p.set_defaults(func=cmd_indices)
+
+    p = sub.add_parser('normalize', help='Normalize index images to 8-bit')
+    p.add_argument('--processed_dir', type=str, default='/Volumes/SSD/Proj_Terra/data/processed')
+    p.add_argument('--normalized_dir', type=str, default='/Volumes/SSD/Proj_Terra/data/normalized')
+    p.set_defaults(func=cmd_normalize)
+
+    p = sub.add_parser('anomaly', help='Anomaly and refined pest masks per date')
+    p.add_argument('--normalized_dir', type=str, default='/Volumes/SSD/Proj_Terra/data/normalized/')
+    p.add_argument('--coarse_block', type=coarse_block, default=64,
+                   help=f'Coarse search block in pixels: 0 (full resolution everywhere) or a multiple of {ANOMALY_HALO}')
+    p.add_argument('--validate', action='store_true', help='Compare coarse-to-fine against full resolution instead of writing masks')
+    p.set_defaults(func=cmd_anomaly)
+
+    p = sub.add_parser('labels', help='Rasterize field-boundary labels onto a reference image')
+    p.add_argument('--shapefile', type=str, default='labels/field_boundaries.shp')
+    p.add_argument('--reference', type=str, required=True, help='Raster whose grid the labels use')
+    p.add_argument('--output', type=str, required=True)
+    p.add_argument('--class_column', type=str, default='class_id')
+    p.set_defaults(func=cmd_labels)
+
+    p = sub.add_parser('train', help='Train the LSTM on the per-pixel time series')
+    p.add_argument('--csv', type=str, default='pixel_timeseries.csv')
+    p.add_argument('--sample_frac', type=float, default=0.05)
+    p.add_argument('--seq_length', type=int, default=10)
+    p.add_argument('--batch_size', type=int, default=512)
+    p.add_argument('--epochs', type=int, default=30)
+    p.add_argument('--threshold', type=float, default=0.5)
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser('predict', help='Evaluate a checkpoint and export next-date risk')
+    p.add_argument('--model', type=str, required=True, help='Keras .h5 checkpoint')
+    p.add_argument('--csv', type=str, default='pixel_timeseries.csv')
+    p.add_argument('--sample_frac', type=float, default=0.02)
+    p.add_argument('--seq_length', type=int, default=10)
+    p.add_argument('--threshold', type=float, default=0.5)
+    p.add_argument('--reference', type=str, default=None, help='Raster to take the output grid from')
+    p.add_argument('--output', type=str, default='future_pest_risk_prediction.tif')
+    p.add_argument('--show', action='store_true', help='Plot the prediction')
+    p.set_defaults(func=cmd_predict)
+
+    p = sub.add_parser('stats', help='Percentage of risk pixels in risk maps')
+    p.add_argument('risk_maps', nargs='+')
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser('startup', help='Check the cold-start budget of this CLI')
+    p.add_argument('--runs', type=int, default=5)
+    p.add_argument('--budget_ms', type=float, default=200.0)
+    p.set_defaults(func=cmd_startup)
+
+    for name, (_, help_text) in FORWARDED.items():
+        p = sub.add_parser(name, help=f"{help_text} (see 'terra {name} --help')", add_help=False)
+        p.add_argument('args', nargs=argparse.REMAINDER)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Global options go before the command; tracing.py picks them up from the environment on import
+    while argv and argv[0] in ('--trace', '--profile'):
+        if argv[0] == '--trace' and len(argv) > 1:
+            os.environ['TERRA_TRACE'] = argv[1]
+            argv = argv[2:]
+        elif argv[0] == '--profile':
+            os.environ['TERRA_PROFILE'] = '1'
+            os.environ.setdefault('TERRA_TRACE', 'trace.json')
+            argv = argv[1:]
+        else:
+            break
+    if argv and argv[0] in FORWARDED:
+        import importlib
+        module = importlib.import_module(FORWARDED[argv[0]][0])
+        sys.argv = [f"terra {argv[0]}"] + argv[1:]
+        return module.main()
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import os
+import math
+import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import rasterio
+from rasterio.windows import Window
+from rasterio.transform import from_bounds
+
+from downloading_dataset import (MAX_REQUEST_PX, bbox_coords as default_bbox, time_range as default_time_range,
+                                 download_date, search_acquisitions, make_config)
+
+# Tile edge in pixels: a multiple of the output block size, so every tile covers whole blocks
+TILE_PX = 2048
+BLOCK_PX = 512
+METERS_PER_DEGREE = 111320.0
+
+
+# ------------------- GRID -------------------
+def grid_size(bbox_coords, resolution_m=10.0):
+    """(width, height) in pixels of a WGS84 bbox at a ground resolution in metres."""
+    min_x, min_y, max_x, max_y = bbox_coords
+    mid_lat = math.radians((min_y + max_y) / 2)
+    width = (max_x - min_x) * METERS_PER_DEGREE * math.cos(mid_lat) / resolution_m
+    height = (max_y - min_y) * METERS_PER_DEGREE / resolution_m
+    return max(1, round(width)), max(1, round(height))
+
+
+def tile_grid(bbox_coords, size, tile_px=TILE_PX):
+    """
+    Split a bbox rendered at `size` (width, height) into tiles of at most
+    tile_px pixels a side. Tile bounds follow the output pixel grid exactly,
+    so the tiles stitch without resampling.
+    """
+    width, height = size
+    min_x, min_y, max_x, max_y = bbox_coords
+    dx, dy = (max_x - min_x) / width, (max_y - min_y) / height
+    tiles = []
+    for row, row_off in enumerate(range(0, height, tile_px)):
+        for col, col_off in enumerate(range(0, width, tile_px)):
+            w, h = min(tile_px, width - col_off), min(tile_px, height - row_off)
+            tiles.append({
+                'name': f"r{row:03d}_c{col:03d}",
+                'bbox': [min_x + col_off * dx, max_y - (row_off + h) * dy, min_x + (col_off + w) * dx, max_y - row_off * dy],
+                'size': (w, h),
+                'window': Window(col_off, row_off, w, h),
+            })
+    return tiles
+
+
+# ------------------- MOSAIC -------------------
+class StreamingMosaic:
+    """
+    Tiled GeoTIFF written one input tile at a time into its window; the full
+    mosaic is never held in memory. Written to <path>.part and renamed on close.
+    """
+    def __init__(self, path, size, bbox_coords, count=9, dtype='float32', crs='EPSG:4326'):
+        self.path = path
+        self.part = path + '.part'
+        width, height = size
+        self.dst = rasterio.open(
+            self.part, 'w', driver='GTiff', width=width, height=height, count=count, dtype=dtype, crs=crs,
+            transform=from_bounds(*bbox_coords, width, height),
+            tiled=True, blockxsize=BLOCK_PX, blockysize=BLOCK_PX, BIGTIFF='IF_SAFER',
+        )
+
+    def write_tile(self, tile_path, window):
+        with rasterio.open(tile_path) as src:
+            self.dst.write(src.read(), window=window)
+
+    def close(self):
+        self.dst.close()
+        os.replace(self.part, self.path)
+
+    def abort(self):
+        self.dst.close()
+        if os.path.exists(self.part):
+            os.remove(self.part)
+
+
+# ------------------- DOWNLOAD -------------------
+def fetch_tile(date_str, tile, tile_path, config, max_attempts=None, throttle=None):
+    """Download one tile unless a finished copy is already on disk (resume)."""
+    if os.path.exists(tile_path):
+        return tile_path
+    part = tile_path + '.part'
+    download_date(date_str, part, tile['bbox'], tile['size'], config, max_attempts=max_attempts, throttle=throttle)
+    os.replace(part, tile_path)
+    return tile_path
+
+
+def download_date_tiled(date_str, filename, bbox_coords, size, config, tile_px=TILE_PX, threads=4,
+                        max_attempts=None, throttle=None, keep_tiles=False):
+    """
+    Download one date as a grid of tiles (concurrently) and stitch them into
+    `filename` as they arrive. Finished tiles are kept in <filename>.tiles/
+    until the mosaic is complete, so an interrupted date resumes where it stopped.
+    """
+    tile_px = min(tile_px, MAX_REQUEST_PX)
+    tiles = tile_grid(bbox_coords, size, tile_px)
+    tile_dir = filename + '.tiles'
+    os.makedirs(tile_dir, exist_ok=True)
+    done = sum(os.path.exists(os.path.join(tile_dir, f"{t['name']}.tif")) for t in tiles)
+    print(f"[INFO] {date_str}: {len(tiles)} tiles of up to {tile_px}px for {size[0]}x{size[1]}"
+          + (f" ({done} already downloaded)" if done else ''))
+
+    mosaic = StreamingMosaic(filename, size, bbox_coords)
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = {
+                pool.submit(fetch_tile, date_str, t, os.path.join(tile_dir, f"{t['name']}.tif"), config,
+                            max_attempts, throttle): t
+                for t in tiles
+            }
+            for fut in as_completed(futures):
+                mosaic.write_tile(fut.result(), futures[fut]['window'])
+    except BaseException:
+        mosaic.abort()
+        raise
+    mosaic.close()
+    if not keep_tiles:
+        shutil.rmtree(tile_dir)
+    print(f"Downloaded and saved {filename}")
+    return filename
+
+
+def download_all_tiled(output_dir, time_range=default_time_range, bbox_coords=default_bbox, resolution_m=10.0,
+                       tile_px=TILE_PX, threads=4, prefix='tanjavur', keep_tiles=False):
+    os.makedirs(output_dir, exist_ok=True)
+    config = make_config()
+    size = grid_size(bbox_coords, resolution_m)
+    dates = search_acquisitions(bbox_coords, time_range, config)
+    print(f"Found {len(dates)} images to download at {resolution_m} m ({size[0]}x{size[1]} px).")
+
+    for idx, date_str in enumerate(dates):
+        filename = os.path.join(output_dir, f"{prefix}_{date_str}.tiff")
+        if os.path.exists(filename):
+            print(f"Skipping {filename}, already downloaded.")
+            continue
+        print(f"Requesting data for date: {date_str} ({idx + 1}/{len(dates)})")
+        download_date_tiled(date_str, filename, bbox_coords, size, config, tile_px, threads, keep_tiles=keep_tiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download large AOIs as tiles and stitch them into one GeoTIFF per date")
+    parser.add_argument('--output_dir', type=str, default='tanjavur_sentinel_downloads')
+    parser.add_argument('--bbox', type=float, nargs=4, default=default_bbox, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'))
+    parser.add_argument('--start', type=str, default=default_time_range[0])
+    parser.add_argument('--end', type=str, default=default_time_range[1])
+    parser.add_argument('--resolution', type=float, default=10.0, help='Ground resolution in metres')
+    parser.add_argument('--tile_px', type=int, default=TILE_PX, help=f'Tile edge in pixels (max {MAX_REQUEST_PX})')
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent tile requests')
+    parser.add_argument('--prefix', type=str, default='tanjavur')
+    parser.add_argument('--keep_tiles', action='store_true')
+    args = parser.parse_args()
+    download_all_tiled(args.output_dir, (args.start, args.end), args.bbox, args.resolution, args.tile_px,
+                       args.threads, args.prefix, args.keep_tiles)
+
+
+if __name__ == '__main__':
+    main()
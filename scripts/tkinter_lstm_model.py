@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from tensorflow.keras.models import load_model
 
+from raster_preview import add_overviews, downsample_for_display
+
 
 class PestRiskPredictorApp:
     def __init__(self, master):
@@ -105,7 +107,8 @@ class PestRiskPredictorApp:
             self.canvas.get_tk_widget().pack_forget()
 
         self.fig, ax = plt.subplots(figsize=(6, 6))
-        cax = ax.imshow(risk_map, cmap='Reds', interpolation='none')
+        # Widget is a few hundred pixels wide; block-max keeps isolated risk pixels visible
+        cax = ax.imshow(downsample_for_display(risk_map, 600), cmap='Reds', interpolation='none')
         ax.set_title("Predicted Pest Risk (Next Time Step)")
         plt.colorbar(cax, ax=ax, label='Risk (0=No, 1=Yes)')
         ax.axis('off')
@@ -137,6 +140,7 @@ class PestRiskPredictorApp:
         try:
             with rasterio.open(export_path, 'w', **export_meta) as dst:
                 dst.write(self.risk_map.astype('uint8'), 1)
+                add_overviews(dst, 'nearest')
             messagebox.showinfo("Success", f"Pest risk map saved to:\n{export_path}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save risk map:\n{e}")
@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+from collections import Counter, defaultdict
+
+# Off unless TERRA_TRACE=<trace.json> is set (or enable() is called). Disabled spans are a shared no-op.
+TRACE_ENV = 'TERRA_TRACE'
+PROFILE_ENV = 'TERRA_PROFILE'
+OWNER_ENV = 'TERRA_TRACE_OWNER'
+
+
+def read_io_counters():
+    """(rchar, wchar) for this process from /proc/self/io, or None where unavailable."""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+_local = threading.local()
+
+
+class Span:
+    """Timed region. Attributes given at creation or via set() end up in the trace event's args."""
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start', 'io')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def set(self, **attrs):
+        self.args.update(attrs)
+
+    def __enter__(self):
+        _local.__dict__.setdefault('stack', []).append(self)
+        self.io = read_io_counters()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        _local.stack.pop()
+        io = read_io_counters()
+        if self.io and io:
+            # Process-wide counters: concurrent threads' I/O is attributed to every open span
+            self.args['bytes_read'] = io[0] - self.io[0]
+            self.args['bytes_written'] = io[1] - self.io[1]
+        self.args['peak_rss_mb'] = peak_rss_mb()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record({
+            'name': self.name, 'cat': self.cat, 'ph': 'X',
+            'ts': (self.start - self.tracer.epoch_ns) / 1000, 'dur': (end - self.start) / 1000,
+            'pid': os.getpid(), 'tid': threading.get_ident(), 'args': self.args,
+        })
+        return False
+
+
+class SamplingProfiler:
+    """
+    Samples Python stacks every `interval` seconds into folded-stack counts.
+    Only the main thread by default, since idle pool and tqdm threads would
+    otherwise dominate the samples.
+    """
+    def __init__(self, interval=0.005, all_threads=False):
+        self.interval = interval
+        self.all_threads = all_threads
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='terra-profiler')
+
+    def _run(self):
+        own = threading.get_ident()
+        main = threading.main_thread().ident
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own or (not self.all_threads and tid != main):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Tracer:
+    """
+    Collects span events. Worker processes (ProcessPoolExecutor, fork or
+    spawn) append their events to per-pid part files next to the trace, and
+    the process that enabled tracing merges them into one Chrome trace on exit.
+    """
+    def __init__(self, path, profile=False, interval=0.005):
+        self.path = path
+        self.parts_dir = path + '.parts'
+        self.events = []
+        self.lock = threading.Lock()
+        self.epoch_ns = int(os.environ.get('TERRA_TRACE_EPOCH_NS', time.perf_counter_ns()))
+        os.environ['TERRA_TRACE_EPOCH_NS'] = str(self.epoch_ns)
+        self.owner = int(os.environ.setdefault(OWNER_ENV, str(os.getpid())))
+        self.profiler = None
+        if profile and self.is_owner:
+            self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+        if self.is_owner:
+            os.makedirs(self.parts_dir, exist_ok=True)
+            atexit.register(self.finish)
+
+    @property
+    def is_owner(self):
+        return os.getpid() == self.owner
+
+    def record(self, event):
+        if self.is_owner:
+            with self.lock:
+                self.events.append(event)
+            return
+        # Worker processes may exit without running atexit handlers, so write through
+        line = json.dumps(event, default=str) + '\n'
+        with open(os.path.join(self.parts_dir, f"{os.getpid()}.jsonl"), 'a') as f:
+            f.write(line)
+
+    def collect(self):
+        events = list(self.events)
+        if os.path.isdir(self.parts_dir):
+            for name in sorted(os.listdir(self.parts_dir)):
+                part = os.path.join(self.parts_dir, name)
+                with open(part) as f:
+                    events.extend(json.loads(line) for line in f if line.strip())
+                os.remove(part)
+            os.rmdir(self.parts_dir)
+        return events
+
+    def finish(self):
+        if not self.is_owner:
+            return
+        if self.profiler is not None:
+            self.profiler.stop()
+        events = self.collect()
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+        print(f"[INFO] Trace with {len(events)} spans saved to {self.path} (open in chrome://tracing or Perfetto)")
+        print(summary_table(events))
+        if self.profiler is not None and self.profiler.stacks:
+            folded = os.path.splitext(self.path)[0] + '.folded'
+            with open(folded, 'w') as f:
+                for stack, count in self.profiler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"[INFO] {sum(self.profiler.stacks.values())} profiler samples saved to {folded} (flamegraph.pl / speedscope)")
+            print(top_frames(self.profiler.stacks))
+
+
+def summary_table(events):
+    rows = defaultdict(lambda: {'count': 0, 'total': 0.0, 'max': 0.0, 'pixels': 0, 'read': 0, 'written': 0, 'rss': 0.0})
+    for e in events:
+        r = rows[e['name']]
+        dur = e['dur'] / 1e6
+        args = e.get('args', {})
+        r['count'] += 1
+        r['total'] += dur
+        r['max'] = max(r['max'], dur)
+        r['pixels'] += args.get('pixels', 0) or 0
+        r['read'] += args.get('bytes_read', 0) or 0
+        r['written'] += args.get('bytes_written', 0) or 0
+        r['rss'] = max(r['rss'], args.get('peak_rss_mb') or 0)
+    lines = [f"{'span':<34} {'count':>6} {'total s':>9} {'mean s':>8} {'max s':>8} {'Mpix':>8} {'read MB':>9} {'write MB':>9} {'RSS MB':>8}"]
+    for name, r in sorted(rows.items(), key=lambda kv: -kv[1]['total']):
+        lines.append(f"{name[:34]:<34} {r['count']:>6} {r['total']:>9.3f} {r['total'] / r['count']:>8.3f} {r['max']:>8.3f} "
+                     f"{r['pixels'] / 1e6:>8.2f} {r['read'] / 2 ** 20:>9.1f} {r['written'] / 2 ** 20:>9.1f} {r['rss']:>8.1f}")
+    return '\n'.join(lines)
+
+
+def top_frames(stacks, n=10):
+    """Leaf frames with the most samples (where time is actually spent)."""
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(';', 1)[-1]] += count
+    total = sum(leaves.values())
+    lines = [f"{'self %':>7}  frame"]
+    for frame, count in leaves.most_common(n):
+        lines.append(f"{count / total * 100:>6.1f}%  {frame}")
+    return '\n'.join(lines)
+
+
+_tracer = None
+
+
+def enable(path='trace.json', profile=False, interval=0.005):
+    """Turn tracing on for this process and any workers it starts afterwards."""
+    global _tracer
+    if _tracer is None:
+        os.environ[TRACE_ENV] = path
+        if profile:
+            os.environ[PROFILE_ENV] = str(interval)
+        _tracer = Tracer(path, profile, interval)
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, cat='stage', **attrs):
+    """Context manager timing a region; returns a no-op when tracing is off."""
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, cat, attrs)
+
+
+def annotate(**attrs):
+    """Attach attributes (date, pixels, ...) to the innermost open span of this thread."""
+    if _tracer is None:
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].args.update(attrs)
+
+
+def traced(name=None, cat='stage'):
+    """Decorator form of span(); the span name defaults to module.function."""
+    def decorate(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with Span(_tracer, span_name, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+if os.environ.get(TRACE_ENV):
+    _profile = os.environ.get(PROFILE_ENV)
+    enable(os.environ[TRACE_ENV], bool(_profile), float(_profile) if _profile and _profile != '1' else 0.005)
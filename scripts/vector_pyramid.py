@@ -0,0 +1,48 @@
+from pathlib import Path
+import shapely
+
+TILE_SIZE = 256
+DEFAULT_ZOOMS = [10, 12, 14, 16]
+
+
+def zoom_tolerance(z, tile_size=TILE_SIZE):
+    """Size of one Web-Mercator screen pixel at zoom z, in degrees at the equator."""
+    return 360.0 / (tile_size * 2 ** z)
+
+
+def simplify_for_zoom(gdf, z):
+    """
+    Topology-preserving simplification to half a screen pixel at zoom z, then
+    snap coordinates to a quarter-pixel grid so the stored values quantize well.
+    """
+    tol = zoom_tolerance(z)
+    out = gdf.copy()
+    geoms = shapely.simplify(out.geometry.values, tol / 2, preserve_topology=True)
+    geoms = shapely.set_precision(geoms, tol / 4)
+    out = out.set_geometry(geoms, crs=gdf.crs)
+    keep = ~(shapely.is_empty(geoms) | shapely.is_missing(geoms))
+    return out[keep]
+
+
+def write_vector_pyramid(risk_gdf, output_dir, stem, zooms=None):
+    """
+    Write risk polygons as FlatGeobuf (packed Hilbert R-tree spatial index,
+    so clients can request only the features in their viewport): one
+    full-resolution file plus one simplified file per zoom level.
+    Returns the written paths.
+    """
+    output_dir = Path(output_dir)
+    zooms = DEFAULT_ZOOMS if zooms is None else zooms
+    paths = []
+    full_fp = output_dir / f'{stem}.fgb'
+    risk_gdf.to_file(full_fp, driver='FlatGeobuf', SPATIAL_INDEX='YES')
+    paths.append(full_fp)
+    for z in zooms:
+        simplified = simplify_for_zoom(risk_gdf, z)
+        if simplified.empty:
+            continue
+        fp = output_dir / f'{stem}_z{z}.fgb'
+        simplified.to_file(fp, driver='FlatGeobuf', SPATIAL_INDEX='YES')
+        paths.append(fp)
+    print(f"[INFO] Wrote {len(paths)} FlatGeobuf levels for {stem}")
+    return paths
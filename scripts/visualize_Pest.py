@@ -39,15 +39,33 @@ def style_function(feature):
         'fillOpacity': 0.4,
     }
 
-# Load and add all GeoJSON files as separate layers with toggles
-for geojson_file in sorted(geojson_folder.glob('pest_risk_*.geojson')):
-    layer_name = geojson_file.stem.replace('pest_risk_', '')  # extract date as name
-    folium.GeoJson(
-        str(geojson_file),
-        name=f"Pest Risk {layer_name}",
-        style_function=style_function,
-        tooltip=folium.GeoJsonTooltip(fields=['raster_val'], aliases=['Risk:'])
-    ).add_to(m)
+# Tile pyramids from risk_tiles.py (served with `python risk_tiles.py serve`)
+tiles_folder = Path('risk_tiles')
+tile_server_url = 'http://127.0.0.1:8000'
+
+if tiles_folder.is_dir():
+    # Only the tiles in view are fetched, instead of embedding every polygon
+    for date_dir in sorted(d for d in tiles_folder.iterdir() if d.is_dir()):
+        # Pyramids are PNG or WebP (risk_tiles.py build --format); use whichever this one has
+        ext = 'webp' if next(date_dir.rglob('*.webp'), None) is not None else 'png'
+        folium.TileLayer(
+            tiles=f"{tile_server_url}/{date_dir.name}/{{z}}/{{x}}/{{y}}.{ext}",
+            attr='Pest risk tiles',
+            name=f"Pest Risk {date_dir.name}",
+            overlay=True,
+            control=True,
+            max_zoom=18
+        ).add_to(m)
+else:
+    # Load and add all GeoJSON files as separate layers with toggles
+    for geojson_file in sorted(geojson_folder.glob('pest_risk_*.geojson')):
+        layer_name = geojson_file.stem.replace('pest_risk_', '')  # extract date as name
+        folium.GeoJson(
+            str(geojson_file),
+            name=f"Pest Risk {layer_name}",
+            style_function=style_function,
+            tooltip=folium.GeoJsonTooltip(fields=['raster_val'], aliases=['Risk:'])
+        ).add_to(m)
 
 # Add layer control to toggle each date's pest risk polygon
 folium.LayerControl(collapsed=False).add_to(m)
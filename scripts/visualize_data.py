@@ -1,19 +1,13 @@
-import rasterio
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 
-# -----------------------------
-# Bulletproof: avoid style file issues
-# -----------------------------
-# Force default matplotlib style without reading any external style files
-matplotlib.rcParams.update(matplotlib.rcParamsDefault)
-
+from raster_preview import read_preview
 
 # -----------------------------
 # Visualization function
 # -----------------------------
-def visualize_indices_and_label(ndvi_path, evi_path, ndwi_path, label_path=None):
+def visualize_indices_and_label(ndvi_path, evi_path, ndwi_path, label_path=None, max_size=600):
     """
     Plots NDVI, EVI, NDWI rasters and optionally a label mask.
 
@@ -22,7 +16,11 @@ def visualize_indices_and_label(ndvi_path, evi_path, ndwi_path, label_path=None)
         evi_path (str): Path to EVI GeoTIFF
         ndwi_path (str): Path to NDWI GeoTIFF
         label_path (str, optional): Path to label mask GeoTIFF
+        max_size (int): Longest side of the preview read, in pixels
     """
+    # Bulletproof: force default matplotlib style without reading any external style files
+    matplotlib.rcParams.update(matplotlib.rcParamsDefault)
+
     n_plots = 4 if label_path else 3
     fig, axs = plt.subplots(1, n_plots, figsize=(6 * n_plots, 6))
 
@@ -30,10 +28,10 @@ def visualize_indices_and_label(ndvi_path, evi_path, ndwi_path, label_path=None)
     if n_plots == 1:
         axs = [axs]
 
-    # Helper to load raster and mask invalid values
+    # Helper to load a decimated preview (served from overviews) and mask invalid values
     def load_raster(path):
-        with rasterio.open(path) as src:
-            return np.ma.masked_invalid(src.read(1))
+        data, _ = read_preview(path, max_size)
+        return np.ma.masked_invalid(data)
 
     # NDVI
     ndvi = load_raster(ndvi_path)
@@ -71,9 +69,10 @@ def visualize_indices_and_label(ndvi_path, evi_path, ndwi_path, label_path=None)
 # -----------------------------
 # Example usage: update your paths
 # -----------------------------
-visualize_indices_and_label(
-    '/Volumes/SSD/Proj_Terra/data/processed/tanjavur_2023-01-05/tanjavur_2023-01-05_NDVI.tif',
-    '/Volumes/SSD/Proj_Terra/data/processed/tanjavur_2023-01-05/tanjavur_2023-01-05_EVI.tif',
-    '/Volumes/SSD/Proj_Terra/data/processed/tanjavur_2023-01-05/tanjavur_2023-01-05_NDWI.tif',
-    '/Volumes/SSD/Proj_Terra/data/normalized/tanjavur_2023-01-05/tanjavur_2023-01-05_EVI.tif'
-)
\ No newline at end of file
+if __name__ == "__main__":
+    visualize_indices_and_label(
+        '/Volumes/SSD/Proj_Terra/data/processed/tanjavur_2023-01-05/tanjavur_2023-01-05_NDVI.tif',
+        '/Volumes/SSD/Proj_Terra/data/processed/tanjavur_2023-01-05/tanjavur_2023-01-05_EVI.tif',
+        '/Volumes/SSD/Proj_Terra/data/processed/tanjavur_2023-01-05/tanjavur_2023-01-05_NDWI.tif',
+        '/Volumes/SSD/Proj_Terra/data/normalized/tanjavur_2023-01-05/tanjavur_2023-01-05_EVI.tif'
+    )
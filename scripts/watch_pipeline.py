@@ -0,0 +1,221 @@
+import os
+import re
+import csv
+import bisect
+import time
+import queue
+import argparse
+import threading
+from pathlib import Path
+import numpy as np
+import rasterio
+
+from scene_pipeline import process_scene
+from generate_Timeseries import date_from_mask_name, save_date_polygons
+from raster_preview import add_overviews
+from tracing import traced
+
+TEMP_SUFFIXES = ('.part', '.tmp', '.crdownload', '.download')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def is_candidate(file_name):
+    """Raw acquisitions only: skip hidden/AppleDouble files and in-progress downloads."""
+    if file_name.startswith('.') or file_name.endswith(TEMP_SUFFIXES):
+        return False
+    return file_name.endswith('.tif') or file_name.endswith('.tiff')
+
+
+class AcquisitionWatcher:
+    """
+    Polls a download folder and reports files once they are complete.
+
+    A file is complete when its size and mtime have not changed for
+    `settle_seconds`. Temp names (.part, .tmp, ...) are ignored, so writers
+    that rename into place never expose a partial file, but the renamed file
+    still waits out settle_seconds like any other.
+    """
+    def __init__(self, raw_dir, settle_seconds=30, seen=None):
+        self.raw_dir = raw_dir
+        self.settle_seconds = settle_seconds
+        self.pending = {}  # path -> (size, mtime_ns, first_seen_stable)
+        self.seen = set(seen or [])
+
+    def poll(self):
+        ready = []
+        now = time.monotonic()
+        current = set()
+        for entry in os.scandir(self.raw_dir):
+            if not entry.is_file() or not is_candidate(entry.name) or entry.path in self.seen:
+                continue
+            current.add(entry.path)
+            st = entry.stat()
+            prev = self.pending.get(entry.path)
+            if prev is None or prev[0] != st.st_size or prev[1] != st.st_mtime_ns:
+                self.pending[entry.path] = (st.st_size, st.st_mtime_ns, now)
+            elif st.st_size > 0 and now - prev[2] >= self.settle_seconds:
+                ready.append(entry.path)
+        for path in ready:
+            del self.pending[path]
+            self.seen.add(path)
+        # Forget files that disappeared before settling
+        for path in list(self.pending):
+            if path not in current:
+                del self.pending[path]
+        return sorted(ready)
+
+
+def date_sort_key(column):
+    """Columns order by their YYYY-MM-DD part, whatever prefix the mask name left on them."""
+    match = DATE_PATTERN.search(column)
+    return (match.group(0) if match else '', column)
+
+
+def append_pixel_timeseries(pixel_csv, mask, date):
+    """
+    Add one date column to the per-pixel time series CSV, in date order so a
+    backfilled date does not break the sequences the LSTM trains on.
+    Streams the existing file line by line instead of reloading every mask.
+    """
+    values = mask.ravel()
+    if not os.path.exists(pixel_csv):
+        with open(pixel_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['pixel_id', date])
+            writer.writerows(zip(range(values.size), values.tolist()))
+        return True
+
+    tmp_path = pixel_csv + '.tmp'
+    with open(pixel_csv) as src, open(tmp_path, 'w') as dst:
+        header = src.readline().rstrip('\n').split(',')
+        if date in header:
+            print(f"[INFO] {date} already in {pixel_csv}")
+            dst.close()
+            os.remove(tmp_path)
+            return False
+        # Position among the date columns (header[0] is pixel_id); usually the end
+        pos = 1 + bisect.bisect([date_sort_key(c) for c in header[1:]], date_sort_key(date))
+        if pos < len(header):
+            print(f"[INFO] {date} is older than the latest date, inserting it in date order")
+        header.insert(pos, date)
+        dst.write(','.join(header) + '\n')
+        for line, value in zip(src, values.tolist()):
+            line = line.rstrip('\n')
+            if pos == len(header) - 1:
+                dst.write(f"{line},{value}\n")
+            else:
+                parts = line.split(',')
+                parts.insert(pos, str(value))
+                dst.write(','.join(parts) + '\n')
+    os.replace(tmp_path, pixel_csv)
+    return True
+
+
+def append_summary_row(summary_csv, row):
+    new_file = not os.path.exists(summary_csv)
+    with open(summary_csv, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['date', 'risk_polygon_count', 'risk_area_ha'])
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+@traced('watch.forecast', cat='tensorflow')
+def predict_next_risk(model, mask_dir, seq_length, out_path):
+    """Predict next-date risk probabilities from the latest `seq_length` masks."""
+    files = sorted(Path(mask_dir).glob('refined_pest_mask_*.tif'))[-seq_length:]
+    if len(files) < seq_length:
+        print(f"[INFO] Only {len(files)} masks, need {seq_length} for a forecast")
+        return
+    arrays = []
+    for f in files:
+        with rasterio.open(f) as src:
+            arrays.append(src.read(1))
+            meta = src.meta.copy()
+    stack = np.stack(arrays, axis=0)
+    h, w = stack.shape[1:]
+    X_input = stack.reshape(seq_length, -1).T[:, :, np.newaxis].astype(np.float32)
+    pred_prob = model.predict(X_input, batch_size=4096, verbose=0).reshape(h, w)
+    meta.update(dtype=rasterio.float32, count=1, nodata=None)
+    with rasterio.open(out_path, 'w', **meta) as dst:
+        dst.write(pred_prob.astype(rasterio.float32), 1)
+        add_overviews(dst, 'average')
+    print(f"[INFO] Forecast risk map saved to {out_path}")
+
+
+@traced('watch.acquisition')
+def process_acquisition(raw_path, args, model):
+    start = time.time()
+    refined_mask, meta = process_scene(raw_path, args.output_dir, args.bbox, args.size, args.crs, args.keep)
+    name = os.path.splitext(os.path.basename(raw_path))[0]
+    mask_dir = os.path.join(args.output_dir, 'normalized', 'PestRefinedData')
+    date = date_from_mask_name(f'refined_pest_mask_{name}.tif')
+
+    vector_dir = Path(args.output_dir) / 'pest_risk_vectors'
+    vector_dir.mkdir(parents=True, exist_ok=True)
+    if append_pixel_timeseries(os.path.join(args.output_dir, 'pixel_timeseries.csv'), refined_mask, date):
+        row = save_date_polygons(refined_mask, date, meta['transform'], meta['crs'], vector_dir)
+        if row is not None:
+            append_summary_row(str(vector_dir / 'risk_summary.csv'), row)
+
+    if model is not None:
+        predict_next_risk(model, mask_dir, args.seq_length,
+                          os.path.join(args.output_dir, f'forecast_risk_{name}.tif'))
+    print(f"[INFO] {name} processed in {time.time() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the download folder and process new acquisitions incrementally")
+    parser.add_argument('--raw_dir', type=str, default='tanjavur_sentinel_downloads', help='Folder receiving raw Sentinel-2 TIFFs')
+    parser.add_argument('--output_dir', type=str, default='pipeline_outputs', help='Base folder for masks, CSVs and vectors')
+    parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617], help='Bounding box: min_lon min_lat max_lon max_lat')
+    parser.add_argument('--size', nargs=2, type=int, default=[2023, 2058], help='Image size: width height')
+    parser.add_argument('--crs', type=str, default='EPSG:4326')
+    parser.add_argument('--keep', nargs='+', default=['mask'], help='Artifacts to keep (see scene_pipeline.py)')
+    parser.add_argument('--model', type=str, default=None, help='LSTM checkpoint for forecasts (optional)')
+    parser.add_argument('--seq_length', type=int, default=10)
+    parser.add_argument('--poll_interval', type=float, default=10.0, help='Seconds between folder scans')
+    parser.add_argument('--settle_seconds', type=float, default=30.0, help='Seconds a file must stay unchanged')
+    args = parser.parse_args()
+
+    model = None
+    if args.model:
+        from tensorflow.keras.models import load_model
+        model = load_model(args.model)
+
+    # Acquisitions that already have a refined mask are not reprocessed
+    mask_dir = os.path.join(args.output_dir, 'normalized', 'PestRefinedData')
+    done = []
+    if os.path.isdir(args.raw_dir):
+        for f in os.listdir(args.raw_dir):
+            name = os.path.splitext(f)[0]
+            if os.path.exists(os.path.join(mask_dir, f'refined_pest_mask_{name}.tif')):
+                done.append(os.path.join(args.raw_dir, f))
+
+    watcher = AcquisitionWatcher(args.raw_dir, args.settle_seconds, seen=done)
+    work_queue = queue.Queue()
+
+    def worker():
+        while True:
+            raw_path = work_queue.get()
+            try:
+                process_acquisition(raw_path, args, model)
+            except Exception as e:
+                print(f"[ERROR] Failed to process {raw_path}: {e}")
+            finally:
+                work_queue.task_done()
+
+    threading.Thread(target=worker, daemon=True).start()
+    print(f"[INFO] Watching {args.raw_dir} (poll every {args.poll_interval}s)")
+    try:
+        while True:
+            for raw_path in watcher.poll():
+                print(f"[INFO] New acquisition: {raw_path}")
+                work_queue.put(raw_path)
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        print("[INFO] Stopping watcher.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window
+import geopandas as gpd
+from tqdm import tqdm
+
+from raster_preview import mask_grid, pixel_area_m2
+from tracing import traced, annotate
+
+INDEX_NAMES = ['NDVI', 'EVI', 'NDWI']
+INDEX_VERSION = 1
+
+
+def load_zones(path, id_column=None):
+    """Field polygons with a string zone_id column (from id_column, or the row number)."""
+    zones = gpd.read_file(path)
+    zones = zones[zones.geometry.notna() & ~zones.geometry.is_empty].reset_index(drop=True)
+    zones['zone_id'] = zones[id_column].astype(str) if id_column else zones.index.astype(str)
+    if zones['zone_id'].duplicated().any():
+        raise ValueError(f"Duplicate zone ids in {path}")
+    return zones
+
+
+def grid_key(transform, width, height, crs):
+    return {'transform': list(transform)[:6], 'width': width, 'height': height, 'crs': str(crs)}
+
+
+def geometry_hash(zones, grid, all_touched=False):
+    """Hash of the zone geometries, their ids and the target grid; the index cache key."""
+    h = hashlib.sha256(json.dumps({'grid': grid, 'all_touched': all_touched, 'version': INDEX_VERSION},
+                                  sort_keys=True).encode())
+    for zone_id, geom in zip(zones['zone_id'], zones.geometry):
+        h.update(zone_id.encode())
+        h.update(geom.wkb)
+    return h.hexdigest()
+
+
+class ZoneIndex:
+    """
+    Run-length pixel -> zone index for one grid. Each run is (flat start,
+    length, zone slot) inside `window`, the bounding window of all zones, so
+    per-date reads only cover the fields. Expanded once into `pixels` and
+    `labels` for bincount passes.
+    """
+    def __init__(self, zone_ids, starts, lengths, slots, window, area_ha):
+        self.zone_ids = np.asarray(zone_ids)
+        self.starts, self.lengths, self.slots = starts, lengths, slots
+        self.window = window
+        self.area_ha = area_ha
+        self.pixels = self._expand(starts, lengths)
+        self.labels = np.repeat(slots, lengths)
+        self.pixel_count = np.bincount(self.labels, minlength=len(self.zone_ids))
+
+    @staticmethod
+    def _expand(starts, lengths):
+        """Flat pixel indices of all runs, without a Python loop."""
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(0, np.int64)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.repeat(starts, lengths) + offsets
+
+    @classmethod
+    @traced('zonal.build_index')
+    def build(cls, zones, transform, width, height, crs, all_touched=False):
+        zones = zones.to_crs(crs) if crs is not None and zones.crs is not None else zones
+        labels = rasterize(((geom, slot + 1) for slot, geom in enumerate(zones.geometry)),
+                           out_shape=(height, width), transform=transform, fill=0, dtype='int32',
+                           all_touched=all_touched)
+        rows, cols = np.nonzero(labels)
+        if rows.size == 0:
+            raise ValueError("No zone overlaps the raster grid")
+        window = Window(int(cols.min()), int(rows.min()), int(cols.max() - cols.min() + 1),
+                        int(rows.max() - rows.min() + 1))
+        sub = labels[window.row_off:window.row_off + window.height, window.col_off:window.col_off + window.width]
+
+        # Run-length encode along rows: a run starts wherever the label changes
+        flat = sub.ravel()
+        change = np.ones(flat.size, dtype=bool)
+        change[1:] = flat[1:] != flat[:-1]
+        change[::window.width] = True
+        starts = np.flatnonzero(change)
+        lengths = np.diff(np.append(starts, flat.size))
+        keep = flat[starts] > 0
+        starts, lengths, slots = starts[keep], lengths[keep], flat[starts[keep]] - 1
+
+        row_area = pixel_area_m2(transform, height, crs)[window.row_off:window.row_off + window.height]
+        run_area = row_area[starts // window.width] * lengths
+        area_ha = np.bincount(slots, weights=run_area, minlength=len(zones)) / 1e4
+        missing = int((area_ha == 0).sum())
+        if missing:
+            print(f"[WARN] {missing} zone(s) cover no pixel centre of the grid")
+        annotate(zones=len(zones), runs=int(starts.size))
+        return cls(zones['zone_id'].to_numpy(), starts.astype(np.int64), lengths.astype(np.int64),
+                   slots.astype(np.int32), window, area_ha)
+
+    def save(self, path):
+        np.savez_compressed(path, zone_ids=self.zone_ids.astype(str), starts=self.starts, lengths=self.lengths,
+                            slots=self.slots, area_ha=self.area_ha,
+                            window=np.array([self.window.col_off, self.window.row_off, self.window.width, self.window.height]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls(z['zone_ids'], z['starts'], z['lengths'], z['slots'], Window(*(int(v) for v in z['window'])),
+                       z['area_ha'])
+
+    def zone_sums(self, values):
+        """Per-zone sum of a 2-D array read over self.window."""
+        return np.bincount(self.labels, weights=values.ravel()[self.pixels], minlength=len(self.zone_ids))
+
+    def zone_means(self, values):
+        """Per-zone mean of the finite values (NaN for zones with none)."""
+        v = values.ravel()[self.pixels].astype(np.float64)
+        finite = np.isfinite(v)
+        sums = np.bincount(self.labels, weights=np.where(finite, v, 0.0), minlength=len(self.zone_ids))
+        counts = np.bincount(self.labels, weights=finite, minlength=len(self.zone_ids))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts
+
+
+def get_zone_index(zones, transform, width, height, crs, cache_dir='zone_index_cache', all_touched=False):
+    """ZoneIndex for the grid, from cache_dir when the geometries and grid are unchanged."""
+    key = geometry_hash(zones, grid_key(transform, width, height, crs), all_touched)
+    path = os.path.join(cache_dir, f"zone_index_{key[:16]}.npz")
+    if os.path.exists(path):
+        print(f"[CACHE] zone index {os.path.basename(path)}")
+        return ZoneIndex.load(path)
+    index = ZoneIndex.build(zones, transform, width, height, crs, all_touched)
+    os.makedirs(cache_dir, exist_ok=True)
+    index.save(path)
+    print(f"[INFO] Zone index with {index.starts.size} runs for {len(index.zone_ids)} zones saved to {path}")
+    return index
+
+
+def mask_date_name(mask_path):
+    """'refined_pest_mask_tanjavur_2024-01-05.tif' -> 'tanjavur_2024-01-05' (the index_outputs folder name)."""
+    return Path(mask_path).stem.replace('refined_pest_mask_', '', 1)
+
+
+@traced('zonal.date')
+def date_stats(index, mask_path, index_dir=None):
+    """All per-zone statistics of one date: one windowed read and a few bincounts per raster."""
+    name = mask_date_name(mask_path)
+    with rasterio.open(mask_path) as src:
+        risk = src.read(1, window=index.window)
+    stats = {
+        'zone_id': index.zone_ids,
+        'date': name,
+        'pixels': index.pixel_count,
+        'hectares': index.area_ha,
+    }
+    risk_pixels = index.zone_sums(risk == 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['risk_pct'] = risk_pixels / index.pixel_count * 100
+        stats['risk_ha'] = risk_pixels / index.pixel_count * index.area_ha
+    for idx in INDEX_NAMES:
+        path = os.path.join(index_dir, name, f"{name}_{idx}.tif") if index_dir else None
+        if path and os.path.exists(path):
+            with rasterio.open(path) as src:
+                stats[f'{idx.lower()}_mean'] = index.zone_means(src.read(1, window=index.window))
+        else:
+            stats[f'{idx.lower()}_mean'] = np.full(len(index.zone_ids), np.nan)
+    annotate(date=name, zones=len(index.zone_ids))
+    return pd.DataFrame(stats)
+
+
+def zonal_timeseries(zones_path, mask_dir, output, index_dir=None, id_column=None, cache_dir='zone_index_cache',
+                     all_touched=False, bbox=None):
+    """Per-zone, per-date risk %, risk hectares and mean indices as a long table (CSV or parquet)."""
+    files = sorted(Path(mask_dir).glob('refined_pest_mask_*.tif'))
+    if not files:
+        raise FileNotFoundError(f"No mask files found in {mask_dir}")
+    zones = load_zones(zones_path, id_column)
+    grid = mask_grid(files[0], bbox)
+    index = get_zone_index(zones, *grid, cache_dir=cache_dir, all_touched=all_touched)
+
+    frames = []
+    for f in tqdm(files, desc="Zonal statistics"):
+        if mask_grid(f, bbox)[:3] != grid[:3]:
+            print(f"[WARN] {f.name} is on a different grid, skipping")
+            continue
+        frames.append(date_stats(index, f, index_dir))
+    table = pd.concat(frames, ignore_index=True)
+    if output.endswith('.parquet'):
+        table.to_parquet(output, index=False)
+    else:
+        table.to_csv(output, index=False)
+    print(f"[INFO] Zonal statistics for {len(index.zone_ids)} zones x {len(frames)} dates saved to {output}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-field risk and index statistics for every mask date")
+    parser.add_argument('--zones', type=str, default='labels/field_boundaries.shp', help='Field polygons (any OGR format)')
+    parser.add_argument('--id_column', type=str, default=None, help='Zone id column (default: row number)')
+    parser.add_argument('--mask_dir', type=str, default='normalized/PestRefinedData')
+    parser.add_argument('--index_dir', type=str, default=None, help='index_outputs folder for mean NDVI/EVI/NDWI')
+    parser.add_argument('--output', type=str, default='zonal_stats.csv', help='.csv or .parquet')
+    parser.add_argument('--cache_dir', type=str, default='zone_index_cache')
+    parser.add_argument('--all_touched', action='store_true', help='Count every pixel a field touches')
+    parser.add_argument('--bbox', nargs=4, type=float, default=[79, 10.57, 79.047, 10.617],
+                        help='Grid bounds for masks without georeferencing: min_lon min_lat max_lon max_lat')
+    args = parser.parse_args()
+    zonal_timeseries(args.zones, args.mask_dir, args.output, args.index_dir, args.id_column, args.cache_dir,
+                     args.all_touched, args.bbox)
+
+
+if __name__ == '__main__':
+    main()